@@ -4,8 +4,8 @@ from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from supabase import create_client, Client
 from app.auth import AuthorizedUser
+from app.db import AICoachMessageRepository
 from app.demo_data import get_demo_dataset, is_demo_mode
 
 # Import get_current_user_id if you have it defined in an accessible auth utility
@@ -30,7 +30,7 @@ class AICoachMessageResponse(BaseModel):
 
 
 @router.get("/", response_model=List[AICoachMessageResponse])
-def get_ai_coach_messages(
+async def get_ai_coach_messages(
     unread_only: bool = False,
     user: AuthorizedUser = None,
 ) -> List[AICoachMessageResponse]:
@@ -43,21 +43,9 @@ def get_ai_coach_messages(
             messages = [m for m in messages if not m.get("read_at")]
         return [AICoachMessageResponse(**record) for record in messages]
 
-    supabase_url = os.environ.get("SUPABASE_URL")
-    supabase_key = os.environ.get("SUPABASE_ANON_KEY")
-
-    if not supabase_url or not supabase_key:
-        raise HTTPException(status_code=500, detail="Supabase configuration missing")
-
-    client: Client = create_client(supabase_url, supabase_key)
-
     try:
-        query = client.table("ai_coach_messages").select("*").eq("user_id", user.sub)
-        if unread_only:
-            query = query.is_("read_at", None)
-        response = query.order("created_at").execute()
+        records = await AICoachMessageRepository.for_token().list_for_user(user.sub, unread_only)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Error fetching messages: {exc}") from exc
 
-    records = response.data or []
     return [AICoachMessageResponse(**record) for record in records]
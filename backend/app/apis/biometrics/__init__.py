@@ -1,11 +1,24 @@
-"""Biometrics endpoints (placeholder)."""
+"""Biometrics endpoints."""
 
-from datetime import datetime, timezone
-from fastapi import APIRouter
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel, Field
 
+from app.auth import User, get_current_user_data
+from app.baselines import get_biometric_baselines
+from app.db import EPOCH, get_time_series_store
+
 router = APIRouter(prefix="/biometrics", tags=["Biometrics"])
 
+# Most buckets a series request may ask for
+MAX_SERIES_BUCKETS = 10_000
+
+_BUCKET = re.compile(r"^(\d{1,4})([mhd])$")
+_BUCKET_UNITS_MS = {"m": 60_000, "h": 3_600_000, "d": 86_400_000}
+
 
 class BiometricsSnapshot(BaseModel):
     captured_at: datetime = Field(..., description="Snapshot timestamp")
@@ -13,19 +26,105 @@ class BiometricsSnapshot(BaseModel):
     source: str = "mock"
 
 
+class BiometricsSeries(BaseModel):
+    sample_type: str
+    aggregation: str
+    bucket: str
+    bucket_ms: int
+    start: datetime
+    end: datetime
+    # Parallel arrays, one entry per bucket holding samples; empty buckets are left out
+    timestamps: list[int] = Field(..., description="Bucket starts, epoch milliseconds")
+    values: list[float]
+    counts: list[int]
+
+
+def _epoch_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def _bucket_ms(bucket: str) -> int:
+    match = _BUCKET.match(bucket)
+    if match is None or int(match.group(1)) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bucket must be a count and a unit: m, h or d (e.g. 15m, 1h, 1d)",
+        )
+    return int(match.group(1)) * _BUCKET_UNITS_MS[match.group(2)]
+
+
+def _snapshot(user_id: str) -> Optional[BiometricsSnapshot]:
+    snapshot = get_biometric_baselines().snapshot(user_id)
+    if snapshot is None:
+        return None
+    return BiometricsSnapshot(
+        captured_at=datetime.fromtimestamp(snapshot.captured_at / 1000, tz=timezone.utc),
+        metrics=snapshot.metrics,
+        source="healthkit",
+    )
+
+
 @router.get("/summary", response_model=list[BiometricsSnapshot])
-def biometrics_summary() -> list[BiometricsSnapshot]:
-    """Return biometrics snapshots (empty if none loaded)."""
-    return []
+def biometrics_summary(current_user: User = Depends(get_current_user_data)) -> list[BiometricsSnapshot]:
+    """Latest HRV and resting HR with their 7-day and 28-day baselines and
+    the readiness score (empty until such samples are synced)."""
+    snapshot = _snapshot(current_user.sub)
+    return [snapshot] if snapshot is not None else []
+
+
+@router.get("/series", response_model=BiometricsSeries)
+def biometrics_series(
+    sample_type: str = Query(..., description="HealthKit type, e.g. HKQuantityTypeIdentifierHeartRate"),
+    start: Optional[datetime] = Query(None, description="Inclusive; defaults to 7 days before end"),
+    end: Optional[datetime] = Query(None, description="Exclusive; defaults to now"),
+    bucket: str = Query("1d", description="Bucket width: a count and m, h or d"),
+    aggregation: Literal["mean", "min", "max", "sum", "p50", "p95"] = "mean",
+    utc_offset: int = Query(0, ge=-840, le=840, description="Minutes east of UTC that buckets align to"),
+    current_user: User = Depends(get_current_user_data),
+) -> BiometricsSeries:
+    """Synced quantity samples of one type aggregated per bucket.
+
+    Buckets are computed over the local time series, so a long range costs
+    one array slice and a few vectorized passes instead of the raw samples.
+    """
+    end = end or datetime.now(tz=timezone.utc)
+    start = start or end - timedelta(days=7)
+    start_ms, end_ms = _epoch_ms(start), _epoch_ms(end)
+    bucket_ms = _bucket_ms(bucket)
+    if start_ms >= end_ms:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end")
+    if (end_ms - start_ms) // bucket_ms > MAX_SERIES_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range holds more than {MAX_SERIES_BUCKETS} buckets, use a wider bucket",
+        )
+
+    try:
+        samples = get_time_series_store().query(current_user.sub, sample_type, start_ms, end_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e)) from e
+    buckets = samples.resample(bucket_ms, aggregation, origin=-utc_offset * 60_000)
+
+    return BiometricsSeries(
+        sample_type=sample_type,
+        aggregation=aggregation,
+        bucket=bucket,
+        bucket_ms=bucket_ms,
+        start=start,
+        end=end,
+        timestamps=buckets.starts.tolist(),
+        values=buckets.values.tolist(),
+        counts=buckets.counts.tolist(),
+    )
 
 
 @router.get("/status")
-def biometrics_status() -> dict:
-    """Basic health check for biometrics endpoints."""
+def biometrics_status(current_user: User = Depends(get_current_user_data)) -> dict:
+    """Basic health check for biometrics endpoints, with the caller's latest snapshot."""
+    snapshot = _snapshot(current_user.sub)
     return {
         "status": "ok",
-        "sample": BiometricsSnapshot(
-            captured_at=datetime.now(tz=timezone.utc),
-            metrics={"hrv": 52.0, "resting_hr": 61.0},
-        ).model_dump(),
+        "sample": snapshot.model_dump() if snapshot is not None else None,
     }
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request
 from pydantic import BaseModel
+from typing import Optional
+import functools
 import os
 #import databutton as db
 import os
-from supabase import create_client, Client
+from postgrest.exceptions import APIError
+
+from app.db import ChatMessageRepository
+from app.idempotency import idempotent_response
 
 try:
     import openai
@@ -28,22 +33,20 @@ class ChatResponse(BaseModel):
     ai_message: ChatMessage
 
 
-def get_supabase_client() -> Client:
-    url = os.environ.get("SUPABASE_URL")
-    key = os.environ.get("SUPABASE_ANON_KEY")
-    if not url or not key:
-        raise HTTPException(status_code=500, detail="Supabase configuration missing")
-    return create_client(url, key)
+@functools.cache
+def get_openai_client(api_key: str):
+    # One async client (and connection pool) per key
+    return openai.AsyncOpenAI(api_key=api_key)
 
 
-def generate_ai_reply(prompt: str) -> str:
+async def generate_ai_reply(prompt: str) -> str:
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key or openai is None:
         # Fallback message if OpenAI isn't configured
         return "Lo siento, el servicio de IA no está disponible en este momento."
     try:
-        client = openai.OpenAI(api_key=api_key)
-        completion = client.chat.completions.create(
+        client = get_openai_client(api_key)
+        completion = await client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[{"role": "system", "content": "Eres un coach personal"}, {"role": "user", "content": prompt}],
         )
@@ -54,26 +57,27 @@ def generate_ai_reply(prompt: str) -> str:
 
 
 @router.post("/", response_model=ChatResponse)
-async def chat_endpoint(payload: ChatRequest):
-    sb = get_supabase_client()
-
-    user_insert = (
-        sb.table("chat_messages")
-        .insert({"user_id": payload.user_id, "sender": "user", "text_content": payload.message})
-        .execute()
-    )
-    if user_insert.error:
-        raise HTTPException(status_code=500, detail="Error saving user message")
-    user_msg = user_insert.data[0]
-
-    ai_text = generate_ai_reply(payload.message)
-    ai_insert = (
-        sb.table("chat_messages")
-        .insert({"user_id": payload.user_id, "sender": "ai", "text_content": ai_text})
-        .execute()
-    )
-    if ai_insert.error:
-        raise HTTPException(status_code=500, detail="Error saving AI message")
-    ai_msg = ai_insert.data[0]
-
-    return {"user_message": user_msg, "ai_message": ai_msg}
+async def chat_endpoint(
+    payload: ChatRequest,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    # A retried key replays the first reply instead of a second completion
+    return await idempotent_response(request, f"chat:{payload.user_id}", idempotency_key, lambda: _chat(payload))
+
+
+async def _chat(payload: ChatRequest) -> ChatResponse:
+    messages = ChatMessageRepository.for_token()
+
+    try:
+        user_msg = await messages.add(payload.user_id, "user", payload.message)
+    except APIError as e:
+        raise HTTPException(status_code=500, detail="Error saving user message") from e
+
+    ai_text = await generate_ai_reply(payload.message)
+    try:
+        ai_msg = await messages.add(payload.user_id, "ai", ai_text)
+    except APIError as e:
+        raise HTTPException(status_code=500, detail="Error saving AI message") from e
+
+    return ChatResponse(user_message=user_msg, ai_message=ai_msg)
@@ -1,44 +1,55 @@
 # Standard library imports
+import asyncio
+import functools
+import json
 import logging
 import os
-from typing import List, Optional, Dict, Any
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Iterable, List, Optional, Dict, Any, Set, Tuple
 
 # Third-party imports
-from fastapi import APIRouter, Depends, HTTPException, Header, Request, status
-from pydantic import BaseModel, Field, HttpUrl
-from supabase import create_client, Client
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, HttpUrl, TypeAdapter, ValidationError
+from typing_extensions import Annotated, TypedDict
+from app.auth import User, bearer_token, get_current_user_data
+from app.baselines import get_biometric_baselines
+from app.db import (
+    EPOCH,
+    HealthKitRepository,
+    SeenSampleIndex,
+    get_seen_sample_index,
+)
 from app.demo_data import DemoDataset, get_demo_dataset, is_demo_mode
+from app.idempotency import idempotent_response
+from app.ingestion import IngestionJob, IngestionJobTooLarge, IngestionQueueFull, get_ingestion_queue
 
-# Attempt to import Supabase/GoTrue specific error
-try:
-    from gotrue.errors import GoTrueApiError
-    logging.getLogger(__name__).debug("Successfully imported GoTrueApiError.")
-except ImportError:
-    GoTrueApiError = None  # Fallback if not found
-    logging.getLogger(__name__).debug(
-        "Could not import GoTrueApiError directly, using generic Exception for Supabase API errors."
-    )
 
 logger = logging.getLogger(__name__)
 
 
-# --- Pydantic Models ---
-class DeviceInfo(BaseModel):
-    name: Optional[str] = None
-    manufacturer: Optional[str] = None
-    model: Optional[str] = None
-    hardware_version: Optional[str] = Field(None, alias="hardwareVersion")
-    software_version: Optional[str] = Field(None, alias="softwareVersion")
-    os_version: Optional[str] = Field(None, alias="osVersion") # Added based on common use
-
-class BaseSample(BaseModel):
-    external_uuid: str = Field(..., alias="externalUuid")
-    sample_type: str = Field(..., alias="sampleType")
-    start_date: str = Field(..., alias="startDate") # ISO 8601 datetime string
-    end_date: str = Field(..., alias="endDate") # ISO 8601 datetime string
-    source_bundle_identifier: Optional[str] = Field(None, alias="sourceBundleIdentifier")
-    device_info: Optional[DeviceInfo] = Field(None, alias="deviceInfo")
-    metadata: Optional[Dict[str, Any]] = None
+# --- Sample Schemas ---
+# Samples are TypedDicts rather than models: validating a request with them
+# yields the health_kit_* rows directly (fields keep the camelCase names the
+# tables use) with no model instances to build and dump per sample
+class DeviceInfo(TypedDict):
+    name: Annotated[Optional[str], Field(None)]
+    manufacturer: Annotated[Optional[str], Field(None)]
+    model: Annotated[Optional[str], Field(None)]
+    hardwareVersion: Annotated[Optional[str], Field(None)]
+    softwareVersion: Annotated[Optional[str], Field(None)]
+    osVersion: Annotated[Optional[str], Field(None)] # Added based on common use
+
+class BaseSample(TypedDict):
+    externalUuid: str
+    sampleType: str
+    startDate: str # ISO 8601 datetime string
+    endDate: str # ISO 8601 datetime string
+    sourceBundleIdentifier: Annotated[Optional[str], Field(None)]
+    deviceInfo: Annotated[Optional[DeviceInfo], Field(None)]
+    metadata: Annotated[Optional[Dict[str, Any]], Field(None)]
 
 class QuantitySample(BaseSample):
     value: float
@@ -48,130 +59,418 @@ class CategorySample(BaseSample):
     value: int # Typically an enum-like integer in HealthKit
     # unit for category samples is often implicit or not applicable, but can be added if needed
 
-class WorkoutEvent(BaseModel):
+class WorkoutEvent(TypedDict):
     type: int # Workout event type (e.g., pause, resume)
     date: str # ISO 8601 datetime string
-    duration: Optional[float] = None # Seconds, if applicable
+    duration: Annotated[Optional[float], Field(None)] # Seconds, if applicable
 
 class Workout(BaseSample):
-    activity_type: str = Field(..., alias="activityType")
+    activityType: str
     duration: float # Seconds
-    total_energy_burned: Optional[float] = Field(None, alias="totalEnergyBurned") # Kilocalories
-    total_distance: Optional[float] = Field(None, alias="totalDistance") # Meters
-    events: Optional[List[WorkoutEvent]] = None
+    totalEnergyBurned: Annotated[Optional[float], Field(None)] # Kilocalories
+    totalDistance: Annotated[Optional[float], Field(None)] # Meters
+    events: Annotated[Optional[List[WorkoutEvent]], Field(None)]
 
-class HealthKitSyncRequest(BaseModel):
-    quantity_samples: Optional[List[QuantitySample]] = Field(None, alias="quantitySamples")
-    category_samples: Optional[List[CategorySample]] = Field(None, alias="categorySamples")
-    workouts: Optional[List[Workout]] = None
+class HealthKitSyncRequest(TypedDict):
+    quantitySamples: Annotated[Optional[List[QuantitySample]], Field(None)]
+    categorySamples: Annotated[Optional[List[CategorySample]], Field(None)]
+    workouts: Annotated[Optional[List[Workout]], Field(None)]
+
+class SyncChunkError(BaseModel):
+    kind: str # quantity, category or workout
+    offset: int # Index of the chunk's first record among the kind's records left after duplicates
+    count: int
+    error: str
 
 class SyncResponse(BaseModel):
     message: str
     quantity_samples_imported: int = 0
     category_samples_imported: int = 0
     workouts_imported: int = 0
+    errors: List[SyncChunkError] = Field(default_factory=list)
+    duplicates_skipped: int = 0 # Repeated in the payload or already stored
+    anchors: Dict[str, str] = Field(default_factory=dict) # sampleType -> latest endDate stored (UTC ISO 8601)
 
-# --- FastAPI Authentication Dependency ---
-async def get_current_user_data(request: Request, authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
-    logger.debug("get_current_user_data invoked")
-    logger.debug("Attempting to get Supabase client")
-    if is_demo_mode():
-        logger.info("Demo mode active; returning mock user for health data")
-        return {
-            "id": "demo-user-1",
-            "email": "demo.user@nexus.pulse",
-            "name": "Demo User",
-        }
-
-    supabase_url = os.environ.get("SUPABASE_URL")
-    supabase_anon_key = os.environ.get("SUPABASE_ANON_KEY")
-
-    if not supabase_url or not supabase_anon_key:
-        logger.error("Supabase URL or Anon Key is missing from secrets")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Supabase configuration missing",
-        )
-    logger.debug("Supabase client URL configured")
+class SyncAnchorsResponse(BaseModel):
+    anchors: Dict[str, str] = Field(default_factory=dict)
+
+class SyncJobAccepted(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+    duplicates_skipped: int = 0
+
+class SyncJobTableCounts(BaseModel):
+    received: int = 0
+    imported: int = 0
+
+class SyncJobStatus(BaseModel):
+    job_id: str
+    status: str # queued, running, completed or completed_with_errors
+    progress: float # Share of chunks written or failed, 0 to 1
+    chunks_total: int
+    chunks_done: int
+    tables: Dict[str, SyncJobTableCounts] # Keyed by kind: quantity, category, workout
+    duplicates_skipped: int = 0
+    errors: List[SyncChunkError] = Field(default_factory=list)
+    anchors: Dict[str, str] = Field(default_factory=dict) # Set once the job completes
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+class NDJSONLineError(BaseModel):
+    line: int # 1-based line number in the upload
+    error: str
+
+class StreamSyncResponse(SyncResponse):
+    lines_received: int = 0
+    invalid_lines: int = 0
+    line_errors: List[NDJSONLineError] = Field(default_factory=list) # The first MAX_REPORTED_LINE_ERRORS only
+
+# Validator for each "kind" of sample, e.g. of an NDJSON sync line
+SAMPLE_ADAPTERS = {
+    "quantity": TypeAdapter(QuantitySample),
+    "category": TypeAdapter(CategorySample),
+    "workout": TypeAdapter(Workout),
+}
+
+# Field of a /sync request holding each kind
+SYNC_REQUEST_FIELDS = {
+    "quantity": "quantitySamples",
+    "category": "categorySamples",
+    "workout": "workouts",
+}
+
+# --- Sync Settings ---
+def _sync_chunk_size() -> int:
+    """Records per upsert request (HEALTHKIT_SYNC_CHUNK_SIZE)"""
+    return max(1, int(os.environ.get("HEALTHKIT_SYNC_CHUNK_SIZE") or 500))
+
+def _sync_concurrency() -> int:
+    """Upsert requests in flight per sync (HEALTHKIT_SYNC_CONCURRENCY)"""
+    return max(1, int(os.environ.get("HEALTHKIT_SYNC_CONCURRENCY") or 4))
 
+def _sync_mode() -> str:
+    """Default mode of /sync when the request gives none (HEALTHKIT_SYNC_MODE)"""
+    return (os.environ.get("HEALTHKIT_SYNC_MODE") or "sync").lower()
+
+def _queue_full_status() -> int:
+    """429 or 503 when the ingestion queue is full (HEALTHKIT_QUEUE_FULL_STATUS)"""
+    return 429 if os.environ.get("HEALTHKIT_QUEUE_FULL_STATUS") == "429" else 503
+
+def _queue_retry_after() -> int:
+    """Retry-After seconds sent with a full queue (HEALTHKIT_QUEUE_RETRY_AFTER)"""
+    return int(os.environ.get("HEALTHKIT_QUEUE_RETRY_AFTER") or 5)
+
+def _stream_max_line_bytes() -> int:
+    """Longest accepted NDJSON line (HEALTHKIT_STREAM_MAX_LINE_BYTES)"""
+    return max(1, int(os.environ.get("HEALTHKIT_STREAM_MAX_LINE_BYTES") or 64 * 1024))
+
+MAX_REPORTED_LINE_ERRORS = 100
+
+# deviceInfo key -> key in the device_info column
+DEVICE_INFO_COLUMNS = {
+    "name": "name",
+    "manufacturer": "manufacturer",
+    "model": "model",
+    "hardwareVersion": "hardware_version",
+    "softwareVersion": "software_version",
+    "osVersion": "os_version",
+}
+
+def _sample_record(sample: BaseSample, user_id: str) -> Dict[str, Any]:
+    """Complete a validated sample into the row for its health_kit_* table, in place"""
+    record: Dict[str, Any] = sample
+    record['user_id'] = user_id
+    device_info = sample['deviceInfo']
+    record['device_info'] = (
+        {column: device_info[key] for key, column in DEVICE_INFO_COLUMNS.items()} if device_info is not None else None
+    )
+    return record
+
+# --- NDJSON Streaming ---
+async def _ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines, holding at most one partial line"""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", start)) >= 0:
+            if end - start > max_line_bytes:
+                raise _line_too_long(max_line_bytes)
+            yield bytes(buffer[start:end])
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            raise _line_too_long(max_line_bytes)
+    if buffer:
+        yield bytes(buffer)
+
+def _line_too_long(max_line_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"NDJSON line longer than {max_line_bytes} bytes",
+    )
+
+def _parse_sample_line(line: bytes) -> Tuple[str, BaseSample]:
+    """Validate one NDJSON line: a sample object with a "kind" field"""
+    data = json.loads(line)
+    if not isinstance(data, dict):
+        raise ValueError("Line is not a JSON object")
+    kind = data.pop("kind", None)
+    adapter = SAMPLE_ADAPTERS.get(kind)
+    if adapter is None:
+        raise ValueError(f"Unknown kind {kind!r}, expected one of {', '.join(SAMPLE_ADAPTERS)}")
+    return kind, adapter.validate_python(data)
+
+# --- Sync Watermarks ---
+def _parse_anchor(value: Optional[str]) -> Optional[datetime]:
+    """ISO 8601 to an aware UTC datetime; naive values are taken as UTC"""
     try:
-        logger.debug("Initializing Supabase client")
-        supabase: Client = create_client(supabase_url, supabase_anon_key)
-        logger.debug("Supabase client initialized")
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+class _AnchorTracker:
+    """Latest ``endDate`` stored per ``sampleType`` during one sync"""
+
+    def __init__(self):
+        self.latest: Dict[str, datetime] = {}
+
+    def observe(self, sample: BaseSample):
+        end_date = _parse_anchor(sample['endDate'])
+        if end_date is None:
+            return
+        current = self.latest.get(sample['sampleType'])
+        if current is None or end_date > current:
+            self.latest[sample['sampleType']] = end_date
+
+    def advance(self, stored: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """Merge into the stored anchors; returns (all anchors, the ones that moved)"""
+        anchors = dict(stored)
+        moved = {}
+        for sample_type, end_date in self.latest.items():
+            current = _parse_anchor(stored.get(sample_type))
+            if current is None or end_date > current:
+                anchors[sample_type] = moved[sample_type] = end_date.isoformat()
+        return anchors, moved
+
+async def _load_anchors(repository: HealthKitRepository, user_id: str) -> Optional[Dict[str, str]]:
+    """Stored anchors, or None if they could not be read"""
+    try:
+        return await repository.get_anchors(user_id)
     except Exception as e:
-        logger.error("Error initializing Supabase client: %s", e)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error initializing Supabase client: {e}",
-        ) from e
-
-    if not authorization:
-        logger.warning("Authorization header missing from request")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Authorization header missing",
-        )
-    logger.debug("Authorization header received")
-
-    scheme, _, token_value = authorization.partition(" ")
-    if scheme.lower() != "bearer" or not token_value:
-        logger.warning("Invalid authorization scheme or token missing. Scheme: %s", scheme)
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authorization scheme or token missing",
-        )
-    logger.debug("Bearer token received")
+        logger.warning("Could not load sync anchors for user %s: %s", user_id, e)
+        return None
 
+async def _advance_anchors(
+    repository: HealthKitRepository,
+    user_id: str,
+    stored: Optional[Dict[str, str]],
+    tracker: _AnchorTracker,
+) -> Dict[str, str]:
+    """Save the anchors this sync moved forward and return the user's anchors"""
+    if stored is None:
+        # Without the stored values a save could move an anchor backwards
+        return tracker.advance({})[0]
+    anchors, moved = tracker.advance(stored)
     try:
-        logger.debug("Attempting to get user with provided token")
-        user_response = supabase.auth.get_user(jwt=token_value)
-        logger.debug("Supabase get_user response received")
-        
-        if user_response and user_response.user:
-            logger.debug("User successfully authenticated: %s", user_response.user.id)
-            return user_response.user.model_dump() # FastAPI will convert this to dict
-        else:
-            logger.warning("User not found or invalid token based on Supabase response")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED, detail="No access for you. (User not found/invalid token)"
-            )
-    except GoTrueApiError as e_gotrue: # Specific catch for GoTrueApiError if it was imported
-        error_message = str(e_gotrue)
-        if hasattr(e_gotrue, 'message') and e_gotrue.message: 
-            error_message = e_gotrue.message
-        status_code_from_error = e_gotrue.status if hasattr(e_gotrue, 'status') else 401
-        logger.error(
-            "GoTrueApiError: Status %s - Message: %s",
-            status_code_from_error,
-            error_message,
-        )
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, 
-            detail=f"No access for you. (Auth Error: {error_message})"
-        ) from e_gotrue
-    except Exception as e_generic: # Generic catch for other errors
-        logger.exception(
-            "Unexpected error during token validation: %s - %s",
-            type(e_generic).__name__,
-            e_generic,
-        )
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, 
-            detail=f"No access for you. (Unexpected Error: {type(e_generic).__name__})"
-        ) from e_generic
+        await repository.save_anchors(user_id, moved)
+    except Exception as e:
+        logger.warning("Could not save sync anchors for user %s: %s", user_id, e)
+    return anchors
+
+# --- Time Series ---
+def _record_series(user_id: str, records: Iterable[Dict[str, Any]]):
+    """Add stored quantity samples to the local time series, keyed by
+    startDate, and to the biometric baselines"""
+    by_type: Dict[str, Tuple[List[int], List[float]]] = {}
+    for record in records:
+        start_date = _parse_anchor(record['startDate'])
+        if start_date is None:
+            continue
+        timestamps, values = by_type.setdefault(record['sampleType'], ([], []))
+        timestamps.append((start_date - EPOCH) // timedelta(milliseconds=1))
+        values.append(record['value'])
+    baselines = get_biometric_baselines()
+    for sample_type, (timestamps, values) in by_type.items():
+        try:
+            baselines.record(user_id, sample_type, timestamps, values)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            # The series are a read model; the sync itself succeeded
+            logger.warning("Could not add %s samples to the series of user %s: %s", sample_type, user_id, e)
+
+async def _write_batch(
+    repository: HealthKitRepository,
+    user_id: str,
+    kind: str,
+    batch: List[Tuple[int, Dict[str, Any]]],
+    seen_index: SeenSampleIndex,
+    tracker: _AnchorTracker,
+) -> int:
+    """Upsert a batch of (digest, record); once stored its samples count as
+    seen, advance the anchors and, for quantity samples, feed the time series"""
+    written = await repository.upsert(kind, [record for _, record in batch])
+    seen_index.add(user_id, [digest for digest, _ in batch])
+    if kind == "quantity":
+        # Off the event loop: the baselines fold into a SQLite file
+        await run_in_threadpool(_record_series, user_id, [record for _, record in batch])
+    for _, record in batch:
+        tracker.observe(record)
+    return written
+
+class _SyncBatchWriter:
+    """Buffers records per table and writes full batches in the background
+
+    At most ``concurrency`` batches are in flight; ``add`` waits for a slot
+    when a batch is full, which stops reading the upload until one finishes.
+    Memory is bounded by one open batch per table plus the batches in flight.
+    Samples already stored, or already queued in this upload, are dropped.
+    """
+
+    def __init__(
+        self,
+        repository: HealthKitRepository,
+        user_id: str,
+        chunk_size: int,
+        concurrency: int,
+        seen_index: SeenSampleIndex,
+        tracker: _AnchorTracker,
+    ):
+        self.repository = repository
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.seen_index = seen_index
+        self.tracker = tracker
+        self.pending: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {kind: [] for kind in SAMPLE_ADAPTERS}
+        self.offsets = {kind: 0 for kind in SAMPLE_ADAPTERS}
+        self.imported_counts = {kind: 0 for kind in SAMPLE_ADAPTERS}
+        self.duplicates_skipped = 0
+        self.errors: List[SyncChunkError] = []
+        self._queued: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def add(self, kind: str, sample: BaseSample):
+        digest = self.seen_index.digest(sample['externalUuid'])
+        if digest in self._queued or self.seen_index.contains(self.user_id, digest):
+            self.duplicates_skipped += 1
+            return
+        self._queued.add(digest)
+        batch = self.pending[kind]
+        batch.append((digest, _sample_record(sample, self.user_id)))
+        if len(batch) >= self.chunk_size:
+            await self._flush(kind)
+
+    async def close(self):
+        """Write the remaining partial batches and wait for every write"""
+        for kind in self.pending:
+            await self._flush(kind)
+        await self.wait()
+
+    async def wait(self):
+        """Wait for the batches already in flight"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def _flush(self, kind: str):
+        batch = self.pending[kind]
+        if not batch:
+            return
+        self.pending[kind] = []
+        offset = self.offsets[kind]
+        self.offsets[kind] += len(batch)
+        await self.semaphore.acquire()
+        task = asyncio.create_task(self._write(kind, offset, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, kind: str, offset: int, batch: List[Tuple[int, Dict[str, Any]]]):
+        try:
+            written = await _write_batch(self.repository, self.user_id, kind, batch, self.seen_index, self.tracker)
+            self.imported_counts[kind] += written
+        except Exception as e:
+            logger.error("Error upserting %s batch at offset %d (%d records): %s", kind, offset, len(batch), e)
+            self.errors.append(SyncChunkError(kind=kind, offset=offset, count=len(batch), error=str(e)))
+        finally:
+            self._queued.difference_update(digest for digest, _ in batch)
+            self.semaphore.release()
+
+def _enqueue_sync(
+    repository: HealthKitRepository,
+    user_id: str,
+    records_by_kind: Dict[str, List[Tuple[int, Dict[str, Any]]]],
+    duplicates_skipped: int,
+    seen_index: SeenSampleIndex,
+) -> IngestionJob:
+    """Queue the chunks of a sync as a background job; raises IngestionQueueFull"""
+    tracker = _AnchorTracker()
+    chunk_size = _sync_chunk_size()
+    chunks = []
+    for kind, kept in records_by_kind.items():
+        for offset in range(0, len(kept), chunk_size):
+            batch = kept[offset:offset + chunk_size]
+            write = functools.partial(_write_batch, repository, user_id, kind, batch, seen_index, tracker)
+            chunks.append((kind, offset, len(batch), write))
+
+    job = IngestionJob(
+        user_id,
+        {kind: len(records_by_kind.get(kind, ())) for kind in SAMPLE_ADAPTERS},
+        duplicates_skipped=duplicates_skipped,
+        anchors={},
+    )
+
+    async def save_anchors(job: IngestionJob):
+        stored = await _load_anchors(repository, user_id)
+        job.details["anchors"] = await _advance_anchors(repository, user_id, stored, tracker)
+
+    job.on_complete = save_anchors
+    return get_ingestion_queue().submit(job, chunks)
 
 # --- Router Setup ---
 router = APIRouter(prefix="/api/v1/healthkit", tags=["HealthKit"])
 
 # --- API Endpoint --- 
-@router.post("/sync", response_model=SyncResponse) # Path prefix is in router
+@router.post(
+    "/sync",
+    response_model=SyncResponse,
+    responses={
+        status.HTTP_202_ACCEPTED: {"model": SyncJobAccepted},
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {"description": "Sync larger than the whole queue"},
+        status.HTTP_429_TOO_MANY_REQUESTS: {"description": "Sync queue full"},
+        status.HTTP_503_SERVICE_UNAVAILABLE: {"description": "Sync queue full"},
+    },
+) # Path prefix is in router
 async def sync_health_kit_data(
     request_data: HealthKitSyncRequest,
-    current_user: Dict[str, Any] = Depends(get_current_user_data) # Use the original name
+    request: Request,
+    current_user: User = Depends(get_current_user_data), # Use the original name
+    authorization: Optional[str] = Header(None),
+    mode: Optional[str] = Query(None, pattern="^(sync|async)$"), # async: queue the writes, 202 with a job id
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"), # Retries replay the first response
+):
+    return await idempotent_response(
+        request,
+        f"healthkit-sync:{current_user.sub}",
+        idempotency_key,
+        lambda: _sync_health_kit_data(request_data, request, current_user, authorization, mode),
+        # A retry after failed chunks must write them, not replay the failure
+        replayable=lambda result: not (isinstance(result, SyncResponse) and result.errors),
+    )
+
+
+async def _sync_health_kit_data(
+    request_data: HealthKitSyncRequest,
+    request: Request,
+    current_user: User,
+    authorization: Optional[str],
+    mode: Optional[str],
 ):
     if is_demo_mode():
         logger.info("Demo mode active; returning mock sync response")
-        dataset: DemoDataset = get_demo_dataset().for_user(current_user.get("id"))
+        dataset: DemoDataset = get_demo_dataset().for_user(current_user.sub)
         return SyncResponse(
             message="Demo data accepted",
             quantity_samples_imported=len(dataset.health_metrics),
@@ -179,109 +478,239 @@ async def sync_health_kit_data(
             workouts_imported=0,
         )
 
-    user_id = current_user.get("id")
+    user_id = current_user.sub
     if not user_id:
         logger.error("User ID not found in token after auth dependency")
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User ID not available")
 
     logger.info("Starting HealthKit data sync for user_id: %s", user_id)
 
-    supabase_url_db = os.environ.get("SUPABASE_URL")
-    supabase_key_db = os.environ.get("SUPABASE_ANON_KEY") 
-    if not supabase_url_db or not supabase_key_db:
-        logger.error("Supabase config missing for DB operations")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Supabase config missing for DB operations")
-    
-    supabase_client_db: Client = create_client(supabase_url_db, supabase_key_db)
-    logger.debug("Supabase client for DB operations initialized")
-
-    imported_counts = {
-        "quantity": 0,
-        "category": 0,
-        "workout": 0
-    }
-
-    # Upsert Quantity Samples
-    if request_data.quantity_samples:
-        quantity_data_to_upsert = []
-        for sample in request_data.quantity_samples:
-            record = sample.model_dump(by_alias=True)
-            record['user_id'] = user_id
-            record['device_info'] = sample.device_info.model_dump() if sample.device_info else None
-            quantity_data_to_upsert.append(record)
-        
-        if quantity_data_to_upsert:
-            try:
-                logger.debug(
-                    "Upserting %d quantity samples for user %s",
-                    len(quantity_data_to_upsert),
-                    user_id,
-                )
-                res = supabase_client_db.table("health_kit_quantity_samples").upsert(quantity_data_to_upsert, on_conflict="external_uuid").execute()
-                logger.debug(
-                    "Quantity upsert response: %s",
-                    res.data[:1] if res.data else "No data returned",
-                )
-                if res.data:
-                    imported_counts["quantity"] = len(res.data)
-            except Exception as e:
-                logger.error("Error upserting quantity samples: %s", e)
-    
-    # Upsert Category Samples
-    if request_data.category_samples:
-        category_data_to_upsert = []
-        for sample in request_data.category_samples:
-            record = sample.model_dump(by_alias=True)
-            record['user_id'] = user_id
-            record['device_info'] = sample.device_info.model_dump() if sample.device_info else None
-            category_data_to_upsert.append(record)
-        
-        if category_data_to_upsert:
-            try:
-                logger.debug(
-                    "Upserting %d category samples for user %s",
-                    len(category_data_to_upsert),
-                    user_id,
-                )
-                res = supabase_client_db.table("health_kit_category_samples").upsert(category_data_to_upsert, on_conflict="external_uuid").execute()
-                if res.data:
-                    imported_counts["category"] = len(res.data)
-            except Exception as e:
-                logger.error("Error upserting category samples: %s", e)
-
-    # Upsert Workouts
-    if request_data.workouts:
-        workout_data_to_upsert = []
-        for workout in request_data.workouts:
-            record = workout.model_dump(by_alias=True)
-            record['user_id'] = user_id
-            record['device_info'] = workout.device_info.model_dump() if workout.device_info else None
-            # Convert WorkoutEvent list to dict if present
-            if record.get('events') and isinstance(record['events'], list):
-                record['events'] = [event.model_dump() for event in record['events']]
-            workout_data_to_upsert.append(record)
-        
-        if workout_data_to_upsert:
-            try:
-                logger.debug(
-                    "Upserting %d workouts for user %s",
-                    len(workout_data_to_upsert),
-                    user_id,
-                )
-                res = supabase_client_db.table("health_kit_workouts").upsert(workout_data_to_upsert, on_conflict="external_uuid").execute()
-                if res.data:
-                    imported_counts["workout"] = len(res.data)
-            except Exception as e:
-                logger.error("Error upserting workouts: %s", e)
+    # Async repository over the shared pool, authenticated as the caller so
+    # row level security applies
+    repository = HealthKitRepository.for_token(bearer_token(authorization))
+    logger.debug("HealthKit repository initialized")
+
+    # Drop samples repeated in the payload or already stored for this user
+    seen_index = get_seen_sample_index()
+    duplicates_skipped = 0
+    payload_digests: Set[int] = set()
+    records_by_kind: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    for kind, field in SYNC_REQUEST_FIELDS.items():
+        kept = []
+        for sample in request_data[field] or ():
+            digest = seen_index.digest(sample['externalUuid'])
+            if digest in payload_digests or seen_index.contains(user_id, digest):
+                duplicates_skipped += 1
+                continue
+            payload_digests.add(digest)
+            kept.append((digest, _sample_record(sample, user_id)))
+        if kept:
+            records_by_kind[kind] = kept
+
+    if (mode or _sync_mode()) == "async":
+        try:
+            job = _enqueue_sync(repository, user_id, records_by_kind, duplicates_skipped, seen_index)
+        except IngestionJobTooLarge as e:
+            logger.warning("Rejecting sync for user %s: %s", user_id, e)
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Sync is {e.chunks} chunks but the queue holds at most {e.capacity}; "
+                "split it into smaller syncs or use mode=sync",
+            )
+        except IngestionQueueFull as e:
+            logger.warning("Rejecting sync for user %s: %s", user_id, e)
+            raise HTTPException(
+                status_code=_queue_full_status(),
+                detail="Sync queue is full, retry later",
+                headers={"Retry-After": str(_queue_retry_after())},
+            )
+        status_url = request.url_for("get_sync_job", job_id=job.id).path
+        logger.info("Queued sync job %s for user %s (%d chunks)", job.id, user_id, job.chunks_total)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=SyncJobAccepted(
+                job_id=job.id, status=job.status, status_url=status_url, duplicates_skipped=duplicates_skipped
+            ).model_dump(),
+            headers={"Location": status_url},
+        )
+
+    # Write the three tables concurrently, each split into chunks; one
+    # semaphore bounds the chunk requests in flight for the whole sync
+    chunk_size = _sync_chunk_size()
+    semaphore = asyncio.Semaphore(_sync_concurrency())
+    for kind, kept in records_by_kind.items():
+        logger.debug("Upserting %d %s records for user %s", len(kept), kind, user_id)
+    stored_anchors, *results = await asyncio.gather(
+        _load_anchors(repository, user_id),
+        *(
+            repository.upsert_chunked(
+                kind,
+                [record for _, record in kept],
+                chunk_size=chunk_size,
+                semaphore=semaphore,
+            )
+            for kind, kept in records_by_kind.items()
+        ),
+    )
+
+    imported_counts = {"quantity": 0, "category": 0, "workout": 0}
+    errors: List[SyncChunkError] = []
+    tracker = _AnchorTracker()
+    for (kind, kept), result in zip(records_by_kind.items(), results):
+        imported_counts[kind] = result.written
+        failed = set()
+        for failure in result.failures:
+            errors.append(
+                SyncChunkError(kind=kind, offset=failure.offset, count=failure.count, error=failure.error)
+            )
+            failed.update(range(failure.offset, failure.offset + failure.count))
+        stored = [(digest, record) for index, (digest, record) in enumerate(kept) if index not in failed]
+        seen_index.add(user_id, [digest for digest, _ in stored])
+        if kind == "quantity":
+            await run_in_threadpool(_record_series, user_id, [record for _, record in stored])
+        for _, record in stored:
+            tracker.observe(record)
+    anchors = await _advance_anchors(repository, user_id, stored_anchors, tracker)
 
     logger.info(
-        "Sync completed for user %s. Imported counts: %s",
+        "Sync completed for user %s. Imported counts: %s, duplicates skipped: %d, failed chunks: %d",
         user_id,
         imported_counts,
+        duplicates_skipped,
+        len(errors),
     )
     return SyncResponse(
-        message="HealthKit data sync completed.",
+        message="HealthKit data sync completed with errors." if errors else "HealthKit data sync completed.",
         quantity_samples_imported=imported_counts["quantity"],
         category_samples_imported=imported_counts["category"],
-        workouts_imported=imported_counts["workout"]
+        workouts_imported=imported_counts["workout"],
+        errors=errors,
+        duplicates_skipped=duplicates_skipped,
+        anchors=anchors,
+    )
+
+
+@router.get("/sync/jobs/{job_id}", response_model=SyncJobStatus)
+async def get_sync_job(job_id: str, current_user: User = Depends(get_current_user_data)):
+    """Progress and per-table counts of a sync queued with ``mode=async``"""
+    job = get_ingestion_queue().get_job(job_id)
+    if job is None or job.user_id != current_user.sub:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sync job not found")
+    return SyncJobStatus(
+        job_id=job.id,
+        status=job.status,
+        progress=job.progress,
+        chunks_total=job.chunks_total,
+        chunks_done=job.chunks_done,
+        tables={
+            kind: SyncJobTableCounts(received=received, imported=job.imported[kind])
+            for kind, received in job.received.items()
+        },
+        duplicates_skipped=job.details.get("duplicates_skipped", 0),
+        errors=[SyncChunkError(**error) for error in job.errors],
+        anchors=job.details.get("anchors", {}),
+        created_at=datetime.fromtimestamp(job.created_at, timezone.utc),
+        finished_at=datetime.fromtimestamp(job.finished_at, timezone.utc) if job.finished_at else None,
+    )
+
+
+@router.get("/sync/anchors", response_model=SyncAnchorsResponse)
+async def get_sync_anchors(
+    current_user: User = Depends(get_current_user_data),
+    authorization: Optional[str] = Header(None),
+):
+    """Latest ``endDate`` stored per ``sampleType``; clients send only newer samples"""
+    if is_demo_mode():
+        return SyncAnchorsResponse()
+
+    repository = HealthKitRepository.for_token(bearer_token(authorization))
+    anchors = await _load_anchors(repository, current_user.sub)
+    if anchors is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Sync anchors unavailable")
+    return SyncAnchorsResponse(anchors=anchors)
+
+
+@router.post("/sync/stream", response_model=StreamSyncResponse)
+async def stream_health_kit_data(
+    request: Request,
+    current_user: User = Depends(get_current_user_data),
+    authorization: Optional[str] = Header(None),
+):
+    """Sync samples sent as NDJSON, one sample per line
+
+    Each line is a sample object as in ``/sync`` plus ``"kind"`` (quantity,
+    category or workout). Lines are validated as they arrive and written in
+    fixed-size batches while the upload is still streaming, so memory does
+    not grow with the upload. Invalid lines are skipped and reported.
+    """
+    if is_demo_mode():
+        logger.info("Demo mode active; returning mock stream sync response")
+        dataset: DemoDataset = get_demo_dataset().for_user(current_user.sub)
+        return StreamSyncResponse(
+            message="Demo data accepted",
+            quantity_samples_imported=len(dataset.health_metrics),
+        )
+
+    user_id = current_user.sub
+    if not user_id:
+        logger.error("User ID not found in token after auth dependency")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User ID not available")
+
+    logger.info("Starting HealthKit stream sync for user_id: %s", user_id)
+
+    repository = HealthKitRepository.for_token(bearer_token(authorization))
+    stored_anchors_task = asyncio.create_task(_load_anchors(repository, user_id))
+    tracker = _AnchorTracker()
+    writer = _SyncBatchWriter(
+        repository, user_id, _sync_chunk_size(), _sync_concurrency(), get_seen_sample_index(), tracker
+    )
+    lines_received = 0
+    invalid_lines = 0
+    line_errors: List[NDJSONLineError] = []
+
+    try:
+        line_number = 0
+        async for line in _ndjson_lines(request.stream(), _stream_max_line_bytes()):
+            line_number += 1
+            if not line.strip():
+                continue
+            lines_received += 1
+            try:
+                kind, sample = _parse_sample_line(line)
+            except (ValueError, ValidationError) as e:
+                invalid_lines += 1
+                if len(line_errors) < MAX_REPORTED_LINE_ERRORS:
+                    line_errors.append(NDJSONLineError(line=line_number, error=str(e)))
+                continue
+            await writer.add(kind, sample)
+        await writer.close()
+    except BaseException:
+        # Let the batches already sent finish before the error propagates
+        await writer.wait()
+        stored_anchors_task.cancel()
+        raise
+    anchors = await _advance_anchors(repository, user_id, await stored_anchors_task, tracker)
+
+    logger.info(
+        "Stream sync completed for user %s. Lines: %d, invalid: %d, imported counts: %s, "
+        "duplicates skipped: %d, failed batches: %d",
+        user_id,
+        lines_received,
+        invalid_lines,
+        writer.imported_counts,
+        writer.duplicates_skipped,
+        len(writer.errors),
+    )
+    has_errors = bool(writer.errors or invalid_lines)
+    return StreamSyncResponse(
+        message="HealthKit data sync completed with errors." if has_errors else "HealthKit data sync completed.",
+        quantity_samples_imported=writer.imported_counts["quantity"],
+        category_samples_imported=writer.imported_counts["category"],
+        workouts_imported=writer.imported_counts["workout"],
+        errors=sorted(writer.errors, key=lambda error: (error.kind, error.offset)),
+        duplicates_skipped=writer.duplicates_skipped,
+        anchors=anchors,
+        lines_received=lines_received,
+        invalid_lines=invalid_lines,
+        line_errors=line_errors,
     )
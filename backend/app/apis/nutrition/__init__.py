@@ -1,8 +1,19 @@
-"""Nutrition endpoints (placeholder)."""
+"""Nutrition endpoints."""
 
-from datetime import date
-from fastapi import APIRouter
-from pydantic import BaseModel
+import logging
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, Query, Request
+from pydantic import BaseModel, Field
+
+from app.auth import User, bearer_token, get_current_user_data
+from app.db import DailyTotals, NutritionLogRepository, NutritionRollupStore, get_nutrition_rollups
+from app.db.nutrition_rollups import TOTAL_COLUMNS
+from app.idempotency import idempotent_response
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/nutrition", tags=["Nutrition"])
 
@@ -16,10 +27,97 @@ class NutritionSummary(BaseModel):
     source: str = "mock"
 
 
+class MealLog(BaseModel):
+    day: date
+    type: Literal["breakfast", "lunch", "dinner", "snack"]
+    name: str = Field(..., min_length=1, max_length=200)
+    calories: int = Field(..., ge=0)
+    protein: float = Field(0, ge=0)
+    carbs: float = Field(0, ge=0)
+    fat: float = Field(0, ge=0)
+    time: Optional[str] = Field(None, pattern=r"^([01]\d|2[0-3]):[0-5]\d$", description="Local time, HH:MM")
+
+
+def _summary(totals: DailyTotals) -> NutritionSummary:
+    return NutritionSummary(
+        day=totals.day,
+        total_calories=totals.calories,
+        total_protein=totals.protein,
+        total_carbs=totals.carbs,
+        total_fat=totals.fat,
+        source="rollup",
+    )
+
+
+async def _rebuild_user(store: NutritionRollupStore, user_id: str, authorization: Optional[str]):
+    """Recount the user's daily totals from their nutrition_logs rows"""
+    repository = NutritionLogRepository.for_token(bearer_token(authorization))
+    pages = repository.pages(columns=",".join(("user_id", "date") + TOTAL_COLUMNS), user_id=user_id)
+    await store.rebuild(pages, user_id=user_id)
+
+
 @router.get("/summary", response_model=list[NutritionSummary])
-def nutrition_summary() -> list[NutritionSummary]:
-    """Return daily nutrition summaries (empty if none loaded)."""
-    return []
+async def nutrition_summary(
+    days: int = Query(7, ge=1, le=366, description="Days to return, ending with end"),
+    end: Optional[date] = Query(None, description="Last day, inclusive; defaults to today (UTC)"),
+    current_user: User = Depends(get_current_user_data),
+    authorization: Optional[str] = Header(None),
+) -> list[NutritionSummary]:
+    """Daily nutrition totals of the caller's logged days in the range, oldest first.
+
+    Served from the daily rollups, so the cost depends on the days asked
+    for, not on the meals behind them. A caller whose totals are not
+    current is recounted from their log history first.
+    """
+    end = end or datetime.now(tz=timezone.utc).date()
+    store = get_nutrition_rollups()
+    if not store.is_current(current_user.sub):
+        await _rebuild_user(store, current_user.sub, authorization)
+    totals = store.range(current_user.sub, end - timedelta(days=days - 1), end)
+    return [_summary(day) for day in totals]
+
+
+@router.post("/meals", response_model=NutritionSummary)
+async def log_meal(
+    meal: MealLog,
+    request: Request,
+    current_user: User = Depends(get_current_user_data),
+    authorization: Optional[str] = Header(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),  # Retries replay the first response
+) -> NutritionSummary:
+    """Log a meal and return the updated totals of its day."""
+    return await idempotent_response(
+        request,
+        f"nutrition-meal:{current_user.sub}",
+        idempotency_key,
+        lambda: _log_meal(meal, current_user, authorization),
+    )
+
+
+async def _log_meal(meal: MealLog, current_user: User, authorization: Optional[str]) -> NutritionSummary:
+    # One nutrition_logs row per meal, shaped like the seeded daily rows so
+    # a rebuild sums both the same way
+    await NutritionLogRepository.for_token(bearer_token(authorization)).add({
+        "user_id": current_user.sub,
+        "date": meal.day.isoformat(),
+        "total_calories": meal.calories,
+        "total_protein": meal.protein,
+        "total_carbs": meal.carbs,
+        "total_fat": meal.fat,
+        "meals": [{"type": meal.type, "name": meal.name, "calories": meal.calories, "time": meal.time}],
+    })
+    store = get_nutrition_rollups()
+    try:
+        totals = store.add(current_user.sub, meal.day, meal.calories, meal.protein, meal.carbs, meal.fat)
+    except sqlite3.Error as e:
+        # The meal is logged; its day is recounted from nutrition_logs below or on the next read
+        logger.error("Could not add a meal to the nutrition totals of user %s: %s", current_user.sub, e)
+        store.invalidate(current_user.sub)
+        totals = None
+    if totals is None or not store.is_current(current_user.sub):
+        await _rebuild_user(store, current_user.sub, authorization)
+        totals = store.range(current_user.sub, meal.day, meal.day)[0]
+    return _summary(totals)
 
 
 @router.get("/status")
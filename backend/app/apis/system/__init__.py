@@ -0,0 +1,33 @@
+"""Runtime statistics for operators (authenticated)."""
+
+from fastapi import APIRouter, Request
+
+from app.middleware import get_input_sanitizer, get_rate_limiter
+
+router = APIRouter(prefix="/system", tags=["System"])
+
+
+@router.get("/stats")
+def system_stats(request: Request) -> dict:
+    """Return connection pool utilization of the shared Supabase clients,
+    the HealthKit ingestion queue depth, the HealthKit time series, the
+    biometric baselines, the nutrition rollups, the idempotency key store,
+    and the rate limiter and input sanitizer counters (per-pattern matches)."""
+    supabase_registry = getattr(request.app.state, "supabase", None)
+    ingestion_queue = getattr(request.app.state, "ingestion_queue", None)
+    time_series_store = getattr(request.app.state, "time_series", None)
+    biometric_baselines = getattr(request.app.state, "biometric_baselines", None)
+    nutrition_rollups = getattr(request.app.state, "nutrition_rollups", None)
+    idempotency_store = getattr(request.app.state, "idempotency", None)
+    rate_limiter = get_rate_limiter()
+    input_sanitizer = get_input_sanitizer()
+    return {
+        "supabase_pool": supabase_registry.get_stats() if supabase_registry else None,
+        "ingestion_queue": ingestion_queue.get_stats() if ingestion_queue else None,
+        "time_series": time_series_store.get_stats() if time_series_store else None,
+        "biometric_baselines": biometric_baselines.get_stats() if biometric_baselines else None,
+        "nutrition_rollups": nutrition_rollups.get_stats() if nutrition_rollups else None,
+        "idempotency": idempotency_store.get_stats() if idempotency_store else None,
+        "rate_limiter": rate_limiter.get_stats() if rate_limiter else None,
+        "input_sanitizer": input_sanitizer.get_stats() if input_sanitizer else None,
+    }
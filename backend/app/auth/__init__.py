@@ -1,3 +1,4 @@
+from .current_user import bearer_token, get_current_user_data
 from .user import AuthorizedUser, User
 
-__all__ = ["AuthorizedUser", "User"]
+__all__ = ["AuthorizedUser", "User", "bearer_token", "get_current_user_data"]
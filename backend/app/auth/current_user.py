@@ -0,0 +1,145 @@
+"""FastAPI dependency for the routes that act on a Supabase user's data.
+
+``get_current_user_data`` authenticates the ``Authorization: Bearer`` token
+with Supabase Auth, or in-process with ``SUPABASE_AUTH_MODE=local`` (see
+``app/auth/supabase.py``). The routers pass the same token on to PostgREST,
+see ``bearer_token``, so row level security applies to their queries.
+"""
+
+import logging
+from typing import Optional
+
+import jwt
+from fastapi import Header, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from supabase import Client
+
+from app.auth.supabase import get_supabase_jwt_verifier, user_from_claims
+from app.db import get_supabase_registry
+from app.demo_data import is_demo_mode
+from app.middleware.auth_mw import User
+
+# Attempt to import Supabase/GoTrue specific error
+try:
+    from gotrue.errors import GoTrueApiError
+    logging.getLogger(__name__).debug("Successfully imported GoTrueApiError.")
+except ImportError:
+    GoTrueApiError = None  # Fallback if not found
+    logging.getLogger(__name__).debug(
+        "Could not import GoTrueApiError directly, using generic Exception for Supabase API errors."
+    )
+
+logger = logging.getLogger(__name__)
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    scheme, _, token_value = (authorization or "").partition(" ")
+    return token_value if scheme.lower() == "bearer" and token_value else None
+
+
+def _get_remote_user(token_value: str) -> User:
+    """Validate the token with Supabase Auth (GoTrue), one network round trip"""
+    supabase: Client = get_supabase_registry().client()
+
+    try:
+        logger.debug("Attempting to get user with provided token")
+        user_response = supabase.auth.get_user(jwt=token_value)
+        logger.debug("Supabase get_user response received")
+        
+        if user_response and user_response.user:
+            logger.debug("User successfully authenticated: %s", user_response.user.id)
+            remote_user = user_response.user
+            return user_from_claims({
+                "sub": remote_user.id,
+                "email": remote_user.email,
+                "user_metadata": remote_user.user_metadata,
+            })
+        else:
+            logger.warning("User not found or invalid token based on Supabase response")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="No access for you. (User not found/invalid token)"
+            )
+    except HTTPException:
+        raise
+    except GoTrueApiError as e_gotrue: # Specific catch for GoTrueApiError if it was imported
+        error_message = str(e_gotrue)
+        if hasattr(e_gotrue, 'message') and e_gotrue.message: 
+            error_message = e_gotrue.message
+        status_code_from_error = e_gotrue.status if hasattr(e_gotrue, 'status') else 401
+        logger.error(
+            "GoTrueApiError: Status %s - Message: %s",
+            status_code_from_error,
+            error_message,
+        )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail=f"No access for you. (Auth Error: {error_message})"
+        ) from e_gotrue
+    except Exception as e_generic: # Generic catch for other errors
+        logger.exception(
+            "Unexpected error during token validation: %s - %s",
+            type(e_generic).__name__,
+            e_generic,
+        )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, 
+            detail=f"No access for you. (Unexpected Error: {type(e_generic).__name__})"
+        ) from e_generic
+
+
+async def get_current_user_data(request: Request, authorization: Optional[str] = Header(None)) -> User:
+    logger.debug("get_current_user_data invoked")
+    if is_demo_mode():
+        logger.info("Demo mode active; returning mock user for health data")
+        return User(
+            sub="demo-user-1",
+            user_id="demo-user-1",
+            email="demo.user@nexus.pulse",
+            name="Demo User",
+        )
+
+    if not authorization:
+        logger.warning("Authorization header missing from request")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authorization header missing",
+        )
+    logger.debug("Authorization header received")
+
+    token_value = bearer_token(authorization)
+    if not token_value:
+        logger.warning("Invalid authorization scheme or token missing. Scheme: %s", authorization.partition(" ")[0])
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authorization scheme or token missing",
+        )
+    logger.debug("Bearer token received")
+
+    # SUPABASE_AUTH_MODE=local: verify the JWT in-process, see app/auth/supabase.py
+    verifier = get_supabase_jwt_verifier()
+    if verifier is None:
+        return await run_in_threadpool(_get_remote_user, token_value)
+
+    try:
+        user = await run_in_threadpool(verifier.verify, token_value)
+    except jwt.PyJWTError as e:
+        logger.warning("Local Supabase token verification failed: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="No access for you. (Invalid token)",
+        ) from e
+
+    if verifier.should_revalidate():
+        try:
+            remote_user = await run_in_threadpool(_get_remote_user, token_value)
+        except HTTPException:
+            verifier.forget(token_value)
+            raise
+        if remote_user.sub != user.sub:
+            verifier.forget(token_value)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="No access for you. (Token subject mismatch)",
+            )
+    return user
+
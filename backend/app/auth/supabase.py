@@ -0,0 +1,120 @@
+"""Local verification of Supabase access tokens.
+
+With ``SUPABASE_AUTH_MODE=local`` the HealthKit routes verify Supabase JWTs
+in-process instead of calling ``supabase.auth.get_user`` on every request:
+
+- ``SUPABASE_JWT_SECRET`` set: HS256 with the project's JWT secret
+- otherwise: the project's JWKS (``<SUPABASE_URL>/auth/v1/.well-known/jwks.json``)
+
+Verified identities are cached until shortly before the token expires.
+``SUPABASE_AUTH_REVALIDATE_RATE`` (0 to 1) is the share of requests that
+still confirm the token with Supabase Auth, e.g. to catch revoked sessions.
+"""
+
+import functools
+import logging
+import os
+import random
+from typing import Any
+
+import jwt
+
+from app.middleware.auth_mw import User, VerifiedTokenCache
+from app.middleware.jwks import get_jwks_manager
+
+logger = logging.getLogger(__name__)
+
+# Asymmetric algorithms Supabase signs access tokens with
+_JWKS_ALGORITHMS = ("RS256", "ES256")
+
+
+def user_from_claims(claims: dict[str, Any]) -> User:
+    """Build the shared user model from Supabase token claims or a GoTrue user"""
+    metadata = claims.get("user_metadata") or {}
+    return User(
+        sub=claims["sub"],
+        user_id=claims["sub"],
+        name=metadata.get("full_name") or metadata.get("name"),
+        picture=metadata.get("avatar_url") or metadata.get("picture"),
+        email=claims.get("email"),
+    )
+
+
+class SupabaseJWTVerifier:
+    """Verify Supabase access tokens with the JWT secret or the project JWKS"""
+
+    def __init__(
+        self,
+        secret: str | None = None,
+        jwks_url: str | None = None,
+        audience: str = "authenticated",
+        revalidate_rate: float = 0.0,
+        cache_size: int = 4096,
+    ):
+        if not secret and not jwks_url:
+            raise ValueError("SupabaseJWTVerifier needs a JWT secret or a JWKS url")
+        self.secret = secret
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.revalidate_rate = revalidate_rate
+        self.cache = VerifiedTokenCache(maxsize=cache_size)
+
+    def cache_key(self, token: str) -> bytes:
+        return VerifiedTokenCache.cache_key(token, self.audience, self.jwks_url or "HS256")
+
+    def verify(self, token: str) -> User:
+        """Return the token's user; raises ``jwt.PyJWTError`` if it is invalid"""
+        cache_key = self.cache_key(token)
+        user = self.cache.get(cache_key)
+        if user is not None:
+            return user
+
+        if self.secret:
+            key, algorithms = self.secret, ["HS256"]
+        else:
+            signing_key = get_jwks_manager(self.jwks_url).get_signing_key_from_jwt(token)
+            if signing_key.algorithm_name not in _JWKS_ALGORITHMS:
+                raise jwt.InvalidAlgorithmError(f"Unsupported signing algorithm: {signing_key.algorithm_name}")
+            key, algorithms = signing_key.key, [signing_key.algorithm_name]
+
+        claims = jwt.decode(
+            token,
+            key=key,
+            algorithms=algorithms,
+            audience=self.audience,
+            options={"require": ["exp", "sub"]},
+        )
+        user = user_from_claims(claims)
+        self.cache.put(cache_key, user, claims["exp"])
+        return user
+
+    def should_revalidate(self) -> bool:
+        """Whether this request should also be confirmed with Supabase Auth"""
+        return self.revalidate_rate > 0 and random.random() < self.revalidate_rate
+
+    def forget(self, token: str) -> None:
+        """Drop a token from the cache, e.g. after a failed revalidation"""
+        self.cache.discard(self.cache_key(token))
+
+
+@functools.cache
+def get_supabase_jwt_verifier() -> SupabaseJWTVerifier | None:
+    """Return the verifier for local mode, or None when tokens are checked remotely"""
+    if os.environ.get("SUPABASE_AUTH_MODE", "remote").lower() != "local":
+        return None
+
+    secret = os.environ.get("SUPABASE_JWT_SECRET") or None
+    jwks_url = None
+    if not secret:
+        supabase_url = os.environ.get("SUPABASE_URL")
+        if not supabase_url:
+            logger.error("SUPABASE_AUTH_MODE=local needs SUPABASE_JWT_SECRET or SUPABASE_URL")
+            return None
+        jwks_url = f"{supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json"
+
+    return SupabaseJWTVerifier(
+        secret=secret,
+        jwks_url=jwks_url,
+        audience=os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated"),
+        revalidate_rate=float(os.environ.get("SUPABASE_AUTH_REVALIDATE_RATE", "0") or 0),
+    )
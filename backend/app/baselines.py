@@ -0,0 +1,289 @@
+"""
+Biometric baselines for NGX Pulse Backend
+Per-user 7-day and 28-day exponentially weighted mean and variance of HRV and
+resting heart rate, folded in as samples are synced, and the readiness score
+derived from them
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.db import get_time_series_store
+from app.db.timeseries import DEFAULT_SERIES_PATH
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 86_400_000
+
+# Metric name -> HealthKit quantity type it is computed from
+BASELINE_METRICS = {
+    "hrv": "HKQuantityTypeIdentifierHeartRateVariabilitySDNN",
+    "resting_hr": "HKQuantityTypeIdentifierRestingHeartRate",
+}
+_METRIC_BY_TYPE = {sample_type: metric for metric, sample_type in BASELINE_METRICS.items()}
+_METRIC_ORDER = {metric: i for i, metric in enumerate(BASELINE_METRICS)}
+
+# Readiness direction per metric: HRV above baseline is good, resting HR above baseline is not
+_READINESS_SIGN = {"hrv": 1.0, "resting_hr": -1.0}
+# Samples a 28-day baseline needs before it counts towards readiness
+MIN_BASELINE_SAMPLES = 3
+# Floor for the baseline deviation (ms of HRV, bpm), so a flat history does not
+# turn a tiny change into an extreme score
+MIN_BASELINE_SD = 1.0
+
+# Running sums of one (user, metric); short is the 7-day baseline, long the 28-day one
+_STATE = (
+    "reference, count, latest, short_weight, short_total, short_squares, long_weight, long_total, long_squares"
+)
+_COLUMNS = (
+    "user_id TEXT NOT NULL, metric TEXT NOT NULL, reference INTEGER NOT NULL, count INTEGER NOT NULL, "
+    "latest REAL NOT NULL, short_weight REAL NOT NULL, short_total REAL NOT NULL, short_squares REAL NOT NULL, "
+    "long_weight REAL NOT NULL, long_total REAL NOT NULL, long_squares REAL NOT NULL, PRIMARY KEY (user_id, metric)"
+)
+# (timestamp, value) pairs folded into the sums
+_SAMPLE_COLUMNS = (
+    "user_id TEXT NOT NULL, metric TEXT NOT NULL, timestamp INTEGER NOT NULL, value REAL NOT NULL, "
+    "PRIMARY KEY (user_id, metric, timestamp, value)"
+)
+
+
+class _Ewm:
+    """Time-decayed weighted sums of one metric over one horizon
+
+    Every sample weighs ``exp(-(reference - t) / horizon)``, with
+    ``reference`` the newest timestamp seen. Moving the reference forward
+    decays the sums once; an older sample, arriving late, just gets a
+    smaller weight, so the result does not depend on the order samples
+    arrive in.
+    """
+
+    __slots__ = ("horizon_ms", "weight", "total", "squares")
+
+    def __init__(self, horizon_ms: int, weight: float = 0.0, total: float = 0.0, squares: float = 0.0):
+        self.horizon_ms = horizon_ms
+        self.weight = weight
+        self.total = total
+        self.squares = squares
+
+    def decay(self, elapsed_ms: int):
+        decay = math.exp(-elapsed_ms / self.horizon_ms)
+        self.weight *= decay
+        self.total *= decay
+        self.squares *= decay
+
+    def add(self, ages_ms: np.ndarray, values: np.ndarray):
+        weights = np.exp(-ages_ms / self.horizon_ms)
+        self.weight += float(weights.sum())
+        self.total += float(weights @ values)
+        self.squares += float(weights @ (values * values))
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.weight if self.weight > 0 else None
+
+    @property
+    def variance(self) -> Optional[float]:
+        if self.weight <= 0:
+            return None
+        mean = self.total / self.weight
+        return max(self.squares / self.weight - mean * mean, 0.0)
+
+
+class _MetricBaseline:
+    """7-day and 28-day sums of one metric of one user, and its newest sample"""
+
+    __slots__ = ("reference", "count", "latest", "short", "long")
+
+    def __init__(self, row: Optional[Tuple[Any, ...]] = None):
+        reference, count, latest, *sums = row or (None, 0, None, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        self.reference: Optional[int] = reference  # Newest timestamp folded in, epoch ms
+        self.count: int = count
+        self.latest: Optional[float] = latest
+        self.short = _Ewm(7 * DAY_MS, *sums[:3])
+        self.long = _Ewm(28 * DAY_MS, *sums[3:])
+
+    def add(self, timestamps: np.ndarray, values: np.ndarray):
+        newest = int(np.argmax(timestamps))
+        if self.reference is None or timestamps[newest] >= self.reference:
+            if self.reference is not None:
+                self.short.decay(int(timestamps[newest]) - self.reference)
+                self.long.decay(int(timestamps[newest]) - self.reference)
+            self.reference = int(timestamps[newest])
+            self.latest = float(values[newest])
+        ages = (self.reference - timestamps).astype(np.float64)
+        self.short.add(ages, values)
+        self.long.add(ages, values)
+        self.count += len(timestamps)
+
+    def row(self) -> Tuple[Any, ...]:
+        return (
+            self.reference, self.count, self.latest,
+            self.short.weight, self.short.total, self.short.squares,
+            self.long.weight, self.long.total, self.long.squares,
+        )
+
+
+class BaselineSnapshot(NamedTuple):
+    captured_at: int  # Newest sample folded in, epoch ms
+    metrics: Dict[str, float]
+
+
+class BiometricBaselines:
+    """Rolling HRV and resting HR baselines per user, O(1) to read
+
+    ``record`` is the write path for synced quantity samples: it appends
+    them to the time series and folds HRV and resting HR into the user's
+    running sums in the same step. The sums live in a SQLite table, one row
+    per user and metric, so they survive restarts and every worker of a
+    host that shares the ``path`` folds into and reads the same ones;
+    without a ``path`` they only live in memory. Reading a user's baselines
+    is one indexed query, whatever their history.
+
+    The (timestamp, value) pairs folded in are kept next to the sums and
+    only pairs not seen before are added, so a sample synced again, e.g.
+    after the seen-sample index forgot it, is not counted twice. Pairs more
+    than ``retention_days`` older than a metric's newest sample are
+    forgotten and no longer folded in; their weight in the 28-day baseline
+    is negligible by then.
+    """
+
+    table = "biometric_baselines"
+
+    def __init__(self, path: Optional[str] = None, retention_days: int = 365):
+        self.path = path
+        self.retention_ms = retention_days * DAY_MS
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None, timeout=30)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ({_COLUMNS}) WITHOUT ROWID")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.table}_samples ({_SAMPLE_COLUMNS}) WITHOUT ROWID")
+        self._lock = threading.Lock()
+        self.stats = {"samples_folded": 0, "samples_repeated": 0, "samples_expired": 0}
+
+    @classmethod
+    def from_env(cls) -> "BiometricBaselines":
+        """Build the engine from BIOMETRICS_BASELINE_* settings"""
+        path = os.environ.get("BIOMETRICS_BASELINE_PATH") or os.path.join(
+            os.environ.get("HEALTHKIT_SERIES_PATH") or DEFAULT_SERIES_PATH, "baselines.sqlite3"
+        )
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return cls(path, retention_days=max(28, int(os.environ.get("BIOMETRICS_BASELINE_RETENTION_DAYS") or 365)))
+
+    def record(self, user_id: str, sample_type: str, timestamps: Sequence[int], values: Sequence[float]):
+        """Append samples to the user's time series and fold new ones into their baselines"""
+        get_time_series_store().append(user_id, sample_type, timestamps, values)
+        metric = _METRIC_BY_TYPE.get(sample_type)
+        if metric is None or not len(timestamps):
+            return
+        self._fold(user_id, metric, np.asarray(timestamps, dtype=np.int64), np.asarray(values, dtype=np.float64))
+
+    def _fold(self, user_id: str, metric: str, timestamps: np.ndarray, values: np.ndarray):
+        samples = f"{self.table}_samples"
+        with self._lock:
+            # IMMEDIATE: another worker folding into the same file waits for this one
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    f"SELECT {_STATE} FROM {self.table} WHERE user_id = ? AND metric = ?", (user_id, metric)
+                ).fetchone()
+                baseline = _MetricBaseline(row)
+                newest = max(int(timestamps.max()), baseline.reference or 0)
+                fresh = timestamps >= newest - self.retention_ms
+                expired = len(timestamps) - int(fresh.sum())
+                pairs = np.unique(np.rec.fromarrays([timestamps[fresh], values[fresh]], names="t,v"))
+                if len(pairs):
+                    seen = self._db.execute(
+                        f"SELECT timestamp, value FROM {samples} "
+                        "WHERE user_id = ? AND metric = ? AND timestamp BETWEEN ? AND ?",
+                        (user_id, metric, int(pairs["t"].min()), int(pairs["t"].max())),
+                    ).fetchall()
+                    if seen:
+                        pairs = pairs[~np.isin(pairs, np.rec.array(seen, dtype=pairs.dtype))]
+                if len(pairs):
+                    self._db.executemany(
+                        f"INSERT INTO {samples} (user_id, metric, timestamp, value) VALUES (?, ?, ?, ?)",
+                        [(user_id, metric, t, v) for t, v in zip(pairs["t"].tolist(), pairs["v"].tolist())],
+                    )
+                    baseline.add(pairs["t"], pairs["v"])
+                    self._db.execute(
+                        f"INSERT OR REPLACE INTO {self.table} (user_id, metric, {_STATE}) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (user_id, metric, *baseline.row()),
+                    )
+                    self._db.execute(
+                        f"DELETE FROM {samples} WHERE user_id = ? AND metric = ? AND timestamp < ?",
+                        (user_id, metric, baseline.reference - self.retention_ms),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self.stats["samples_folded"] += len(pairs)
+            self.stats["samples_repeated"] += len(timestamps) - expired - len(pairs)
+            self.stats["samples_expired"] += expired
+
+    def snapshot(self, user_id: str) -> Optional[BaselineSnapshot]:
+        """Latest values, baselines and readiness; None without HRV or resting HR samples"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT metric, {_STATE} FROM {self.table} WHERE user_id = ?", (user_id,)
+            ).fetchall()
+        if not rows:
+            return None
+
+        metrics: Dict[str, float] = {}
+        scores = []
+        captured_at = None
+        for metric, *state in sorted(rows, key=lambda row: _METRIC_ORDER[row[0]]):
+            baseline = _MetricBaseline(tuple(state))
+            captured_at = baseline.reference if captured_at is None else max(captured_at, baseline.reference)
+            long_mean, long_variance = baseline.long.mean, baseline.long.variance
+            metrics[metric] = baseline.latest
+            metrics[f"{metric}_7d"] = baseline.short.mean
+            metrics[f"{metric}_28d"] = long_mean
+            metrics[f"{metric}_28d_sd"] = math.sqrt(long_variance)
+            if baseline.count >= MIN_BASELINE_SAMPLES:
+                deviation = max(math.sqrt(long_variance), MIN_BASELINE_SD)
+                scores.append(_READINESS_SIGN[metric] * (baseline.short.mean - long_mean) / deviation)
+        if scores:
+            metrics["readiness"] = readiness_score(sum(scores) / len(scores))
+        return BaselineSnapshot(captured_at, metrics)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            users = self._db.execute(f"SELECT COUNT(DISTINCT user_id) FROM {self.table}").fetchone()[0]
+            return {"users": users, "persistent": self.path is not None, **self.stats}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def readiness_score(z: float) -> float:
+    """0 to 100 readiness from the mean signed deviation of the 7-day baselines
+    from the 28-day ones, in 28-day standard deviations: 50 is on baseline and
+    every deviation moves it 20 points"""
+    return float(round(min(max(50.0 + 20.0 * z, 0.0), 100.0)))
+
+
+_biometric_baselines: Optional[BiometricBaselines] = None
+
+
+def get_biometric_baselines() -> BiometricBaselines:
+    """Get the process-wide engine, creating it from the environment on first use"""
+    global _biometric_baselines
+    if _biometric_baselines is None:
+        _biometric_baselines = BiometricBaselines.from_env()
+    return _biometric_baselines
+
+
+def set_biometric_baselines(baselines: Optional[BiometricBaselines]):
+    """Set the process-wide engine"""
+    global _biometric_baselines
+    _biometric_baselines = baselines
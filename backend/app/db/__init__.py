@@ -0,0 +1,59 @@
+"""
+Database access for NGX Pulse Backend
+"""
+
+from .nutrition_rollups import (
+    DailyTotals,
+    NutritionRollupStore,
+    daily_totals,
+    get_nutrition_rollups,
+    set_nutrition_rollups,
+)
+from .registry import SupabaseClientRegistry, get_supabase_registry, set_supabase_registry
+from .repositories import (
+    AICoachMessageRepository,
+    ChatMessageRepository,
+    ChunkedUpsertResult,
+    HealthKitRepository,
+    NutritionLogRepository,
+    UpsertChunkFailure,
+)
+from .sync_state import SeenSampleIndex, get_seen_sample_index, set_seen_sample_index
+from .timeseries import (
+    AGGREGATIONS,
+    EPOCH,
+    Buckets,
+    SeriesRange,
+    TimeSeriesStore,
+    get_time_series_store,
+    resample,
+    set_time_series_store,
+)
+
+__all__ = [
+    "AGGREGATIONS",
+    "AICoachMessageRepository",
+    "Buckets",
+    "ChatMessageRepository",
+    "ChunkedUpsertResult",
+    "DailyTotals",
+    "EPOCH",
+    "HealthKitRepository",
+    "NutritionLogRepository",
+    "NutritionRollupStore",
+    "SeenSampleIndex",
+    "SeriesRange",
+    "SupabaseClientRegistry",
+    "TimeSeriesStore",
+    "UpsertChunkFailure",
+    "daily_totals",
+    "get_nutrition_rollups",
+    "get_seen_sample_index",
+    "get_supabase_registry",
+    "get_time_series_store",
+    "resample",
+    "set_nutrition_rollups",
+    "set_seen_sample_index",
+    "set_supabase_registry",
+    "set_time_series_store",
+]
@@ -0,0 +1,273 @@
+"""
+Nutrition daily rollups for NGX Pulse Backend
+Per-user calorie and macro totals per day, bumped on every meal write, so a
+summary of N days is one indexed read instead of a scan of ``nutrition_logs``
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import date
+from typing import Any, AsyncIterable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# ``nutrition_logs`` columns a rollup is computed from, in rollup order
+TOTAL_COLUMNS = ("total_calories", "total_protein", "total_carbs", "total_fat")
+
+# (user_id, ISO day, calories, protein, carbs, fat, entries)
+RollupRow = Tuple[str, str, int, float, float, float, int]
+
+_UPSERT = (
+    "INSERT INTO {table} (user_id, day, calories, protein, carbs, fat, entries) VALUES (?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (user_id, day) DO UPDATE SET "
+    "calories = calories + excluded.calories, protein = protein + excluded.protein, "
+    "carbs = carbs + excluded.carbs, fat = fat + excluded.fat, entries = entries + excluded.entries"
+)
+_COLUMNS = (
+    "user_id TEXT NOT NULL, day TEXT NOT NULL, calories INTEGER NOT NULL, protein REAL NOT NULL, "
+    "carbs REAL NOT NULL, fat REAL NOT NULL, entries INTEGER NOT NULL, PRIMARY KEY (user_id, day)"
+)
+# current: totals complete since the last rebuild; writes: entries added and invalidations, ever
+_USER_COLUMNS = "user_id TEXT PRIMARY KEY, current INTEGER NOT NULL, writes INTEGER NOT NULL"
+
+
+class DailyTotals(NamedTuple):
+    day: date
+    calories: int
+    protein: float
+    carbs: float
+    fat: float
+    entries: int  # nutrition_logs rows folded in
+
+
+def daily_totals(rows: Sequence[Mapping[str, Any]]) -> List[RollupRow]:
+    """Sum ``nutrition_logs`` rows per (user, day)
+
+    Rows are grouped with one ``np.unique`` over a combined user and day
+    key and summed with ``np.bincount``, so a batch costs a few array
+    passes whatever its size. Missing totals count as zero.
+    """
+    if not rows:
+        return []
+    user_ids, user_index = np.unique(np.array([row["user_id"] for row in rows]), return_inverse=True)
+    days = np.array([str(row["date"])[:10] for row in rows], dtype="datetime64[D]").astype(np.int64)
+    first_day = days.min()
+    span = int(days.max() - first_day) + 1
+    groups, group_index = np.unique(user_index * span + (days - first_day), return_inverse=True)
+    totals = np.array([[row.get(column) or 0 for column in TOTAL_COLUMNS] for row in rows], dtype=np.float64)
+    sums = [np.bincount(group_index, weights=totals[:, i], minlength=len(groups)) for i in range(len(TOTAL_COLUMNS))]
+    entries = np.bincount(group_index, minlength=len(groups))
+    group_days = (groups % span + first_day).astype("datetime64[D]").astype(str)
+    return list(zip(
+        user_ids[groups // span].tolist(),
+        group_days.tolist(),
+        np.rint(sums[0]).astype(np.int64).tolist(),
+        sums[1].tolist(),
+        sums[2].tolist(),
+        sums[3].tolist(),
+        entries.tolist(),
+    ))
+
+
+class NutritionRollupStore:
+    """Daily nutrition totals per user in a SQLite table
+
+    ``add`` folds one ``nutrition_logs`` row into its day with a single
+    upsert; ``range`` reads a span of days through the ``(user_id, day)``
+    primary key. The file is shared by the workers of a host; without a
+    ``path`` the totals only live in memory. ``rebuild`` recomputes them
+    from the log history.
+
+    A second table records which users' totals are complete, i.e. were
+    rebuilt from their history with no ``add`` running alongside.
+    ``is_current`` is false for users never rebuilt into this file and for
+    users ``invalidate`` flagged, e.g. after a meal was logged but could
+    not be added, so readers know to rebuild them first.
+    """
+
+    table = "nutrition_daily_totals"
+    users_table = "nutrition_rollup_users"
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None, timeout=30)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ({_COLUMNS}) WITHOUT ROWID")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {self.users_table} ({_USER_COLUMNS}) WITHOUT ROWID")
+        self._lock = threading.Lock()
+        self.stats = {"entries_added": 0, "range_reads": 0, "rebuilds": 0, "invalidations": 0}
+
+    @classmethod
+    def from_env(cls) -> "NutritionRollupStore":
+        """Build the store from NUTRITION_ROLLUPS_PATH
+
+        The file has to outlive the process and be the same for every
+        worker, so a path in the temporary directory is refused. Without
+        one the totals only live in memory and each worker rebuilds a
+        user's from ``nutrition_logs`` on their first summary.
+        """
+        path = os.environ.get("NUTRITION_ROLLUPS_PATH")
+        if not path:
+            logger.warning("NUTRITION_ROLLUPS_PATH is not set; nutrition totals are kept in memory only")
+            return cls()
+        temp_dir = os.path.realpath(tempfile.gettempdir())
+        if os.path.commonpath([os.path.realpath(path), temp_dir]) == temp_dir:
+            raise ValueError(f"NUTRITION_ROLLUPS_PATH must not be in the temporary directory {temp_dir}: {path}")
+        return cls(path)
+
+    def add(
+        self, user_id: str, day: date, calories: int, protein: float, carbs: float, fat: float
+    ) -> DailyTotals:
+        """Fold one logged entry into its day; returns the day's new totals"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    _UPSERT.format(table=self.table) + " RETURNING day, calories, protein, carbs, fat, entries",
+                    (user_id, day.isoformat(), int(calories), float(protein), float(carbs), float(fat), 1),
+                ).fetchone()
+                # Tells a rebuild of the user running alongside that its history may have missed this entry
+                self._db.execute(
+                    f"INSERT INTO {self.users_table} (user_id, current, writes) VALUES (?, 0, 1) "
+                    "ON CONFLICT (user_id) DO UPDATE SET writes = writes + 1",
+                    (user_id,),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self.stats["entries_added"] += 1
+        return _totals(row)
+
+    def is_current(self, user_id: str) -> bool:
+        """Whether the user's totals were rebuilt from their history and not invalidated since"""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT current FROM {self.users_table} WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return bool(row and row[0])
+
+    def invalidate(self, user_id: str):
+        """Flag the user's totals for a rebuild"""
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO {self.users_table} (user_id, current, writes) VALUES (?, 0, 1) "
+                "ON CONFLICT (user_id) DO UPDATE SET current = 0, writes = writes + 1",
+                (user_id,),
+            )
+            self.stats["invalidations"] += 1
+
+    def range(self, user_id: str, start: date, end: date) -> List[DailyTotals]:
+        """Totals of the logged days from ``start`` to ``end``, both included, oldest first"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT day, calories, protein, carbs, fat, entries FROM {self.table} "
+                "WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (user_id, start.isoformat(), end.isoformat()),
+            ).fetchall()
+            self.stats["range_reads"] += 1
+        return [_totals(row) for row in rows]
+
+    async def rebuild(
+        self, batches: AsyncIterable[Sequence[Mapping[str, Any]]], user_id: Optional[str] = None
+    ) -> int:
+        """Recompute the totals from ``nutrition_logs`` rows; returns the days written
+
+        Each batch is summed with ``daily_totals`` into a staging table, and
+        the totals are swapped in one transaction at the end: of ``user_id``
+        only when given, of every user otherwise. The rebuilt users become
+        current, except a ``user_id`` that had entries added while the
+        rebuild ran, which the history may have missed; the next reader
+        rebuilds that one again. A rebuild of every user does not check for
+        entries added alongside, so run it while meal writes are quiet.
+        """
+        staging = f"{self.table}_rebuild"
+        with self._lock:
+            self._db.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} ({_COLUMNS}) WITHOUT ROWID")
+            self._db.execute(f"DELETE FROM {staging}")
+            writes = self._writes(user_id)
+        try:
+            async for batch in batches:
+                totals = daily_totals(batch)
+                with self._lock:
+                    self._db.execute("BEGIN")
+                    self._db.executemany(_UPSERT.format(table=staging), totals)
+                    self._db.execute("COMMIT")
+
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    if user_id is None:
+                        self._db.execute(f"DELETE FROM {self.table}")
+                        self._db.execute(f"INSERT INTO {self.table} SELECT * FROM {staging}")
+                        self._db.execute(f"UPDATE {self.users_table} SET current = 1")
+                        self._db.execute(
+                            f"INSERT OR IGNORE INTO {self.users_table} (user_id, current, writes) "
+                            f"SELECT DISTINCT user_id, 1, 0 FROM {staging}"
+                        )
+                    else:
+                        self._db.execute(f"DELETE FROM {self.table} WHERE user_id = ?", (user_id,))
+                        self._db.execute(
+                            f"INSERT INTO {self.table} SELECT * FROM {staging} WHERE user_id = ?", (user_id,)
+                        )
+                        self._db.execute(
+                            f"INSERT INTO {self.users_table} (user_id, current, writes) VALUES (?, 1, 0) "
+                            "ON CONFLICT (user_id) DO UPDATE SET current = (writes = ?)",
+                            (user_id, writes),
+                        )
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+                days = self._db.execute(f"SELECT COUNT(*) FROM {staging}").fetchone()[0]
+                self.stats["rebuilds"] += 1
+        finally:
+            with self._lock:
+                if self._db.in_transaction:
+                    self._db.execute("ROLLBACK")
+                self._db.execute(f"DROP TABLE IF EXISTS {staging}")
+        logger.info("Rebuilt %d days of nutrition totals", days)
+        return days
+
+    def _writes(self, user_id: Optional[str]) -> int:
+        row = self._db.execute(f"SELECT writes FROM {self.users_table} WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            days = self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            users = self._db.execute(f"SELECT COUNT(*) FROM {self.users_table} WHERE current").fetchone()[0]
+            return {"days": days, "current_users": users, "persistent": self.path is not None, **self.stats}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _totals(row: Tuple[Any, ...]) -> DailyTotals:
+    day, calories, protein, carbs, fat, entries = row
+    return DailyTotals(date.fromisoformat(day), calories, protein, carbs, fat, entries)
+
+
+# Global instance, set up by the app lifespan
+_nutrition_rollups: Optional[NutritionRollupStore] = None
+
+
+def get_nutrition_rollups() -> NutritionRollupStore:
+    """Get the process-wide store, creating it from the environment on first use"""
+    global _nutrition_rollups
+    if _nutrition_rollups is None:
+        _nutrition_rollups = NutritionRollupStore.from_env()
+    return _nutrition_rollups
+
+
+def set_nutrition_rollups(store: Optional[NutritionRollupStore]):
+    """Set the process-wide store"""
+    global _nutrition_rollups
+    _nutrition_rollups = store
@@ -0,0 +1,250 @@
+"""
+Application-scoped Supabase clients for NGX Pulse Backend
+One keep-alive connection pool per process, created in the FastAPI lifespan
+and shared by every request instead of a new client (and TLS handshake) per call
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+from fastapi import HTTPException, status
+from postgrest import AsyncPostgrestClient, SyncPostgrestClient
+from supabase import Client, ClientOptions
+
+logger = logging.getLogger(__name__)
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    return value.lower() in {"1", "true", "yes"}
+
+
+class _PoolStats:
+    """Request counters for a pooled transport"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finished(self, failed: bool):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors += 1
+
+
+class _InstrumentedTransport(httpx.BaseTransport):
+    """Counts requests waiting on the pool or the server"""
+
+    def __init__(self, transport: httpx.HTTPTransport, stats: _PoolStats):
+        self._transport = transport
+        self._stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.started()
+        failed = True
+        try:
+            response = self._transport.handle_request(request)
+            failed = False
+            return response
+        finally:
+            self._stats.finished(failed)
+
+    def close(self):
+        self._transport.close()
+
+
+class _InstrumentedAsyncTransport(httpx.AsyncBaseTransport):
+    """Counts requests waiting on the async pool or the server"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, stats: _PoolStats):
+        self._transport = transport
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.started()
+        failed = True
+        try:
+            response = await self._transport.handle_async_request(request)
+            failed = False
+            return response
+        finally:
+            self._stats.finished(failed)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def _pool_stats(transport: Any, stats: _PoolStats, max_connections: Optional[int]) -> Dict[str, Any]:
+    pool = getattr(transport, "_pool", None)
+    connections = list(pool.connections) if pool is not None else []
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "connections": len(connections),
+        "idle_connections": idle,
+        "active_connections": len(connections) - idle,
+        "utilization": (len(connections) - idle) / max_connections if max_connections else 0.0,
+        "requests": stats.requests,
+        "errors": stats.errors,
+        "in_flight": stats.in_flight,
+        "peak_in_flight": stats.peak_in_flight,
+    }
+
+
+class SupabaseClientRegistry:
+    """Supabase clients sharing pooled HTTP transports
+
+    ``client()`` is a long-lived anon client (auth calls such as
+    ``auth.get_user(jwt=...)``). ``postgrest(access_token)`` returns a cheap
+    per-request PostgREST view carrying the caller's token, so row level
+    security applies to that user, on top of the same connections.
+    ``async_postgrest(access_token)`` is the same over an async pool, for
+    ``async def`` endpoints (see ``app.db.repositories``).
+    """
+
+    def __init__(
+        self,
+        url: str,
+        anon_key: str,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True,
+        timeout: float = 10.0,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("h2 is not installed, Supabase connections fall back to HTTP/1.1")
+                http2 = False
+
+        self.url = url.rstrip("/")
+        self.anon_key = anon_key
+        self.rest_url = f"{self.url}/rest/v1"
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._stats = _PoolStats()
+        self._transport = transport or httpx.HTTPTransport(http2=http2, limits=self.limits)
+        self.http_client = httpx.Client(
+            transport=_InstrumentedTransport(self._transport, self._stats),
+            timeout=timeout,
+            follow_redirects=True,
+        )
+        self._async_stats = _PoolStats()
+        self._async_transport = async_transport or httpx.AsyncHTTPTransport(http2=http2, limits=self.limits)
+        self.async_http_client = httpx.AsyncClient(
+            transport=_InstrumentedAsyncTransport(self._async_transport, self._async_stats),
+            timeout=timeout,
+            follow_redirects=True,
+        )
+        self._client: Optional[Client] = None
+        self._client_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["SupabaseClientRegistry"]:
+        """Build the registry from SUPABASE_* settings, None if Supabase is not configured"""
+        url = os.environ.get("SUPABASE_URL")
+        anon_key = os.environ.get("SUPABASE_ANON_KEY")
+        if not url or not anon_key:
+            return None
+        return cls(
+            url,
+            anon_key,
+            max_connections=int(os.environ.get("SUPABASE_POOL_MAX_CONNECTIONS") or 100),
+            max_keepalive_connections=int(os.environ.get("SUPABASE_POOL_MAX_KEEPALIVE") or 20),
+            keepalive_expiry=float(os.environ.get("SUPABASE_POOL_KEEPALIVE_EXPIRY") or 30),
+            http2=_env_flag("SUPABASE_HTTP2", True),
+            timeout=float(os.environ.get("SUPABASE_HTTP_TIMEOUT") or 10),
+        )
+
+    def client(self) -> Client:
+        """Shared anon Supabase client; do not sign users into it"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = Client(
+                        self.url, self.anon_key, ClientOptions(httpx_client=self.http_client)
+                    )
+        return self._client
+
+    def _headers(self, access_token: Optional[str]) -> Dict[str, str]:
+        return {
+            "apiKey": self.anon_key,
+            "Authorization": f"Bearer {access_token or self.anon_key}",
+        }
+
+    def postgrest(self, access_token: Optional[str] = None, schema: str = "public") -> SyncPostgrestClient:
+        """PostgREST view authenticated as ``access_token`` (the anon key if None)"""
+        return SyncPostgrestClient(
+            self.rest_url, schema=schema, headers=self._headers(access_token), http_client=self.http_client
+        )
+
+    def async_postgrest(self, access_token: Optional[str] = None, schema: str = "public") -> AsyncPostgrestClient:
+        """Async PostgREST view authenticated as ``access_token`` (the anon key if None)"""
+        return AsyncPostgrestClient(
+            self.rest_url, schema=schema, headers=self._headers(access_token), http_client=self.async_http_client
+        )
+
+    def close(self):
+        """Close the pooled sync connections"""
+        self.http_client.close()
+
+    async def aclose(self):
+        """Close both connection pools"""
+        self.http_client.close()
+        await self.async_http_client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get connection pool statistics"""
+        max_connections = self.limits.max_connections
+        return {
+            "http2": self.http2,
+            "max_connections": max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "sync": _pool_stats(self._transport, self._stats, max_connections),
+            "async": _pool_stats(self._async_transport, self._async_stats, max_connections),
+        }
+
+
+# Global instance, set up by the app lifespan
+_supabase_registry: Optional[SupabaseClientRegistry] = None
+
+
+def get_supabase_registry() -> SupabaseClientRegistry:
+    """Get the process-wide registry, creating it from the environment on first use"""
+    global _supabase_registry
+    if _supabase_registry is None:
+        _supabase_registry = SupabaseClientRegistry.from_env()
+        if _supabase_registry is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Supabase configuration missing",
+            )
+    return _supabase_registry
+
+
+def set_supabase_registry(registry: Optional[SupabaseClientRegistry]):
+    """Set the process-wide registry"""
+    global _supabase_registry
+    _supabase_registry = registry
@@ -0,0 +1,190 @@
+"""
+Async repositories for NGX Pulse Backend
+Table access for ``async def`` endpoints over the registry's async connection
+pool, so a database round trip never blocks the event loop
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+from postgrest import AsyncPostgrestClient
+
+from .registry import get_supabase_registry
+
+logger = logging.getLogger(__name__)
+
+
+class _Repository:
+    table: str
+
+    def __init__(self, client: AsyncPostgrestClient):
+        self.client = client
+
+    @classmethod
+    def for_token(cls, access_token: Optional[str] = None):
+        """Repository over the shared pool, authenticated as ``access_token``"""
+        return cls(get_supabase_registry().async_postgrest(access_token))
+
+
+class ChatMessageRepository(_Repository):
+    """Rows of ``chat_messages``"""
+
+    table = "chat_messages"
+
+    async def add(self, user_id: str, sender: str, text_content: str) -> Dict[str, Any]:
+        """Insert a message and return the stored row"""
+        response = await (
+            self.client.table(self.table)
+            .insert({"user_id": user_id, "sender": sender, "text_content": text_content})
+            .execute()
+        )
+        return response.data[0]
+
+
+class AICoachMessageRepository(_Repository):
+    """Rows of ``ai_coach_messages``"""
+
+    table = "ai_coach_messages"
+
+    async def list_for_user(self, user_id: str, unread_only: bool = False) -> List[Dict[str, Any]]:
+        """Messages for the user, oldest first"""
+        query = self.client.table(self.table).select("*").eq("user_id", user_id)
+        if unread_only:
+            query = query.is_("read_at", None)
+        response = await query.order("created_at").execute()
+        return response.data or []
+
+
+class NutritionLogRepository(_Repository):
+    """Rows of ``nutrition_logs``: calorie and macro totals with the meals behind them"""
+
+    table = "nutrition_logs"
+
+    async def add(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Insert a log row and return the stored row"""
+        response = await self.client.table(self.table).insert(row).execute()
+        return response.data[0]
+
+    async def pages(
+        self, columns: str = "*", page_size: int = 1000, user_id: Optional[str] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """All rows (of ``user_id`` if given) in pages of ``page_size``, ordered by ``id``"""
+        offset = 0
+        while True:
+            query = self.client.table(self.table).select(columns)
+            if user_id is not None:
+                query = query.eq("user_id", user_id)
+            response = await query.order("id").range(offset, offset + page_size - 1).execute()
+            rows = response.data or []
+            if rows:
+                yield rows
+            if len(rows) < page_size:
+                return
+            offset += page_size
+
+
+class UpsertChunkFailure(NamedTuple):
+    """A chunk of records the database rejected"""
+
+    offset: int
+    count: int
+    error: str
+
+
+class ChunkedUpsertResult(NamedTuple):
+    """Outcome of a chunked upsert: rows written and chunks that failed"""
+
+    written: int
+    failures: List[UpsertChunkFailure]
+
+
+class HealthKitRepository(_Repository):
+    """Rows of the ``health_kit_*`` sample tables"""
+
+    TABLES = {
+        "quantity": "health_kit_quantity_samples",
+        "category": "health_kit_category_samples",
+        "workout": "health_kit_workouts",
+    }
+    # Schema and RLS policies: frontend/docs/database-schema-healthkit-sync.sql
+    ANCHORS_TABLE = "health_kit_sync_anchors"
+
+    async def upsert(self, kind: str, records: List[Dict[str, Any]]) -> int:
+        """Upsert samples of one kind by ``external_uuid``; returns the rows written"""
+        if not records:
+            return 0
+        response = await (
+            self.client.table(self.TABLES[kind])
+            .upsert(records, on_conflict="external_uuid")
+            .execute()
+        )
+        return len(response.data or [])
+
+    async def get_anchors(self, user_id: str) -> Dict[str, str]:
+        """Sync watermark per ``sample_type`` for the user"""
+        response = await (
+            self.client.table(self.ANCHORS_TABLE)
+            .select("sample_type,anchor")
+            .eq("user_id", user_id)
+            .execute()
+        )
+        return {row["sample_type"]: row["anchor"] for row in response.data or []}
+
+    async def save_anchors(self, user_id: str, anchors: Dict[str, str]):
+        """Store watermarks, one row per ``(user_id, sample_type)``"""
+        if not anchors:
+            return
+        await (
+            self.client.table(self.ANCHORS_TABLE)
+            .upsert(
+                [
+                    {"user_id": user_id, "sample_type": sample_type, "anchor": anchor}
+                    for sample_type, anchor in anchors.items()
+                ],
+                on_conflict="user_id,sample_type",
+            )
+            .execute()
+        )
+
+    async def upsert_chunked(
+        self,
+        kind: str,
+        records: List[Dict[str, Any]],
+        chunk_size: int = 500,
+        semaphore: Optional[asyncio.Semaphore] = None,
+    ) -> ChunkedUpsertResult:
+        """Upsert ``records`` in chunks of ``chunk_size``, sent concurrently
+
+        ``semaphore`` bounds how many chunk requests are in flight; share one
+        across kinds to bound a whole sync. A failed chunk does not stop the
+        others, it is reported in ``failures``.
+        """
+        if not records:
+            return ChunkedUpsertResult(0, [])
+        chunk_size = max(1, chunk_size)
+        semaphore = semaphore or asyncio.Semaphore(4)
+
+        async def upsert_chunk(offset: int) -> int:
+            async with semaphore:
+                return await self.upsert(kind, records[offset:offset + chunk_size])
+
+        offsets = range(0, len(records), chunk_size)
+        outcomes = await asyncio.gather(
+            *(upsert_chunk(offset) for offset in offsets), return_exceptions=True
+        )
+
+        written = 0
+        failures: List[UpsertChunkFailure] = []
+        for offset, outcome in zip(offsets, outcomes):
+            if isinstance(outcome, BaseException):
+                if not isinstance(outcome, Exception):
+                    raise outcome
+                count = min(chunk_size, len(records) - offset)
+                logger.error(
+                    "Error upserting %s chunk at offset %d (%d records): %s", kind, offset, count, outcome
+                )
+                failures.append(UpsertChunkFailure(offset, count, str(outcome)))
+            else:
+                written += outcome
+        return ChunkedUpsertResult(written, failures)
@@ -0,0 +1,134 @@
+"""
+HealthKit sync state for NGX Pulse Backend
+Per-user record of the samples this worker has already stored, so overlapping
+sync windows are dropped before they cost a database write
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+# Digests a user collects in a Python dict before they are merged into the arrays
+PENDING_DIGESTS = 1024
+
+
+class _SeenSet:
+    """One user's digests: in insertion order, sorted for lookups, plus the
+    latest ones not merged in yet"""
+
+    __slots__ = ("order", "sorted", "pending")
+
+    def __init__(self):
+        self.order = np.empty(0, dtype=np.uint64)
+        self.sorted = self.order
+        self.pending: Dict[int, None] = {}
+
+    def __len__(self) -> int:
+        return len(self.order) + len(self.pending)
+
+    def __contains__(self, digest: int) -> bool:
+        if digest in self.pending:
+            return True
+        at = int(np.searchsorted(self.sorted, np.uint64(digest)))
+        return at < len(self.sorted) and int(self.sorted[at]) == digest
+
+    def merge(self, max_size: int):
+        """Fold the pending digests in, dropping the oldest beyond ``max_size``"""
+        if self.pending:
+            pending = np.fromiter(self.pending, dtype=np.uint64, count=len(self.pending))
+            self.pending = {}
+            self.order = np.concatenate((self.order, pending))
+        if len(self.order) > max_size:
+            self.order = self.order[len(self.order) - max_size:].copy()
+        self.sorted = np.sort(self.order)
+
+
+class SeenSampleIndex:
+    """LRU of users, each with the ``external_uuid``s already stored
+
+    UUIDs are kept as 64-bit BLAKE2b digests in two ``uint64`` arrays per
+    user, one in insertion order and one sorted for binary search, so a
+    sample costs 16 bytes (a full index of the default 500 users of 20k
+    samples is about 160 MB). New digests wait in a small dict until
+    ``PENDING_DIGESTS`` of them are merged in one sort. The oldest samples
+    are forgotten first once ``max_per_user`` is reached. The index only
+    lets a sync skip writes: a forgotten or never seen sample is simply
+    upserted again, which is idempotent. At 20k samples per user a digest
+    collision (a new sample wrongly treated as seen) has a probability
+    around 1e-11.
+    """
+
+    def __init__(self, max_users: int = 500, max_per_user: int = 20_000):
+        self.max_users = max_users
+        self.max_per_user = max_per_user
+        self._users: OrderedDict[str, _SeenSet] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(external_uuid: str) -> int:
+        return int.from_bytes(hashlib.blake2b(external_uuid.encode(), digest_size=8).digest(), "big")
+
+    def contains(self, user_id: str, digest: int) -> bool:
+        with self._lock:
+            seen = self._users.get(user_id)
+            if seen is not None and digest in seen:
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, user_id: str, digests: Iterable[int]):
+        """Record samples as stored for the user"""
+        with self._lock:
+            seen = self._users.get(user_id)
+            if seen is None:
+                seen = self._users[user_id] = _SeenSet()
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+            for digest in digests:
+                if digest not in seen:
+                    seen.pending[digest] = None
+            if len(seen.pending) >= PENDING_DIGESTS or len(seen) > self.max_per_user:
+                seen.merge(self.max_per_user)
+
+    def forget(self, user_id: str):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "samples": sum(len(seen) for seen in self._users.values()),
+                "array_bytes": sum(seen.order.nbytes + seen.sorted.nbytes for seen in self._users.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_seen_sample_index: Optional[SeenSampleIndex] = None
+
+
+def get_seen_sample_index() -> SeenSampleIndex:
+    """Get the process-wide index, sized by HEALTHKIT_SEEN_MAX_USERS/HEALTHKIT_SEEN_MAX_PER_USER"""
+    global _seen_sample_index
+    if _seen_sample_index is None:
+        _seen_sample_index = SeenSampleIndex(
+            max_users=int(os.environ.get("HEALTHKIT_SEEN_MAX_USERS") or 500),
+            max_per_user=int(os.environ.get("HEALTHKIT_SEEN_MAX_PER_USER") or 20_000),
+        )
+    return _seen_sample_index
+
+
+def set_seen_sample_index(index: Optional[SeenSampleIndex]):
+    """Set the process-wide index"""
+    global _seen_sample_index
+    _seen_sample_index = index
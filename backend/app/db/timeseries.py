@@ -0,0 +1,456 @@
+"""
+HealthKit time series for NGX Pulse Backend
+Append-only columnar store of quantity samples per (user, sample type):
+``int64`` timestamps and ``float64`` values in memory-mapped segment files, so
+a time range is read as array slices instead of one JSON row per sample
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERIES_PATH = os.path.join(tempfile.gettempdir(), "ngx-pulse-series")
+
+# Timestamps are milliseconds since EPOCH
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# HealthKit identifiers, e.g. HKQuantityTypeIdentifierHeartRate; used as a directory name
+_SAMPLE_TYPE = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+_SEGMENT = re.compile(r"^(\d{10})\.ts\.npy$")
+
+# (timestamps, values) of one segment or of the tail, sorted by timestamp
+Chunk = Tuple[np.ndarray, np.ndarray]
+
+AGGREGATIONS = ("mean", "min", "max", "sum", "p50", "p95")
+_PERCENTILES = {"p50": 0.50, "p95": 0.95}
+
+
+class Buckets(NamedTuple):
+    """Non-empty buckets of a resampled series"""
+
+    starts: np.ndarray  # Bucket start, epoch ms
+    values: np.ndarray  # Aggregated value
+    counts: np.ndarray  # Samples in the bucket
+
+
+def resample(
+    timestamps: np.ndarray,
+    values: np.ndarray,
+    bucket_ms: int,
+    aggregation: str,
+    origin: int = 0,
+) -> Buckets:
+    """Aggregate time-sorted samples into ``bucket_ms`` wide buckets
+
+    Buckets are aligned to ``origin`` (epoch ms), e.g. a local midnight for
+    daily buckets. Every aggregation is a handful of whole-array operations:
+    bucket boundaries come from one pass over the sorted bucket indexes and
+    percentiles interpolate linearly, like ``np.percentile``, between the
+    sorted values of each bucket.
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation {aggregation!r}, expected one of {', '.join(AGGREGATIONS)}")
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    if not len(timestamps):
+        return Buckets(np.empty(0, np.int64), np.empty(0, np.float64), np.empty(0, np.int64))
+
+    index = (timestamps - origin) // bucket_ms
+    firsts = np.flatnonzero(np.diff(index, prepend=index[0] - 1))
+    counts = np.diff(np.append(firsts, len(index)))
+    starts = index[firsts] * bucket_ms + origin
+
+    if aggregation in ("mean", "sum"):
+        result = np.add.reduceat(values, firsts)
+        if aggregation == "mean":
+            result = result / counts
+    elif aggregation == "min":
+        result = np.minimum.reduceat(values, firsts)
+    elif aggregation == "max":
+        result = np.maximum.reduceat(values, firsts)
+    else:
+        # Sort values within their buckets with one argsort: shifting each
+        # bucket by its rank times the value span keeps buckets apart and is
+        # several times faster than lexsort on (bucket, value)
+        low_value = values.min()
+        span = values.max() - low_value + 1
+        if np.isfinite(span):
+            rank = np.repeat(np.arange(len(firsts), dtype=np.float64) * span, counts)
+            ordered = values[np.argsort(values - low_value + rank)]
+        else:
+            ordered = values[np.lexsort((values, index))]
+        position = firsts + _PERCENTILES[aggregation] * (counts - 1)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        result = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+    return Buckets(starts, result, counts)
+
+
+class SeriesRange:
+    """Samples of one series within a time range
+
+    ``chunks`` holds one (timestamps, values) pair per segment touched plus
+    one for the tail. Segment chunks are slices of the memory-mapped files,
+    so nothing is copied until ``timestamps``/``values`` have to join more
+    than one chunk. Timestamps are epoch milliseconds (UTC).
+    """
+
+    def __init__(self, chunks: List[Chunk]):
+        self.chunks = [chunk for chunk in chunks if len(chunk[0])]
+        self._arrays: Optional[Chunk] = None
+
+    def __len__(self) -> int:
+        return sum(len(timestamps) for timestamps, _ in self.chunks)
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._joined()[0]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._joined()[1]
+
+    def resample(self, bucket_ms: int, aggregation: str, origin: int = 0) -> Buckets:
+        """Aggregate the range into buckets, see ``resample``"""
+        return resample(self.timestamps, self.values, bucket_ms, aggregation, origin)
+
+    def _joined(self) -> Chunk:
+        if self._arrays is None:
+            if not self.chunks:
+                self._arrays = np.empty(0, np.int64), np.empty(0, np.float64)
+            elif len(self.chunks) == 1:
+                self._arrays = self.chunks[0]
+            else:
+                timestamps = np.concatenate([timestamps for timestamps, _ in self.chunks])
+                values = np.concatenate([values for _, values in self.chunks])
+                order = np.argsort(timestamps, kind="stable")
+                self._arrays = timestamps[order], values[order]
+        return self._arrays
+
+
+class _Tail:
+    """Samples appended to a series since its last flush"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Held while the tail is written out; queries wait on it so they see
+        # the samples in the tail or in their segment, never both or neither
+        self.flush_lock = threading.Lock()
+        self.timestamps: List[int] = []
+        self.values: List[float] = []
+        self.since = time.monotonic()
+        self.closed = False  # Flushed and dropped from the store; append to a new tail
+
+
+class TimeSeriesStore:
+    """Per-(user, sample type) series of quantity samples on local disk
+
+    Appends go to an in-memory tail that the background flusher writes out
+    as a sorted segment (``<seq>.ts.npy`` and ``<seq>.val.npy``) once it
+    holds ``max_tail`` samples or is ``flush_interval`` seconds old, so an
+    append never touches the disk. Without a running flusher (scripts,
+    tests) a full tail is written out by the append that fills it. When a series reaches ``compact_segments`` segments they
+    are merged into one, dropping exact repeats (same timestamp and value),
+    e.g. a sample synced again after the seen-sample index forgot it.
+
+    Segments are never modified, only replaced by compaction, and writers
+    take an exclusive ``flock`` on the series directory, so every worker of
+    a host can share one ``path``. Tails are per process: a worker sees the
+    others' latest samples after their next flush. The store is a read model
+    of the synced samples, not their system of record.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_tail: int = 10_000,
+        compact_segments: int = 8,
+        flush_interval: float = 5.0,
+        max_open_series: int = 256,
+    ):
+        self.path = path or DEFAULT_SERIES_PATH
+        self.max_tail = max_tail
+        self.compact_segments = compact_segments
+        self.flush_interval = flush_interval
+        self.max_open_series = max_open_series
+        self._lock = threading.Lock()
+        self._tails: Dict[Tuple[str, str], _Tail] = {}
+        # Tails taken out of ``_tails`` whose segment is being written
+        self._flushing: Dict[Tuple[str, str], _Tail] = {}
+        # Mapped segments per series, with the directory mtime they were listed at
+        self._segments: OrderedDict[Tuple[str, str], Tuple[int, List[Chunk]]] = OrderedDict()
+        self._flusher: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.stats = {"samples_appended": 0, "segments_written": 0, "compactions": 0}
+        os.makedirs(self.path, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "TimeSeriesStore":
+        """Build the store from HEALTHKIT_SERIES_* settings"""
+        return cls(
+            path=os.environ.get("HEALTHKIT_SERIES_PATH") or None,
+            max_tail=max(1, int(os.environ.get("HEALTHKIT_SERIES_MAX_TAIL") or 10_000)),
+            compact_segments=max(2, int(os.environ.get("HEALTHKIT_SERIES_COMPACT_SEGMENTS") or 8)),
+            flush_interval=float(os.environ.get("HEALTHKIT_SERIES_FLUSH_INTERVAL") or 5),
+        )
+
+    # Writing
+
+    def append(self, user_id: str, sample_type: str, timestamps: Sequence[int], values: Sequence[float]):
+        """Add samples (epoch ms, value) to a series; any order is accepted"""
+        if not _SAMPLE_TYPE.match(sample_type):
+            raise ValueError(f"Invalid sample type {sample_type!r}")
+        if len(timestamps) != len(values):
+            raise ValueError("timestamps and values differ in length")
+        key = (user_id, sample_type)
+        while True:
+            with self._lock:
+                tail = self._tails.get(key)
+                if tail is None:
+                    tail = self._tails[key] = _Tail()
+            with tail.lock:
+                if tail.closed:
+                    continue
+                tail.timestamps.extend(timestamps)
+                tail.values.extend(values)
+                full = len(tail.timestamps) >= self.max_tail
+                break
+        self._count("samples_appended", len(timestamps))
+        if full:
+            if self._flusher is None:
+                self._flush(key)
+            else:
+                self._loop.call_soon_threadsafe(self._wake.set)
+
+    def flush(self, max_age: float = 0.0):
+        """Write out every full tail and every tail at least ``max_age`` seconds old"""
+        cutoff = time.monotonic() - max_age
+        with self._lock:
+            keys = [
+                key for key, tail in self._tails.items()
+                if tail.since <= cutoff or len(tail.timestamps) >= self.max_tail
+            ]
+        for key in keys:
+            try:
+                self._flush(key)
+            except OSError as e:
+                logger.error("Could not flush series %s/%s: %s", key[0], key[1], e)
+
+    def start(self):
+        """Flush tails every ``flush_interval`` seconds from the running event loop"""
+        if self._flusher is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_periodically(), name="series-flusher")
+
+    async def stop(self):
+        """Stop the flusher and write out every tail"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await asyncio.to_thread(self.flush)
+
+    async def _flush_periodically(self):
+        while True:
+            # Woken early by an append that fills a tail
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await asyncio.to_thread(self.flush, self.flush_interval)
+
+    def _flush(self, key: Tuple[str, str]):
+        with self._lock:
+            tail = self._tails.get(key)
+        if tail is None:
+            return
+        with tail.flush_lock:
+            # Closed only briefly under the append lock: appends that come
+            # in while the segment is written start a new tail
+            with tail.lock:
+                if tail.closed:
+                    return
+                tail.closed = True
+            with self._lock:
+                if self._tails.get(key) is tail:
+                    del self._tails[key]
+                self._flushing[key] = tail
+            try:
+                if tail.timestamps:
+                    timestamps = np.asarray(tail.timestamps, dtype=np.int64)
+                    values = np.asarray(tail.values, dtype=np.float64)
+                    order = np.argsort(timestamps, kind="stable")
+                    directory = self._directory(*key)
+                    with self._locked(directory, fcntl.LOCK_EX):
+                        sequences = self._sequences(directory)
+                        sequence = (sequences[-1] if sequences else 0) + 1
+                        self._write_segment(directory, sequence, timestamps[order], values[order])
+                        if len(sequences) + 1 >= self.compact_segments:
+                            self._compact(directory)
+            finally:
+                with self._lock:
+                    del self._flushing[key]
+
+    def _write_segment(self, directory: str, sequence: int, timestamps: np.ndarray, values: np.ndarray):
+        # Values first: a segment counts once its timestamps file exists
+        for suffix, array in ((".val.npy", values), (".ts.npy", timestamps)):
+            final = os.path.join(directory, f"{sequence:010d}{suffix}")
+            with open(final + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(final + ".tmp", final)
+        self._count("segments_written")
+
+    def _compact(self, directory: str):
+        """Merge every segment into one; the caller holds the exclusive lock"""
+        sequences = self._sequences(directory)
+        chunks = [self._load_segment(directory, sequence) for sequence in sequences]
+        timestamps = np.concatenate([chunk[0] for chunk in chunks])
+        values = np.concatenate([chunk[1] for chunk in chunks])
+        order = np.lexsort((values, timestamps))
+        timestamps, values = timestamps[order], values[order]
+        keep = np.ones(len(timestamps), dtype=bool)
+        keep[1:] = (timestamps[1:] != timestamps[:-1]) | (values[1:] != values[:-1])
+        self._write_segment(directory, sequences[-1] + 1, timestamps[keep], values[keep])
+        for sequence in sequences:
+            for suffix in (".ts.npy", ".val.npy"):
+                os.remove(os.path.join(directory, f"{sequence:010d}{suffix}"))
+        self._count("compactions")
+        logger.debug("Compacted %d segments of %s (%d samples)", len(sequences), directory, int(keep.sum()))
+
+    # Reading
+
+    def query(self, user_id: str, sample_type: str, start: Optional[int] = None, end: Optional[int] = None) -> SeriesRange:
+        """Samples with ``start <= timestamp < end`` (epoch ms, either bound optional)"""
+        if not _SAMPLE_TYPE.match(sample_type):
+            raise ValueError(f"Invalid sample type {sample_type!r}")
+        key = (user_id, sample_type)
+        while True:
+            with self._lock:
+                tail = self._tails.get(key)
+                flushing = self._flushing.get(key)
+            if flushing is not None:
+                # Wait for its segment
+                with flushing.flush_lock:
+                    continue
+            if tail is None:
+                return SeriesRange([self._slice(chunk, start, end) for chunk in self._mapped_segments(key)])
+
+            # Segments are listed under the tail lock of an open tail, whose
+            # flush cannot have started, so every sample is seen exactly once
+            with tail.lock:
+                if tail.closed:
+                    continue
+                segments = self._mapped_segments(key)
+                timestamps = np.asarray(tail.timestamps, dtype=np.int64)
+                values = np.asarray(tail.values, dtype=np.float64)
+            break
+        order = np.argsort(timestamps, kind="stable")
+        chunks = [self._slice(chunk, start, end) for chunk in segments]
+        chunks.append(self._slice((timestamps[order], values[order]), start, end))
+        return SeriesRange(chunks)
+
+    def _mapped_segments(self, key: Tuple[str, str]) -> List[Chunk]:
+        directory = self._directory(*key, create=False)
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            cached = self._segments.get(key)
+            if cached is not None and cached[0] == mtime:
+                self._segments.move_to_end(key)
+                return cached[1]
+        with self._locked(directory, fcntl.LOCK_SH):
+            # Listed under the lock, so a compaction is seen entirely or not at all
+            mtime = os.stat(directory).st_mtime_ns
+            segments = [self._load_segment(directory, sequence) for sequence in self._sequences(directory)]
+        with self._lock:
+            self._segments[key] = (mtime, segments)
+            self._segments.move_to_end(key)
+            while len(self._segments) > self.max_open_series:
+                self._segments.popitem(last=False)
+        return segments
+
+    @staticmethod
+    def _slice(chunk: Chunk, start: Optional[int], end: Optional[int]) -> Chunk:
+        timestamps, values = chunk
+        low = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+        high = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side="left"))
+        return timestamps[low:high], values[low:high]
+
+    @staticmethod
+    def _load_segment(directory: str, sequence: int) -> Chunk:
+        base = os.path.join(directory, f"{sequence:010d}")
+        return np.load(base + ".ts.npy", mmap_mode="r"), np.load(base + ".val.npy", mmap_mode="r")
+
+    # Layout
+
+    def _directory(self, user_id: str, sample_type: str, create: bool = True) -> str:
+        user_dir = hashlib.blake2b(user_id.encode(), digest_size=16).hexdigest()
+        directory = os.path.join(self.path, user_dir, sample_type)
+        if create:
+            os.makedirs(directory, exist_ok=True)
+        return directory
+
+    @staticmethod
+    def _sequences(directory: str) -> List[int]:
+        return sorted(int(match.group(1)) for name in os.listdir(directory) if (match := _SEGMENT.match(name)))
+
+    @staticmethod
+    @contextmanager
+    def _locked(directory: str, operation: int) -> Iterator[None]:
+        fd = os.open(os.path.join(directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, operation)
+            yield
+        finally:
+            os.close(fd)
+
+    def _count(self, stat: str, amount: int = 1):
+        # Flushes run in worker threads as well as on the event loop
+        with self._lock:
+            self.stats[stat] += amount
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "path": self.path,
+                "tails": len(self._tails),
+                "tail_samples": sum(len(tail.timestamps) for tail in self._tails.values()),
+                "open_series": len(self._segments),
+                **self.stats,
+            }
+
+
+_time_series_store: Optional[TimeSeriesStore] = None
+
+
+def get_time_series_store() -> TimeSeriesStore:
+    """Get the process-wide store, creating it from the environment on first use"""
+    global _time_series_store
+    if _time_series_store is None:
+        _time_series_store = TimeSeriesStore.from_env()
+    return _time_series_store
+
+
+def set_time_series_store(store: Optional[TimeSeriesStore]):
+    """Set the process-wide store"""
+    global _time_series_store
+    _time_series_store = store
@@ -0,0 +1,258 @@
+"""
+Idempotency keys for NGX Pulse Backend
+Remembers the response of a POST sent with an ``Idempotency-Key`` header, so a
+client retrying over a flaky network gets the first result back instead of
+running the writes (or the paid completion) again
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a different request"""
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    stored_at: float
+    status_code: int
+    body: bytes
+    headers: Dict[str, str]
+
+
+class IdempotencyStore:
+    """LRU of completed responses plus the executions still in flight
+
+    A request whose key is in flight waits for the first execution and then
+    replays its response. Only 2xx responses are kept: after an error the
+    next request with the key runs again. Responses live ``ttl`` seconds and
+    at most ``max_keys`` are kept in memory. With ``path`` they are also
+    written to a SQLite file, so they survive a restart and are shared by
+    the workers of a host; executions in flight are only known to their own
+    process.
+    """
+
+    def __init__(self, max_keys: int = 10_000, ttl: float = 86400.0, path: Optional[str] = None):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.path = path
+        self._completed: OrderedDict[str, StoredResponse] = OrderedDict()
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.stats = {"executed": 0, "replayed": 0, "waited": 0, "rejected": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency_responses ("
+                "key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, stored_at REAL NOT NULL, "
+                "status_code INTEGER NOT NULL, body BLOB NOT NULL, headers TEXT NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idempotency_responses_stored_at ON idempotency_responses (stored_at)"
+            )
+
+    @classmethod
+    def from_env(cls) -> "IdempotencyStore":
+        """Build the store from IDEMPOTENCY_* settings"""
+        return cls(
+            max_keys=max(1, int(os.environ.get("IDEMPOTENCY_MAX_KEYS") or 10_000)),
+            ttl=float(os.environ.get("IDEMPOTENCY_TTL") or 86400),
+            path=os.environ.get("IDEMPOTENCY_SQLITE_PATH") or None,
+        )
+
+    async def run(
+        self,
+        key: str,
+        fingerprint: str,
+        call: Callable[[], Awaitable[Response]],
+        storable: Optional[Callable[[Response], bool]] = None,
+    ) -> Tuple[Response, bool]:
+        """Run ``call`` once per key; returns (response, replayed)
+
+        2xx responses are stored unless ``storable`` returns False for them.
+        Raises ``IdempotencyKeyReused`` when the key belongs to a request
+        with another fingerprint.
+        """
+        while True:
+            if key not in self._completed and self._db is not None:
+                stored = await asyncio.to_thread(self._load, key)
+                if stored is not None and key not in self._completed:
+                    self._remember(key, stored)
+            # No awaits from here until the key is claimed
+            stored = self._get(key)
+            if stored is not None:
+                if stored.fingerprint != fingerprint:
+                    self.stats["rejected"] += 1
+                    raise IdempotencyKeyReused(key)
+                self.stats["replayed"] += 1
+                return Response(stored.body, stored.status_code, stored.headers), True
+            pending = self._in_flight.get(key)
+            if pending is None:
+                break
+            if pending[0] != fingerprint:
+                self.stats["rejected"] += 1
+                raise IdempotencyKeyReused(key)
+            self.stats["waited"] += 1
+            await asyncio.shield(pending[1])
+
+        done = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, done)
+        try:
+            self.stats["executed"] += 1
+            response = await call()
+            if 200 <= response.status_code < 300 and (storable is None or storable(response)):
+                headers = {name: value for name, value in response.headers.items() if name != "content-length"}
+                stored = StoredResponse(fingerprint, time.time(), response.status_code, bytes(response.body), headers)
+                self._remember(key, stored)
+                if self._db is not None:
+                    await asyncio.to_thread(self._save, key, stored)
+            return response, False
+        finally:
+            del self._in_flight[key]
+            done.set_result(None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._completed),
+            "in_flight": len(self._in_flight),
+            "persistent": self._db is not None,
+            **self.stats,
+        }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def _get(self, key: str) -> Optional[StoredResponse]:
+        stored = self._completed.get(key)
+        if stored is None:
+            return None
+        if stored.stored_at < time.time() - self.ttl:
+            del self._completed[key]
+            return None
+        self._completed.move_to_end(key)
+        return stored
+
+    def _remember(self, key: str, stored: StoredResponse):
+        self._completed[key] = stored
+        self._completed.move_to_end(key)
+        while len(self._completed) > self.max_keys:
+            self._completed.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[StoredResponse]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT fingerprint, stored_at, status_code, body, headers FROM idempotency_responses "
+                "WHERE key = ? AND stored_at >= ?",
+                (key, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        fingerprint, stored_at, status_code, body, headers = row
+        return StoredResponse(fingerprint, stored_at, status_code, body, json.loads(headers))
+
+    def _save(self, key: str, stored: StoredResponse):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO idempotency_responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stored.fingerprint, stored.stored_at, stored.status_code, stored.body, json.dumps(stored.headers)),
+            )
+            # Same bounds as memory: drop expired responses, then the oldest beyond max_keys
+            self._db.execute("DELETE FROM idempotency_responses WHERE stored_at < ?", (time.time() - self.ttl,))
+            self._db.execute(
+                "DELETE FROM idempotency_responses WHERE key IN ("
+                "SELECT key FROM idempotency_responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_keys,),
+            )
+
+
+async def idempotent_response(
+    request: Request,
+    scope: str,
+    key: Optional[str],
+    call: Callable[[], Awaitable[Any]],
+    replayable: Optional[Callable[[Any], bool]] = None,
+) -> Any:
+    """Run a route body once per ``Idempotency-Key`` within ``scope``
+
+    Without a key ``call`` simply runs. With one, its result is rendered
+    as JSON so it can be stored and replayed byte for byte; replays carry
+    ``Idempotent-Replayed: true``. Results ``replayable`` returns False for,
+    such as a partial failure, are not stored, so a retry runs again. The
+    key is bound to the request method, path, query and body: reusing it
+    for another request is a 422.
+    """
+    if key is None:
+        return await call()
+    if not key or len(key) > MAX_KEY_LENGTH or not key.isprintable():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} printable characters",
+        )
+
+    digest = hashlib.sha256()
+    for part in (request.method, request.url.path, request.url.query):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(await request.body())
+
+    not_replayable = set()
+
+    async def render() -> Response:
+        result = await call()
+        response = result if isinstance(result, Response) else JSONResponse(jsonable_encoder(result))
+        if replayable is not None and not replayable(result):
+            not_replayable.add(response)
+        return response
+
+    try:
+        response, replayed = await get_idempotency_store().run(
+            f"{scope}:{key}", digest.hexdigest(), render, storable=lambda response: response not in not_replayable
+        )
+    except IdempotencyKeyReused:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request",
+        )
+    if replayed:
+        logger.info("Replaying stored response for idempotency key in %s", scope)
+        response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+_idempotency_store: Optional[IdempotencyStore] = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Get the process-wide store, creating it from the environment on first use"""
+    global _idempotency_store
+    if _idempotency_store is None:
+        _idempotency_store = IdempotencyStore.from_env()
+    return _idempotency_store
+
+
+def set_idempotency_store(store: Optional[IdempotencyStore]):
+    """Set the process-wide store"""
+    global _idempotency_store
+    _idempotency_store = store
@@ -0,0 +1,227 @@
+"""
+Background ingestion queue for NGX Pulse Backend
+A bounded in-process queue of write chunks drained by a pool of worker tasks,
+so a sync can be acknowledged before its rows reach the database
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A chunk of a job: (kind, offset, count, write), where ``write`` stores the
+# chunk and returns the rows written
+JobChunk = Tuple[str, int, int, Callable[[], Awaitable[int]]]
+
+
+class IngestionQueueFull(Exception):
+    """The queue has no room for every chunk of a job"""
+
+    def __init__(self, queued: int, capacity: int):
+        super().__init__(f"Ingestion queue full ({queued}/{capacity} chunks)")
+        self.queued = queued
+        self.capacity = capacity
+
+
+class IngestionJobTooLarge(Exception):
+    """The job has more chunks than the queue can ever hold"""
+
+    def __init__(self, chunks: int, capacity: int):
+        super().__init__(f"Job of {chunks} chunks exceeds the ingestion queue capacity of {capacity}")
+        self.chunks = chunks
+        self.capacity = capacity
+
+
+class IngestionJob:
+    """Progress of one queued sync"""
+
+    def __init__(self, user_id: str, received: Dict[str, int], **details: Any):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.received = dict(received)
+        self.imported = {kind: 0 for kind in received}
+        self.errors: List[Dict[str, Any]] = []
+        self.chunks_total = 0
+        self.chunks_done = 0
+        # Free-form results, e.g. the sync anchors set by ``on_complete``
+        self.details: Dict[str, Any] = dict(details)
+        self.on_complete: Optional[Callable[["IngestionJob"], Awaitable[None]]] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def progress(self) -> float:
+        return self.chunks_done / self.chunks_total if self.chunks_total else 1.0
+
+
+class IngestionQueue:
+    """Bounded queue of job chunks drained by ``workers`` tasks
+
+    ``submit`` either queues every chunk of a job or raises
+    ``IngestionQueueFull``, so a job is never half accepted; a job larger
+    than the whole queue raises ``IngestionJobTooLarge`` instead, since
+    retrying it later cannot help. Finished jobs
+    are kept for ``job_ttl`` seconds (at most ``max_jobs``) for status polls.
+    Jobs live in this process only: a restart loses queued work, which the
+    client recovers by syncing again from its anchors.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queued_chunks: int = 1000,
+        job_ttl: float = 3600.0,
+        max_jobs: int = 10_000,
+    ):
+        self.workers = workers
+        self.max_queued_chunks = max_queued_chunks
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+        self.stats = {"jobs_submitted": 0, "jobs_rejected": 0, "chunks_written": 0, "chunks_failed": 0}
+
+    @classmethod
+    def from_env(cls) -> "IngestionQueue":
+        """Build the queue from HEALTHKIT_QUEUE_* settings"""
+        return cls(
+            workers=max(1, int(os.environ.get("HEALTHKIT_QUEUE_WORKERS") or 4)),
+            max_queued_chunks=max(1, int(os.environ.get("HEALTHKIT_QUEUE_MAX_CHUNKS") or 1000)),
+            job_ttl=float(os.environ.get("HEALTHKIT_QUEUE_JOB_TTL") or 3600),
+        )
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Start the workers on the running event loop"""
+        if self.started:
+            return
+        self._queue = asyncio.Queue(self.max_queued_chunks)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"ingestion-worker-{index}")
+            for index in range(self.workers)
+        ]
+
+    async def stop(self, timeout: float = 30.0):
+        """Give queued chunks ``timeout`` seconds to finish, then stop the workers"""
+        if not self.started:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping ingestion workers with %d chunks still queued", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job: IngestionJob, chunks: Sequence[JobChunk]) -> IngestionJob:
+        """Queue every chunk of ``job`` or raise ``IngestionQueueFull``"""
+        if len(chunks) > self.max_queued_chunks:
+            self.stats["jobs_rejected"] += 1
+            raise IngestionJobTooLarge(len(chunks), self.max_queued_chunks)
+        self.start()
+        queued = self._queue.qsize()
+        if queued + len(chunks) > self.max_queued_chunks:
+            self.stats["jobs_rejected"] += 1
+            raise IngestionQueueFull(queued, self.max_queued_chunks)
+
+        self._remember(job)
+        self.stats["jobs_submitted"] += 1
+        job.chunks_total = len(chunks)
+        if not chunks:
+            self._queue.put_nowait((job, None))
+        for chunk in chunks:
+            self._queue.put_nowait((job, chunk))
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        self._expire()
+        return self._jobs.get(job_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._tasks),
+            "queued_chunks": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued_chunks": self.max_queued_chunks,
+            "jobs": len(self._jobs),
+            **self.stats,
+        }
+
+    def _remember(self, job: IngestionJob):
+        self._expire()
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+
+    def _expire(self):
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.done and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job, chunk = await self._queue.get()
+            try:
+                if chunk is not None:
+                    await self._write(job, chunk)
+                if job.chunks_done >= job.chunks_total and not job.done:
+                    await self._finish(job)
+            except Exception:
+                logger.exception("Ingestion worker failed on job %s", job.id)
+            finally:
+                self._queue.task_done()
+
+    async def _write(self, job: IngestionJob, chunk: JobChunk):
+        kind, offset, count, write = chunk
+        job.status = "running"
+        try:
+            written = await write()
+            job.imported[kind] += written
+            self.stats["chunks_written"] += 1
+        except Exception as e:
+            logger.error("Job %s: error writing %s chunk at offset %d (%d records): %s", job.id, kind, offset, count, e)
+            job.errors.append({"kind": kind, "offset": offset, "count": count, "error": str(e)})
+            self.stats["chunks_failed"] += 1
+        finally:
+            job.chunks_done += 1
+
+    async def _finish(self, job: IngestionJob):
+        try:
+            if job.on_complete is not None:
+                await job.on_complete(job)
+        finally:
+            job.status = "completed_with_errors" if job.errors else "completed"
+            job.finished_at = time.time()
+            logger.info("Ingestion job %s %s: imported %s", job.id, job.status, job.imported)
+
+
+_ingestion_queue: Optional[IngestionQueue] = None
+
+
+def get_ingestion_queue() -> IngestionQueue:
+    """Get the process-wide queue, creating it from the environment on first use"""
+    global _ingestion_queue
+    if _ingestion_queue is None:
+        _ingestion_queue = IngestionQueue.from_env()
+    return _ingestion_queue
+
+
+def set_ingestion_queue(queue: Optional[IngestionQueue]):
+    """Set the process-wide queue"""
+    global _ingestion_queue
+    _ingestion_queue = queue
@@ -3,9 +3,25 @@ Middleware modules for NGX Pulse Backend
 """
 
 from .auth_mw import AuthConfig, User, get_authorized_user
+from .pipeline import PipelineContext, PipelineStage, SecurityPipelineMiddleware
 from .error_handler import GlobalErrorHandler, ErrorResponse, get_error_handler, set_error_handler
-from .rate_limiter import RateLimitingMiddleware, RateLimitRule, get_rate_limiter, set_rate_limiter
-from .security_headers import SecurityHeadersMiddleware, CORSSecurityMiddleware, InputSanitizationMiddleware
+from .rate_limiter import (
+    RateLimitingMiddleware,
+    RateLimitRule,
+    RateLimitStore,
+    SlidingWindowRateLimitStore,
+    create_rate_limit_store,
+    get_rate_limiter,
+    set_rate_limiter,
+)
+from .shared_rate_limit_store import SharedMemoryRateLimitStore
+from .security_headers import (
+    SecurityHeadersMiddleware,
+    CORSSecurityMiddleware,
+    InputSanitizationMiddleware,
+    get_input_sanitizer,
+    set_input_sanitizer,
+)
 
 __all__ = [
     "GlobalErrorHandler",
@@ -17,9 +33,18 @@ __all__ = [
     "set_error_handler",
     "RateLimitingMiddleware",
     "RateLimitRule",
+    "RateLimitStore",
+    "SlidingWindowRateLimitStore",
+    "SharedMemoryRateLimitStore",
+    "create_rate_limit_store",
     "get_rate_limiter", 
     "set_rate_limiter",
     "SecurityHeadersMiddleware",
     "CORSSecurityMiddleware",
-    "InputSanitizationMiddleware"
+    "InputSanitizationMiddleware",
+    "get_input_sanitizer",
+    "set_input_sanitizer",
+    "PipelineContext",
+    "PipelineStage",
+    "SecurityPipelineMiddleware"
 ]
@@ -1,14 +1,18 @@
-import functools
+import hashlib
 import logging
+import threading
+import time
+from collections import OrderedDict
 from http import HTTPStatus
 from typing import Annotated, Callable
 import jwt
 from fastapi import Depends, HTTPException, WebSocket, WebSocketException, status
 from fastapi.requests import HTTPConnection
-from jwt import PyJWKClient
 from pydantic import BaseModel
 from starlette.requests import Request
 
+from .jwks import get_jwks_manager
+
 logger = logging.getLogger(__name__)
 
 
@@ -78,15 +82,9 @@ def get_authorized_user(
         )
 
 
-@functools.cache
-def get_jwks_client(url: str):
-    """Reuse client cached by its url, client caches keys by default."""
-    return PyJWKClient(url, cache_keys=True)
-
-
 def get_signing_key(url: str, token: str) -> tuple[str, str]:
-    client = get_jwks_client(url)
-    signing_key = client.get_signing_key_from_jwt(token)
+    # Keys are indexed by kid and refreshed in the background, see jwks.py
+    signing_key = get_jwks_manager(url).get_signing_key_from_jwt(token)
     key = signing_key.key
     alg = signing_key.algorithm_name
     if alg != "RS256":
@@ -94,6 +92,82 @@ def get_signing_key(url: str, token: str) -> tuple[str, str]:
     return (key, alg)
 
 
+class VerifiedTokenCache:
+    """LRU cache of users from tokens that already passed verification.
+
+    Entries are keyed by a SHA-256 of the token (plus audience and JWKS url)
+    and expire ``skew_seconds`` before the token's ``exp`` claim, so a
+    repeat request with the same token skips the key lookup and signature
+    check. Tokens without ``exp`` are never cached.
+    """
+
+    def __init__(self, maxsize: int = 4096, skew_seconds: float = 30.0):
+        self.maxsize = maxsize
+        self.skew_seconds = skew_seconds
+        self._entries: OrderedDict[bytes, tuple[User, float]] = OrderedDict()
+        # Sync dependencies run in the threadpool
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def cache_key(token: str, *context: str) -> bytes:
+        """Hash the token together with what it was verified against"""
+        material = "\0".join((*context, token))
+        return hashlib.sha256(material.encode()).digest()
+
+    def get(self, key: bytes) -> User | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                user, expires_at = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return user
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: bytes, user: User, exp: float | None) -> None:
+        if exp is None:
+            return
+        expires_at = exp - self.skew_seconds
+        if expires_at <= time.time():
+            return
+        with self._lock:
+            self._entries[key] = (user, expires_at)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: bytes) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> dict:
+        """Get verified-token cache statistics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+verified_token_cache = VerifiedTokenCache()
+
+
 def authorize_websocket(
     request: WebSocket,
     auth_config: AuthConfig,
@@ -141,6 +215,11 @@ def authorize_token(
     token: str,
     auth_config: AuthConfig,
 ) -> User | None:
+    cache_key = VerifiedTokenCache.cache_key(token, auth_config.audience, auth_config.jwks_url)
+    cached_user = verified_token_cache.get(cache_key)
+    if cached_user is not None:
+        return cached_user
+
     # Audience and jwks url to get signing key from based on the users config
     jwks_urls = [(auth_config.audience, auth_config.jwks_url)]
 
@@ -166,6 +245,7 @@ def authorize_token(
     try:
         user = User.model_validate(payload)
         logger.debug("User %s authenticated", user.sub)
+        verified_token_cache.put(cache_key, user, payload.get("exp"))
         return user
     except Exception as e:
         logger.error("Failed to parse token payload %s", e)
@@ -0,0 +1,108 @@
+"""
+Request body decoding for NGX Pulse Backend
+Streaming decoders for ``Content-Encoding: gzip`` and ``zstd`` request bodies
+that never produce more than a bounded amount of output per step, so size and
+compression ratio limits are checked before a decompression bomb expands
+"""
+
+import logging
+import zlib
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+        logger.info("backports.zstd is not installed, zstd request bodies are not accepted")
+
+# Largest piece of decoded output a decode step may produce
+DECODE_CHUNK_SIZE = 64 * 1024
+
+
+class InvalidEncodedBody(ValueError):
+    """The body is not valid for its declared Content-Encoding"""
+
+
+class BodyDecoder(ABC):
+    """Incremental decoder for one request body"""
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        """Decode the next piece of the body, yielding bounded output pieces"""
+
+    @abstractmethod
+    def finish(self) -> Iterator[bytes]:
+        """Flush remaining output; raises if the body was truncated"""
+
+
+class GzipDecoder(BodyDecoder):
+    """gzip, including bodies made of several concatenated members"""
+
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._started = False
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        try:
+            while data:
+                if self._decompressor.eof:
+                    # Next gzip member
+                    self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                self._started = True
+                output = self._decompressor.decompress(data, DECODE_CHUNK_SIZE)
+                if self._decompressor.eof:
+                    data = self._decompressor.unused_data
+                else:
+                    data = self._decompressor.unconsumed_tail
+                if output:
+                    yield output
+        except zlib.error as e:
+            raise InvalidEncodedBody(f"Invalid gzip body: {e}") from e
+
+    def finish(self) -> Iterator[bytes]:
+        if self._started and not self._decompressor.eof:
+            raise InvalidEncodedBody("Truncated gzip body")
+        yield from ()
+
+
+class ZstdDecoder(BodyDecoder):
+    """zstd, including bodies made of several frames"""
+
+    def __init__(self):
+        self._decompressor = zstd.ZstdDecompressor()
+        self._started = False
+
+    def decode(self, data: bytes) -> Iterator[bytes]:
+        try:
+            # Whole chunks go in; the decompressor keeps what it has not
+            # expanded yet and hands it out DECODE_CHUNK_SIZE at a time
+            while data or not (self._decompressor.eof or self._decompressor.needs_input):
+                if self._decompressor.eof:
+                    # Next frame
+                    self._decompressor = zstd.ZstdDecompressor()
+                self._started = True
+                output = self._decompressor.decompress(data, DECODE_CHUNK_SIZE)
+                data = self._decompressor.unused_data if self._decompressor.eof else b""
+                if output:
+                    yield output
+        except (zstd.ZstdError, EOFError) as e:
+            raise InvalidEncodedBody(f"Invalid zstd body: {e}") from e
+
+    def finish(self) -> Iterator[bytes]:
+        if self._started and not self._decompressor.eof:
+            raise InvalidEncodedBody("Truncated zstd body")
+        yield from ()
+
+
+def supported_encodings() -> Dict[str, Callable[[], BodyDecoder]]:
+    """Decoder factory for each accepted Content-Encoding"""
+    decoders: Dict[str, Callable[[], BodyDecoder]] = {"gzip": GzipDecoder, "x-gzip": GzipDecoder}
+    if zstd is not None:
+        decoders["zstd"] = ZstdDecoder
+    return decoders
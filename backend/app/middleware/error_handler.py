@@ -10,8 +10,10 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 from fastapi import Request, HTTPException
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message
+
+from .pipeline import PipelineContext, PipelineStage
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -55,10 +57,10 @@ class ErrorResponse:
             
         return response
 
-class GlobalErrorHandler(BaseHTTPMiddleware):
+class GlobalErrorHandler(PipelineStage):
     """Global error handling middleware"""
     
-    def __init__(self, app: ASGIApp):
+    def __init__(self, app: Optional[ASGIApp] = None):
         super().__init__(app)
         self.error_stats = {
             "total_errors": 0,
@@ -66,28 +68,28 @@ class GlobalErrorHandler(BaseHTTPMiddleware):
             "last_errors": []
         }
     
-    async def dispatch(self, request: Request, call_next):
+    async def on_request(self, ctx: PipelineContext) -> None:
+        request = ctx.request
         trace_id = request.headers.get("X-Trace-ID") or self._generate_trace_id()
         
-        try:
-            # Add trace ID to request state
-            request.state.trace_id = trace_id
-            
-            # Process request
-            response = await call_next(request)
-            
-            # Add trace ID to response headers
-            response.headers["X-Trace-ID"] = trace_id
-            
-            return response
-            
-        except HTTPException as exc:
+        # Add trace ID to request state
+        request.state.trace_id = trace_id
+        ctx.data["trace_id"] = trace_id
+        return None
+    
+    def on_response_start(self, ctx: PipelineContext, message: Message) -> None:
+        # Add trace ID to response headers
+        MutableHeaders(scope=message)["X-Trace-ID"] = ctx.data["trace_id"]
+    
+    async def on_error(self, ctx: PipelineContext, exc: Exception) -> JSONResponse:
+        trace_id = ctx.data["trace_id"]
+        
+        if isinstance(exc, HTTPException):
             # Handle known HTTP exceptions
-            return await self._handle_http_exception(exc, trace_id, request)
-            
-        except Exception as exc:
-            # Handle unexpected exceptions
-            return await self._handle_unexpected_exception(exc, trace_id, request)
+            return await self._handle_http_exception(exc, trace_id, ctx.request)
+        
+        # Handle unexpected exceptions
+        return await self._handle_unexpected_exception(exc, trace_id, ctx.request)
     
     def _generate_trace_id(self) -> str:
         """Generate a unique trace ID"""
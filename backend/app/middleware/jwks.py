@@ -0,0 +1,191 @@
+"""
+JWKS key management for NGX Pulse Backend
+Keeps signing keys indexed by ``kid`` in memory, prefetched at startup and
+refreshed in the background, so verifying a token signed with a known key
+never waits on an HTTP fetch
+"""
+
+import functools
+import json
+import logging
+import re
+import threading
+import time
+import urllib.request
+from typing import Any, Dict, Optional, Tuple
+
+import jwt
+from jwt import PyJWK, PyJWKSet
+from jwt.exceptions import PyJWKClientError
+
+logger = logging.getLogger(__name__)
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class JWKSKeyManager:
+    """Signing keys of a JWKS url, indexed by ``kid``.
+
+    The key set expires after the response's Cache-Control max-age (or
+    ``default_ttl``). The refresher thread started by ``start`` fetches it
+    ``refresh_ahead`` seconds before expiry; lookups keep serving the
+    current keys until a refresh lands (stale-while-revalidate), for at most
+    ``max_stale`` seconds past expiry, and only start a refresh themselves
+    when none was attempted for ``min_refetch_interval`` seconds. An unknown
+    ``kid`` fetches synchronously; concurrent callers share a single fetch,
+    and such fetches are throttled the same way so tokens with made-up kids
+    or a failing JWKS endpoint cannot turn every request into a fetch. Any url ``urllib`` can open works, including file://.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        default_ttl: float = 3600.0,
+        refresh_ahead: float = 300.0,
+        max_stale: float = 86400.0,
+        min_refetch_interval: float = 30.0,
+        timeout: float = 5.0,
+    ):
+        self.url = url
+        self.default_ttl = default_ttl
+        self.refresh_ahead = refresh_ahead
+        self.max_stale = max_stale
+        self.min_refetch_interval = min_refetch_interval
+        self.timeout = timeout
+
+        self._keys: Dict[str, PyJWK] = {}
+        self._expires_at = 0.0  # time.monotonic()
+        self._last_fetch = float("-inf")
+        # Bumped after every fetch attempt; callers that waited on the fetch
+        # lock compare it to see whether someone else already fetched
+        self._generation = 0
+        self._fetch_lock = threading.Lock()
+        self._fallback_lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    def _fetch(self) -> Tuple[Dict[str, Any], float]:
+        """Download the key set and return it with its time to live"""
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            body = json.load(response)
+            cache_control = response.headers.get("Cache-Control") or ""
+        match = _MAX_AGE.search(cache_control)
+        return body, float(match.group(1)) if match else self.default_ttl
+
+    @staticmethod
+    def _index(body: Dict[str, Any]) -> Dict[str, PyJWK]:
+        return {
+            jwk.key_id: jwk
+            for jwk in PyJWKSet.from_dict(body).keys
+            if jwk.key_id and jwk.public_key_use in (None, "sig")
+        }
+
+    def refresh(self, seen_generation: Optional[int] = None) -> None:
+        """Fetch the key set, unless another caller fetched while we waited"""
+        if seen_generation is None:
+            seen_generation = self._generation
+        with self._fetch_lock:
+            if self._generation != seen_generation:
+                return
+            self._last_fetch = time.monotonic()
+            self.fetches += 1
+            try:
+                body, ttl = self._fetch()
+                self._keys = self._index(body)
+                self._expires_at = time.monotonic() + ttl
+            except Exception:
+                self.fetch_errors += 1
+                raise
+            finally:
+                self._generation += 1
+
+    def _refresh_in_background(self) -> None:
+        # Fallback for when the refresher has not caught up (or is not
+        # running); _last_fetch is claimed up front so concurrent lookups,
+        # and lookups while fetches keep failing, start one at most
+        with self._fallback_lock:
+            now = time.monotonic()
+            if self._fetch_lock.locked() or now - self._last_fetch < self.min_refetch_interval:
+                return
+            self._last_fetch = now
+        threading.Thread(
+            target=self._background_refresh, args=(self._generation,), name="jwks-refresh", daemon=True
+        ).start()
+
+    def _background_refresh(self, generation: int) -> None:
+        try:
+            self.refresh(generation)
+        except Exception as e:
+            logger.warning("Background JWKS refresh from %s failed: %s", self.url, e)
+
+    def get_signing_key(self, kid: str) -> PyJWK:
+        """Return the key for ``kid``, fetching only when it is unknown or too stale"""
+        now = time.monotonic()
+        key = self._keys.get(kid)
+        if key is not None:
+            if now < self._expires_at - self.refresh_ahead:
+                return key
+            if now < self._expires_at + self.max_stale:
+                self._refresh_in_background()
+                return key
+        elif self._keys and now - self._last_fetch < self.min_refetch_interval:
+            raise PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+
+        try:
+            self.refresh(self._generation)
+        except Exception as e:
+            raise PyJWKClientError(f"Failed to fetch JWKS from {self.url}: {e}") from e
+
+        key = self._keys.get(kid)
+        if key is None:
+            raise PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+        return key
+
+    def get_signing_key_from_jwt(self, token: str) -> PyJWK:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if not kid:
+            raise PyJWKClientError("Token has no kid header")
+        return self.get_signing_key(kid)
+
+    def start(self) -> None:
+        """Prefetch the key set and keep it refreshed ahead of expiry"""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("JWKS prefetch from %s failed: %s", self.url, e)
+
+        if self._refresher is None:
+            self._stop.clear()
+            self._refresher = threading.Thread(target=self._run, name="jwks-refresher", daemon=True)
+            self._refresher.start()
+
+    def stop(self) -> None:
+        """Stop the background refresher"""
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=1)
+            self._refresher = None
+
+    def _run(self) -> None:
+        while True:
+            delay = max(self.min_refetch_interval, self._expires_at - self.refresh_ahead - time.monotonic())
+            if self._stop.wait(delay):
+                return
+            self._background_refresh(self._generation)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get JWKS key manager statistics"""
+        return {
+            "keys": len(self._keys),
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors,
+            "expires_in": self._expires_at - time.monotonic() if self._keys else None,
+        }
+
+
+@functools.cache
+def get_jwks_manager(url: str) -> JWKSKeyManager:
+    """Reuse the key manager of a JWKS url"""
+    return JWKSKeyManager(url)
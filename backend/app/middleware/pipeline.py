@@ -0,0 +1,161 @@
+"""
+Pure-ASGI middleware pipeline for NGX Pulse Backend
+Runs the security stages as ordered hooks on the raw ASGI scope/send so a
+request pays for a single middleware hop instead of one per stage
+"""
+
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+ResponseHook = Callable[["PipelineContext", Message], None]
+
+
+class PipelineContext:
+    """Per-request state shared by the stages of a pipeline"""
+
+    __slots__ = ("scope", "receive", "request", "data", "response_override")
+
+    def __init__(self, scope: Scope, receive: Receive):
+        self.scope = scope
+        # Stages may wrap ``receive`` (e.g. to guard the request body); the
+        # wrapped channel is what the downstream app reads from.
+        self.receive = receive
+        self.request = Request(scope, receive)
+        self.data: Dict[str, Any] = {}
+        self.response_override: Optional[Response] = None
+
+    def override_response(self, response: Response) -> None:
+        """Send ``response`` instead of whatever the app responds with.
+
+        Meant for stages that detect a problem while the app is running,
+        e.g. from a wrapped ``receive``, after ``on_request`` has returned.
+        """
+        self.response_override = response
+
+
+class PipelineStage:
+    """Base class for a middleware stage.
+
+    A stage can short-circuit the request from ``on_request``, edit the
+    ``http.response.start`` message in ``on_response_start`` and turn an
+    exception raised further down into a response in ``on_error``. Stages
+    can still be registered on their own with ``app.add_middleware``.
+    """
+
+    def __init__(self, app: Optional[ASGIApp] = None):
+        self.app = app
+        self._pipeline = SecurityPipelineMiddleware(app, [self]) if app is not None else None
+
+    async def on_request(self, ctx: PipelineContext) -> Optional[Response]:
+        """Inspect the request; return a response to stop the pipeline"""
+        return None
+
+    def on_response_start(self, ctx: PipelineContext, message: Message) -> None:
+        """Edit the ``http.response.start`` message before it is sent"""
+
+    async def on_error(self, ctx: PipelineContext, exc: Exception) -> Optional[Response]:
+        """Handle an exception raised by the inner stages or the app"""
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self._pipeline is None:
+            raise RuntimeError(f"{type(self).__name__} was created without an app to wrap")
+        await self._pipeline(scope, receive, send)
+
+
+def _overrides(stage: PipelineStage, hook: str) -> bool:
+    return getattr(type(stage), hook) is not getattr(PipelineStage, hook)
+
+
+class SecurityPipelineMiddleware:
+    """Single ASGI middleware running an ordered list of stages.
+
+    Stages are given outermost first, i.e. in the order they would have
+    wrapped the app as separate middlewares. A response produced by a stage
+    only passes through the response hooks of the stages outside of it.
+    """
+
+    def __init__(self, app: ASGIApp, stages: Sequence[PipelineStage]):
+        self.app = app
+        self.stages: Tuple[PipelineStage, ...] = tuple(stages)
+
+        hooks = [
+            stage.on_response_start if _overrides(stage, "on_response_start") else None
+            for stage in self.stages
+        ]
+        # _response_hooks[depth] holds the hooks of stages[:depth], innermost first
+        self._response_hooks: List[Tuple[ResponseHook, ...]] = [
+            tuple(hook for hook in reversed(hooks[:depth]) if hook is not None)
+            for depth in range(len(self.stages) + 1)
+        ]
+        self._error_stages: Tuple[Tuple[int, PipelineStage], ...] = tuple(
+            (index, stage)
+            for index, stage in reversed(list(enumerate(self.stages)))
+            if _overrides(stage, "on_error")
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        ctx = PipelineContext(scope, receive)
+
+        for index, stage in enumerate(self.stages):
+            response = await stage.on_request(ctx)
+            if response is not None:
+                await response(scope, ctx.receive, self._hooked_send(ctx, send, index))
+                return
+
+        hooks = self._response_hooks[len(self.stages)]
+        response_started = False
+        response_replaced = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started, response_replaced
+            if response_replaced:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+                if ctx.response_override is not None:
+                    response_replaced = True
+                    await ctx.response_override(scope, ctx.receive, self._hooked_send(ctx, send, len(self.stages)))
+                    return
+                for hook in hooks:
+                    hook(ctx, message)
+            await send(message)
+
+        try:
+            await self.app(scope, ctx.receive, send_wrapper)
+        except Exception as exc:
+            if response_started:
+                raise
+            if ctx.response_override is not None:
+                await ctx.response_override(scope, ctx.receive, self._hooked_send(ctx, send, len(self.stages)))
+                return
+            for index, stage in self._error_stages:
+                response = await stage.on_error(ctx, exc)
+                if response is not None:
+                    await response(scope, ctx.receive, self._hooked_send(ctx, send, index))
+                    return
+            raise
+
+    def _hooked_send(self, ctx: PipelineContext, send: Send, depth: int) -> Send:
+        """Wrap ``send`` with the response hooks of the stages outside ``depth``"""
+        hooks = self._response_hooks[depth]
+        if not hooks:
+            return send
+
+        async def hooked_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                for hook in hooks:
+                    hook(ctx, message)
+            await send(message)
+
+        return hooked_send
@@ -3,51 +3,111 @@ Rate limiting middleware for NGX Pulse Backend
 Provides rate limiting and abuse protection for API endpoints
 """
 
+import math
+import os
 import time
 import logging
-from typing import Dict, Optional, Any, List
+from typing import Dict, Iterable, Optional, Any, List, NamedTuple
 from datetime import datetime, timedelta
-from collections import defaultdict, deque
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from collections import OrderedDict, defaultdict, deque
+from contextlib import nullcontext
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message
 from starlette.responses import JSONResponse
 
+from .pipeline import PipelineContext, PipelineStage
+from .shared_rate_limit_store import SharedMemoryRateLimitStore
+
 logger = logging.getLogger(__name__)
 
-class RateLimitStore:
-    """In-memory rate limit store (in production, use Redis)"""
+class InProcessStateMixin:
+    """GCRA theoretical arrival times (TAT) and IP blocks for stores owned by one worker"""
     
     def __init__(self):
+        self._tats: Dict[str, float] = {}
+        self._last_tat_cleanup = time.time()
+        self._blocked_ips: Dict[str, float] = {}  # IP -> blocked_until_timestamp
+    
+    def locked(self, keys: Iterable[str]):
+        """No-op: one event loop never interleaves a check with its record"""
+        return nullcontext()
+    
+    def get_tat(self, key: str, current_time: float) -> float:
+        """Get the theoretical arrival time for the key (now if it has no state)"""
+        if current_time - self._last_tat_cleanup >= 60:
+            # A TAT in the past means a full bucket, which needs no state
+            self._tats = {k: tat for k, tat in self._tats.items() if tat > current_time}
+            self._last_tat_cleanup = current_time
+        return self._tats.get(key, current_time)
+    
+    def set_tat(self, key: str, tat: float):
+        """Store the theoretical arrival time for the key"""
+        self._tats[key] = tat
+    
+    def block(self, ip: str, blocked_until: float):
+        """Block the IP until ``blocked_until``"""
+        self._blocked_ips[ip] = blocked_until
+    
+    def get_blocked_until(self, ip: str, current_time: float) -> Optional[float]:
+        """Return when the IP's block ends, or None if it is not blocked"""
+        blocked_until = self._blocked_ips.get(ip)
+        if blocked_until is not None and current_time >= blocked_until:
+            del self._blocked_ips[ip]
+            return None
+        return blocked_until
+    
+    def blocked_count(self) -> int:
+        """Number of blocked IPs"""
+        return len(self._blocked_ips)
+
+class RateLimitStore(InProcessStateMixin):
+    """In-memory rate limit store (in production, use Redis)
+    
+    Keeps every request timestamp, so counts are exact but memory grows
+    with the number of requests inside the window.
+    """
+    
+    def __init__(self):
+        super().__init__()
         self._store: Dict[str, deque] = defaultdict(deque)
+        self._windows: Dict[str, int] = {}  # key -> window used for that key
         self._cleanup_interval = 60  # seconds
         self._last_cleanup = time.time()
     
+    def __len__(self) -> int:
+        return len(self._store)
+    
     def _cleanup_expired(self, current_time: float, window_seconds: int):
         """Remove expired entries to prevent memory leaks"""
         if current_time - self._last_cleanup < self._cleanup_interval:
             return
             
-        cutoff_time = current_time - window_seconds
         for key in list(self._store.keys()):
-            # Remove old entries
+            # Remove old entries, using the window of the rule that owns the key
+            cutoff_time = current_time - self._windows.get(key, window_seconds)
             while self._store[key] and self._store[key][0] < cutoff_time:
                 self._store[key].popleft()
             
             # Remove empty queues
             if not self._store[key]:
                 del self._store[key]
+                self._windows.pop(key, None)
         
         self._last_cleanup = current_time
     
-    def add_request(self, key: str, current_time: float):
+    def add_request(self, key: str, current_time: float, window_seconds: Optional[int] = None):
         """Add a request timestamp for the given key"""
         self._store[key].append(current_time)
+        if window_seconds is not None:
+            self._windows[key] = window_seconds
     
     def get_request_count(self, key: str, window_seconds: int, current_time: float) -> int:
         """Get the number of requests within the time window"""
         self._cleanup_expired(current_time, window_seconds)
         
+        if key not in self._store:
+            return 0
+        
         cutoff_time = current_time - window_seconds
         requests = self._store[key]
         
@@ -61,6 +121,88 @@ class RateLimitStore:
         
         return count
 
+class SlidingWindowRateLimitStore(InProcessStateMixin):
+    """Constant-memory rate limit store using sliding-window counters
+    
+    Each key keeps two fixed-window counters; the count over the sliding
+    window is the current counter plus the previous one weighted by how much
+    of the previous window still overlaps. Counts are approximate (they
+    assume requests were spread evenly over the previous window) but every
+    check is O(1) in time and memory.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        # key -> [window_seconds, window_index, current_count, previous_count]
+        self._store: Dict[str, List[int]] = {}
+        self._cleanup_interval = 60  # seconds
+        self._last_cleanup = time.time()
+    
+    def __len__(self) -> int:
+        return len(self._store)
+    
+    def _cleanup_expired(self, current_time: float):
+        """Drop keys whose counters no longer overlap the sliding window"""
+        if current_time - self._last_cleanup < self._cleanup_interval:
+            return
+        
+        for key, entry in list(self._store.items()):
+            if int(current_time // entry[0]) - entry[1] > 1:
+                del self._store[key]
+        
+        self._last_cleanup = current_time
+    
+    def _current_entry(self, key: str, window_seconds: int, current_time: float) -> Optional[List[int]]:
+        """Return the entry for ``key`` rolled forward to the current window"""
+        entry = self._store.get(key)
+        if entry is None:
+            return None
+        
+        window_index = int(current_time // window_seconds)
+        if entry[1] != window_index:
+            entry[3] = entry[2] if entry[1] == window_index - 1 else 0
+            entry[2] = 0
+            entry[1] = window_index
+        return entry
+    
+    def add_request(self, key: str, current_time: float, window_seconds: Optional[int] = None):
+        """Count a request for the given key"""
+        if window_seconds is None:
+            raise ValueError("SlidingWindowRateLimitStore needs the rule window to record a request")
+        
+        entry = self._current_entry(key, window_seconds, current_time)
+        if entry is None:
+            self._store[key] = [window_seconds, int(current_time // window_seconds), 1, 0]
+        else:
+            entry[2] += 1
+    
+    def get_request_count(self, key: str, window_seconds: int, current_time: float) -> int:
+        """Get the estimated number of requests within the sliding window"""
+        self._cleanup_expired(current_time)
+        
+        entry = self._current_entry(key, window_seconds, current_time)
+        if entry is None:
+            return 0
+        
+        elapsed = (current_time % window_seconds) / window_seconds
+        return int(entry[2] + entry[3] * (1.0 - elapsed))
+
+RATE_LIMIT_STORES = {
+    "exact": RateLimitStore,
+    "sliding_window": SlidingWindowRateLimitStore,
+    "shared_memory": SharedMemoryRateLimitStore,
+}
+
+def create_rate_limit_store(kind: Optional[str] = None):
+    """Create a rate limit store by name (defaults to RATE_LIMIT_STORE or "exact")"""
+    kind = kind or os.getenv("RATE_LIMIT_STORE", "exact")
+    try:
+        return RATE_LIMIT_STORES[kind]()
+    except KeyError:
+        raise ValueError(
+            f"Unknown rate limit store '{kind}', expected one of: {', '.join(RATE_LIMIT_STORES)}"
+        ) from None
+
 class RateLimitRule:
     """Rate limiting rule configuration"""
     
@@ -73,8 +215,11 @@ class RateLimitRule:
         paths: Optional[List[str]] = None,
         methods: Optional[List[str]] = None,
         exempt_ips: Optional[List[str]] = None,
-        burst_limit: Optional[int] = None
+        burst_limit: Optional[int] = None,
+        algorithm: str = "window"  # "window", "gcra"
     ):
+        if algorithm not in ("window", "gcra"):
+            raise ValueError(f"Unknown rate limit algorithm '{algorithm}'")
         self.name = name
         self.limit = limit
         self.window_seconds = window_seconds
@@ -83,46 +228,92 @@ class RateLimitRule:
         self.methods = methods or ["GET", "POST", "PUT", "DELETE", "PATCH"]
         self.exempt_ips = exempt_ips or []
         self.burst_limit = burst_limit or limit
+        self.algorithm = algorithm
+        # GCRA: one request is earned every emission interval, up to burst_limit
+        self.emission_interval = window_seconds / limit
     
-    def applies_to(self, request: Request) -> bool:
-        """Check if this rule applies to the request"""
-        # Check method
-        if request.method not in self.methods:
-            return False
-        
-        # Check path
-        if self.paths:
-            return any(request.url.path.startswith(path) for path in self.paths)
+    def key_for(self, identity: str) -> str:
+        """Build the rate limiting key from the request identity for this scope"""
+        if self.scope in ("ip", "user", "endpoint"):
+            return f"{self.scope}:{identity}:{self.name}"
+        return f"global:{self.name}"
+
+class RuleIndex:
+    """Compiled rule selection: a prefix trie over rule paths plus an LRU
+    cache of the rules applying to each (method, path)"""
+    
+    _RULES = ""  # trie node entry holding the rules whose prefix ends there
+    
+    def __init__(self, rules: List[RateLimitRule], cache_size: int = 4096):
+        self.cache_size = cache_size
+        self._global_rules = [(index, rule) for index, rule in enumerate(rules) if not rule.paths]
+        self._trie: Dict[str, dict] = {}
+        for index, rule in enumerate(rules):
+            for path in rule.paths:
+                node = self._trie
+                for char in path:
+                    node = node.setdefault(char, {})
+                node.setdefault(self._RULES, []).append((index, rule))
+        self._cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+    
+    def match(self, method: str, path: str) -> tuple:
+        """Return the rules that apply to the request, in rule order"""
+        cache_key = (method, path)
+        rules = self._cache.get(cache_key)
+        if rules is not None:
+            self._cache.move_to_end(cache_key)
+            return rules
         
-        return True
-    
-    def get_key(self, request: Request) -> str:
-        """Generate rate limiting key for the request"""
-        if self.scope == "ip":
-            client_ip = request.client.host if request.client else "unknown"
-            return f"ip:{client_ip}:{self.name}"
-        elif self.scope == "user":
-            user_id = getattr(request.state, 'user_id', 'anonymous')
-            return f"user:{user_id}:{self.name}"
-        elif self.scope == "endpoint":
-            return f"endpoint:{request.url.path}:{self.name}"
+        matched = dict(self._global_rules)
+        node = self._trie
+        for char in path:
+            matched.update(node.get(self._RULES, ()))
+            node = node.get(char)
+            if node is None:
+                break
         else:
-            return f"global:{self.name}"
+            matched.update(node.get(self._RULES, ()))
+        
+        rules = tuple(rule for _, rule in sorted(matched.items()) if method in rule.methods)
+        self._cache[cache_key] = rules
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return rules
 
-class RateLimitingMiddleware(BaseHTTPMiddleware):
+class RateLimitDecision(NamedTuple):
+    """Outcome of evaluating one rule for one request"""
+    rule: RateLimitRule
+    key: str
+    allowed: bool
+    limit: int
+    remaining: int  # requests left after this one is recorded
+    reset_after: float  # seconds until the full limit is available again
+    retry_after: int
+    request_count: int = 0  # window rules only
+    new_tat: float = 0.0  # GCRA rules only, committed when the request is recorded
+
+class RateLimitingMiddleware(PipelineStage):
     """Rate limiting middleware with configurable rules"""
     
-    def __init__(self, app: ASGIApp):
+    def __init__(self, app: Optional[ASGIApp] = None, store=None):
         super().__init__(app)
-        self.store = RateLimitStore()
+        self.store = store if store is not None else create_rate_limit_store()
         self.rules = self._setup_default_rules()
-        self.blocked_ips: Dict[str, float] = {}  # IP -> blocked_until_timestamp
         self.stats = {
             "total_requests": 0,
             "blocked_requests": 0,
             "rules_triggered": defaultdict(int)
         }
     
+    @property
+    def rules(self) -> List[RateLimitRule]:
+        return self._rules
+    
+    @rules.setter
+    def rules(self, rules: List[RateLimitRule]):
+        self._rules = list(rules)
+        self._rule_index = RuleIndex(self._rules)
+    
     def _setup_default_rules(self) -> List[RateLimitRule]:
         """Setup default rate limiting rules"""
         return [
@@ -142,7 +333,8 @@ class RateLimitingMiddleware(BaseHTTPMiddleware):
                 window_seconds=300,  # 10 requests per 5 minutes
                 scope="ip",
                 paths=["/api/auth", "/routes/auth"],
-                burst_limit=3
+                burst_limit=3,
+                algorithm="gcra"  # 1 request per 30s sustained, bursts of 3
             ),
             
             # AI endpoints (resource intensive)
@@ -180,93 +372,159 @@ class RateLimitingMiddleware(BaseHTTPMiddleware):
             )
         ]
     
-    async def dispatch(self, request: Request, call_next):
+    async def on_request(self, ctx: PipelineContext) -> Optional[JSONResponse]:
+        request = ctx.request
         self.stats["total_requests"] += 1
         current_time = time.time()
         
         # Check if IP is currently blocked
         client_ip = request.client.host if request.client else "unknown"
-        if self._is_ip_blocked(client_ip, current_time):
+        blocked_until = self.store.get_blocked_until(client_ip, current_time)
+        if blocked_until is not None:
             self.stats["blocked_requests"] += 1
             return self._create_rate_limit_response(
                 "IP blocked due to excessive requests",
-                retry_after=int(self.blocked_ips[client_ip] - current_time)
+                retry_after=int(blocked_until - current_time)
             )
         
-        # Check rate limits
-        for rule in self.rules:
-            if not rule.applies_to(request):
-                continue
+        # Rules are selected and keyed once per request
+        scope = ctx.scope
+        path = scope["path"]
+        keyed_rules = []
+        for rule in self._rule_index.match(scope["method"], path):
+            if rule.scope == "ip":
+                identity = client_ip
+            elif rule.scope == "user":
+                identity = getattr(request.state, 'user_id', 'anonymous')
+            else:
+                identity = path
+            keyed_rules.append((rule, rule.key_for(identity)))
+        
+        # Check and record under the store lock, so workers sharing the store
+        # cannot both take the last request of a limit
+        denied: Optional[RateLimitDecision] = None
+        decisions: List[RateLimitDecision] = []
+        with self.store.locked([key for _, key in keyed_rules]):
+            for rule, key in keyed_rules:
+                decision = self._evaluate(rule, key, current_time)
+                decisions.append(decision)
+                
+                # Skip if IP is exempt
+                if not decision.allowed and client_ip not in rule.exempt_ips:
+                    denied = decision
+                    break
+            else:
+                # Record the request
+                for decision in decisions:
+                    if decision.rule.algorithm == "gcra":
+                        self.store.set_tat(decision.key, decision.new_tat)
+                    else:
+                        self.store.add_request(decision.key, current_time, decision.rule.window_seconds)
+        
+        if denied is not None:
+            rule = denied.rule
+            self.stats["blocked_requests"] += 1
+            self.stats["rules_triggered"][rule.name] += 1
             
-            # Skip if IP is exempt
-            if client_ip in rule.exempt_ips:
-                continue
+            # Block IP temporarily for severe violations
+            if rule.algorithm == "window" and denied.request_count >= rule.limit * 2:
+                self._block_ip(client_ip, current_time)
             
-            key = rule.get_key(request)
-            request_count = self.store.get_request_count(key, rule.window_seconds, current_time)
+            logger.warning(
+                f"Rate limit exceeded for {denied.key}: {rule.algorithm} rule "
+                f"{rule.limit} requests per {rule.window_seconds}s (burst {rule.burst_limit})"
+            )
             
-            if request_count >= rule.limit:
-                self.stats["blocked_requests"] += 1
-                self.stats["rules_triggered"][rule.name] += 1
-                
-                # Block IP temporarily for severe violations
-                if request_count >= rule.limit * 2:
-                    self._block_ip(client_ip, current_time)
-                
-                logger.warning(
-                    f"Rate limit exceeded for {key}: {request_count}/{rule.limit} "
-                    f"requests in {rule.window_seconds}s window"
-                )
-                
-                return self._create_rate_limit_response(
-                    f"Rate limit exceeded for {rule.name}",
-                    retry_after=rule.window_seconds
-                )
-        
-        # Record the request
-        for rule in self.rules:
-            if rule.applies_to(request):
-                key = rule.get_key(request)
-                self.store.add_request(key, current_time)
+            return self._create_rate_limit_response(
+                f"Rate limit exceeded for {rule.name}",
+                retry_after=denied.retry_after,
+                limit=denied.limit,
+                reset_after=denied.reset_after
+            )
         
-        # Process request
-        response = await call_next(request)
+        ctx.data["rate_limit_time"] = current_time
+        ctx.data["rate_limit_decision"] = min(
+            decisions, key=lambda d: d.remaining, default=None
+        )
+        return None
+    
+    def on_response_start(self, ctx: PipelineContext, message: Message) -> None:
+        current_time = ctx.data["rate_limit_time"]
+        decision: Optional[RateLimitDecision] = ctx.data["rate_limit_decision"]
         
-        # Add rate limit headers
-        response.headers["X-RateLimit-Remaining"] = str(self._get_remaining_requests(request, current_time))
-        response.headers["X-RateLimit-Reset"] = str(int(current_time + 3600))
+        # Add rate limit headers for the most restrictive applicable rule
+        headers = MutableHeaders(scope=message)
+        if decision is None:
+            headers["X-RateLimit-Remaining"] = "1000"
+            headers["X-RateLimit-Reset"] = str(int(current_time + 3600))
+            return
+        headers["X-RateLimit-Limit"] = str(decision.limit)
+        headers["X-RateLimit-Remaining"] = str(decision.remaining)
+        headers["X-RateLimit-Reset"] = str(math.ceil(current_time + decision.reset_after))
+    
+    def _evaluate(self, rule: RateLimitRule, key: str, current_time: float) -> RateLimitDecision:
+        """Evaluate a rule for the request without recording it"""
+        if rule.algorithm == "gcra":
+            return self._evaluate_gcra(rule, key, current_time)
         
-        return response
+        request_count = self.store.get_request_count(key, rule.window_seconds, current_time)
+        allowed = request_count < rule.limit
+        return RateLimitDecision(
+            rule=rule,
+            key=key,
+            allowed=allowed,
+            limit=rule.limit,
+            remaining=max(0, rule.limit - request_count - 1) if allowed else 0,
+            reset_after=rule.window_seconds,
+            retry_after=rule.window_seconds,
+            request_count=request_count
+        )
     
-    def _is_ip_blocked(self, ip: str, current_time: float) -> bool:
-        """Check if IP is currently blocked"""
-        if ip in self.blocked_ips:
-            if current_time >= self.blocked_ips[ip]:
-                del self.blocked_ips[ip]
-                return False
-            return True
-        return False
+    def _evaluate_gcra(self, rule: RateLimitRule, key: str, current_time: float) -> RateLimitDecision:
+        """Generic cell rate algorithm: limit/window sustained rate, burst_limit bucket depth"""
+        interval = rule.emission_interval
+        tat = max(self.store.get_tat(key, current_time), current_time)
+        new_tat = tat + interval
+        # Earliest time this request conforms: the bucket must have a free slot
+        allow_at = new_tat - rule.burst_limit * interval
+        
+        if current_time < allow_at:
+            return RateLimitDecision(
+                rule=rule,
+                key=key,
+                allowed=False,
+                limit=rule.burst_limit,
+                remaining=0,
+                reset_after=tat - current_time,
+                retry_after=max(1, math.ceil(allow_at - current_time)),
+                new_tat=new_tat
+            )
+        
+        return RateLimitDecision(
+            rule=rule,
+            key=key,
+            allowed=True,
+            limit=rule.burst_limit,
+            remaining=int((current_time - allow_at) / interval),
+            reset_after=new_tat - current_time,
+            retry_after=0,
+            new_tat=new_tat
+        )
     
     def _block_ip(self, ip: str, current_time: float, duration: int = 900):
         """Block IP for specified duration (default 15 minutes)"""
-        self.blocked_ips[ip] = current_time + duration
+        self.store.block(ip, current_time + duration)
         logger.warning(f"Temporarily blocked IP {ip} for {duration} seconds")
     
-    def _get_remaining_requests(self, request: Request, current_time: float) -> int:
-        """Get remaining requests for the most restrictive applicable rule"""
-        min_remaining = float('inf')
-        
-        for rule in self.rules:
-            if rule.applies_to(request):
-                key = rule.get_key(request)
-                used = self.store.get_request_count(key, rule.window_seconds, current_time)
-                remaining = max(0, rule.limit - used)
-                min_remaining = min(min_remaining, remaining)
-        
-        return int(min_remaining) if min_remaining != float('inf') else 1000
-    
-    def _create_rate_limit_response(self, message: str, retry_after: int) -> JSONResponse:
+    def _create_rate_limit_response(
+        self,
+        message: str,
+        retry_after: int,
+        limit: int = 1000,
+        reset_after: Optional[float] = None
+    ) -> JSONResponse:
         """Create rate limit exceeded response"""
+        reset_after = retry_after if reset_after is None else reset_after
         return JSONResponse(
             status_code=429,
             content={
@@ -280,9 +538,9 @@ class RateLimitingMiddleware(BaseHTTPMiddleware):
             },
             headers={
                 "Retry-After": str(retry_after),
-                "X-RateLimit-Limit": "1000",
+                "X-RateLimit-Limit": str(limit),
                 "X-RateLimit-Remaining": "0",
-                "X-RateLimit-Reset": str(int(time.time() + retry_after))
+                "X-RateLimit-Reset": str(math.ceil(time.time() + reset_after))
             }
         )
     
@@ -293,8 +551,8 @@ class RateLimitingMiddleware(BaseHTTPMiddleware):
             "blocked_requests": self.stats["blocked_requests"],
             "block_rate": self.stats["blocked_requests"] / max(1, self.stats["total_requests"]),
             "rules_triggered": dict(self.stats["rules_triggered"]),
-            "blocked_ips_count": len(self.blocked_ips),
-            "store_size": len(self.store._store)
+            "blocked_ips_count": self.store.blocked_count(),
+            "store_size": len(self.store)
         }
     
     def reset_stats(self):
@@ -3,20 +3,38 @@ Security headers middleware for NGX Pulse Backend
 Adds security headers including CSP, HSTS, and other security protections
 """
 
+import itertools
 import logging
-from typing import Dict, List, Optional
+import re
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import unquote_plus
 from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.responses import JSONResponse, Response
+from starlette.exceptions import HTTPException
+from starlette.types import ASGIApp, Message, Receive
+
+from .body_decoding import BodyDecoder, InvalidEncodedBody, supported_encodings
+from .pipeline import PipelineContext, PipelineStage
 
 logger = logging.getLogger(__name__)
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+_API_PATH_PREFIXES = ("/api", "/routes")
+
+
+def _encode_headers(headers: List[Tuple[str, str]]) -> List[Tuple[bytes, bytes]]:
+    """Encode header pairs into raw ASGI form (lowercase latin-1 names)"""
+    return [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in headers
+    ]
+
+class SecurityHeadersMiddleware(PipelineStage):
     """Middleware to add security headers to all responses"""
     
     def __init__(
         self,
-        app: ASGIApp,
+        app: Optional[ASGIApp] = None,
         csp_policy: Optional[str] = None,
         hsts_max_age: int = 31536000,  # 1 year
         enable_hsts: bool = True,
@@ -37,6 +55,7 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         self.enable_referrer_policy = enable_referrer_policy
         self.permitted_cross_domain_policies = permitted_cross_domain_policies
         self.custom_headers = custom_headers or {}
+        self._compile_headers()
     
     def _get_default_csp_policy(self) -> str:
         """Get default Content Security Policy"""
@@ -60,79 +79,141 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
             "upgrade-insecure-requests"
         )
     
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Add security headers
-        self._add_security_headers(response, request)
-        
-        return response
-    
-    def _add_security_headers(self, response, request: Request):
-        """Add security headers to the response"""
+    def _compile_headers(self) -> None:
+        """Pre-encode the headers that do not change between responses"""
+        static_headers: List[Tuple[str, str]] = []
         
         # Content Security Policy
         if self.csp_policy:
-            response.headers["Content-Security-Policy"] = self.csp_policy
-        
-        # HTTP Strict Transport Security (HTTPS only)
-        if self.enable_hsts and request.url.scheme == "https":
-            response.headers["Strict-Transport-Security"] = (
-                f"max-age={self.hsts_max_age}; includeSubDomains; preload"
-            )
+            static_headers.append(("Content-Security-Policy", self.csp_policy))
         
         # X-XSS-Protection
         if self.enable_xss_protection:
-            response.headers["X-XSS-Protection"] = "1; mode=block"
+            static_headers.append(("X-XSS-Protection", "1; mode=block"))
         
         # X-Content-Type-Options
         if self.enable_content_type_options:
-            response.headers["X-Content-Type-Options"] = "nosniff"
+            static_headers.append(("X-Content-Type-Options", "nosniff"))
         
         # X-Frame-Options
         if self.enable_frame_options:
-            response.headers["X-Frame-Options"] = "DENY"
+            static_headers.append(("X-Frame-Options", "DENY"))
         
         # Referrer Policy
         if self.enable_referrer_policy:
-            response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+            static_headers.append(("Referrer-Policy", "strict-origin-when-cross-origin"))
         
         # X-Permitted-Cross-Domain-Policies
-        response.headers["X-Permitted-Cross-Domain-Policies"] = self.permitted_cross_domain_policies
+        static_headers.append(("X-Permitted-Cross-Domain-Policies", self.permitted_cross_domain_policies))
         
         # Additional security headers
-        response.headers["X-Robots-Tag"] = "noindex, nofollow, nosnippet, noarchive"
-        response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, private"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        
-        # Remove server information
-        if "Server" in response.headers:
-            del response.headers["Server"]
-        if "X-Powered-By" in response.headers:
-            del response.headers["X-Powered-By"]
+        static_headers.extend([
+            ("X-Robots-Tag", "noindex, nofollow, nosnippet, noarchive"),
+            ("Cache-Control", "no-store, no-cache, must-revalidate, private"),
+            ("Pragma", "no-cache"),
+            ("Expires", "0"),
+        ])
         
         # Custom headers
-        for header, value in self.custom_headers.items():
-            response.headers[header] = value
+        static_headers.extend(self.custom_headers.items())
+        
+        # Later entries (custom headers) override earlier ones of the same name
+        self._static_headers = list(dict(_encode_headers(static_headers)).items())
+        
+        # HTTP Strict Transport Security (HTTPS only)
+        self._hsts_header = _encode_headers([(
+            "Strict-Transport-Security",
+            f"max-age={self.hsts_max_age}; includeSubDomains; preload",
+        )])[0] if self.enable_hsts else None
         
         # Security headers for API responses
-        if request.url.path.startswith(("/api", "/routes")):
-            response.headers["X-API-Version"] = "1.0"
-            response.headers["X-Request-ID"] = getattr(request.state, 'trace_id', 'unknown')
+        self._api_version_header = (b"x-api-version", b"1.0")
+        
+        # Headers set by this middleware replace any value set by the app,
+        # and server information is always removed
+        self._replaced_headers = frozenset(
+            [name for name, _ in self._static_headers]
+            + [b"strict-transport-security", b"x-api-version", b"x-request-id", b"server", b"x-powered-by"]
+        )
+    
+    def on_response_start(self, ctx: PipelineContext, message: Message) -> None:
+        # Add security headers
+        scope = ctx.scope
+        replaced = self._replaced_headers
+        headers = [header for header in message.get("headers", ()) if header[0] not in replaced]
+        headers.extend(self._static_headers)
+        
+        if self._hsts_header is not None and scope.get("scheme", "http") == "https":
+            headers.append(self._hsts_header)
+        
+        if scope["path"].startswith(_API_PATH_PREFIXES):
+            trace_id = scope.get("state", {}).get("trace_id", "unknown")
+            headers.append(self._api_version_header)
+            headers.append((b"x-request-id", trace_id.encode("latin-1")))
+        
+        message["headers"] = headers
+
+class OriginMatcher:
+    """Origin policy compiled into a hash set plus a prefix trie for wildcards"""
+    
+    _TERMINAL = ""
+    
+    def __init__(self, allowed_origins: List[str]):
+        self.allow_all = "*" in allowed_origins
+        self._exact = frozenset(o for o in allowed_origins if not o.endswith("*"))
+        self._trie: Dict[str, dict] = {}
+        
+        for allowed_origin in allowed_origins:
+            if allowed_origin.endswith("*") and allowed_origin != "*":
+                node = self._trie
+                for char in allowed_origin[:-1]:
+                    node = node.setdefault(char, {})
+                node[self._TERMINAL] = {}
+        
+        if self.allow_all:
+            logger.warning("Wildcard CORS origin detected - this should not be used in production")
+    
+    def matches(self, origin: Optional[str]) -> bool:
+        """Check if origin is allowed"""
+        if not origin:
+            return False
+        if origin in self._exact or self.allow_all:
+            return True
+        
+        node = self._trie
+        for char in origin:
+            if self._TERMINAL in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return self._TERMINAL in node
 
-class CORSSecurityMiddleware(BaseHTTPMiddleware):
+class _PreflightResponse:
+    """Preflight response replayed from pre-encoded raw headers"""
+    
+    __slots__ = ("raw_headers",)
+    
+    def __init__(self, raw_headers: Tuple[Tuple[bytes, bytes], ...]):
+        self.raw_headers = raw_headers
+    
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": 200, "headers": list(self.raw_headers)})
+        await send({"type": "http.response.body", "body": b""})
+
+class CORSSecurityMiddleware(PipelineStage):
     """Enhanced CORS middleware with security considerations"""
     
     def __init__(
         self,
-        app: ASGIApp,
+        app: Optional[ASGIApp] = None,
         allowed_origins: List[str] = None,
         allowed_methods: List[str] = None,
         allowed_headers: List[str] = None,
         allow_credentials: bool = True,
         max_age: int = 86400,  # 24 hours
-        expose_headers: List[str] = None
+        expose_headers: List[str] = None,
+        preflight_cache_size: int = 1024
     ):
         super().__init__(app)
         self.allowed_origins = allowed_origins or [
@@ -157,136 +238,447 @@ class CORSSecurityMiddleware(BaseHTTPMiddleware):
         self.max_age = max_age
         self.expose_headers = expose_headers or [
             "X-Trace-ID",
+            "X-RateLimit-Limit",
             "X-RateLimit-Remaining",
             "X-RateLimit-Reset"
         ]
+        self.preflight_cache_size = preflight_cache_size
+        self._compile_policy()
     
-    async def dispatch(self, request: Request, call_next):
-        origin = request.headers.get("origin")
+    def _compile_policy(self) -> None:
+        """Pre-compute everything that does not depend on the request"""
+        self._origin_matcher = OriginMatcher(self.allowed_origins)
+        self._allowed_methods = frozenset(self.allowed_methods)
+        self._allowed_headers = frozenset(h.lower() for h in self.allowed_headers)
+        self._allow_methods_value = ", ".join(self.allowed_methods)
         
-        # Handle preflight requests
-        if request.method == "OPTIONS":
-            return self._handle_preflight(request, origin)
+        cors_headers = []
+        if self.allow_credentials:
+            cors_headers.append(("Access-Control-Allow-Credentials", "true"))
+        if self.expose_headers:
+            cors_headers.append(("Access-Control-Expose-Headers", ", ".join(self.expose_headers)))
+        self._cors_headers = _encode_headers(cors_headers)
+        self._replaced_headers = frozenset(
+            [b"access-control-allow-origin"] + [name for name, _ in self._cors_headers]
+        )
         
-        # Process the request
-        response = await call_next(request)
+        self._preflight_cache: "OrderedDict[Tuple[str, str, str], _PreflightResponse]" = OrderedDict()
+    
+    async def on_request(self, ctx: PipelineContext) -> Optional[Response]:
+        # Handle preflight requests
+        if ctx.scope["method"] == "OPTIONS":
+            return self._handle_preflight(ctx.request, ctx.request.headers.get("origin"))
         
+        return None
+    
+    def on_response_start(self, ctx: PipelineContext, message: Message) -> None:
         # Add CORS headers
-        self._add_cors_headers(response, origin)
+        origin = ctx.request.headers.get("origin")
+        if self._is_origin_allowed(origin):
+            replaced = self._replaced_headers
+            headers = [header for header in message.get("headers", ()) if header[0] not in replaced]
+            headers.append((b"access-control-allow-origin", origin.encode("latin-1")))
+            headers.extend(self._cors_headers)
+            message["headers"] = headers
+    
+    def _handle_preflight(self, request: Request, origin: str) -> _PreflightResponse:
+        """Handle CORS preflight requests, replaying cached responses"""
+        headers = request.headers
+        requested_method = headers.get("access-control-request-method") or ""
+        requested_headers = headers.get("access-control-request-headers") or ""
+        
+        cache_key = (origin or "", requested_method, requested_headers.replace(" ", "").lower())
+        response = self._preflight_cache.get(cache_key)
+        if response is not None:
+            self._preflight_cache.move_to_end(cache_key)
+            return response
         
+        response = _PreflightResponse(tuple(self._build_preflight_headers(origin, requested_method, cache_key[2])))
+        self._preflight_cache[cache_key] = response
+        if len(self._preflight_cache) > self.preflight_cache_size:
+            self._preflight_cache.popitem(last=False)
         return response
     
-    def _handle_preflight(self, request: Request, origin: str):
-        """Handle CORS preflight requests"""
-        from starlette.responses import Response
-        
-        response = Response()
+    def _build_preflight_headers(
+        self,
+        origin: str,
+        requested_method: str,
+        requested_headers: str
+    ) -> List[Tuple[bytes, bytes]]:
+        """Build the raw headers of a preflight response"""
+        preflight_headers = [("Content-Length", "0")]
         
         if self._is_origin_allowed(origin):
-            self._add_cors_headers(response, origin)
+            preflight_headers.append(("Access-Control-Allow-Origin", origin))
+            if self.allow_credentials:
+                preflight_headers.append(("Access-Control-Allow-Credentials", "true"))
+            if self.expose_headers:
+                preflight_headers.append(("Access-Control-Expose-Headers", ", ".join(self.expose_headers)))
             
             # Handle preflight-specific headers
-            requested_method = request.headers.get("access-control-request-method")
-            if requested_method in self.allowed_methods:
-                response.headers["Access-Control-Allow-Methods"] = ", ".join(self.allowed_methods)
+            if requested_method in self._allowed_methods:
+                preflight_headers.append(("Access-Control-Allow-Methods", self._allow_methods_value))
             
-            requested_headers = request.headers.get("access-control-request-headers")
             if requested_headers:
                 # Validate requested headers
-                requested_headers_list = [h.strip() for h in requested_headers.split(",")]
                 allowed_requested_headers = [
-                    h for h in requested_headers_list 
-                    if h.lower() in [ah.lower() for ah in self.allowed_headers]
+                    h for h in requested_headers.split(",")
+                    if h in self._allowed_headers
                 ]
                 if allowed_requested_headers:
-                    response.headers["Access-Control-Allow-Headers"] = ", ".join(allowed_requested_headers)
+                    preflight_headers.append(("Access-Control-Allow-Headers", ", ".join(allowed_requested_headers)))
             
-            response.headers["Access-Control-Max-Age"] = str(self.max_age)
+            preflight_headers.append(("Access-Control-Max-Age", str(self.max_age)))
         
-        return response
-    
-    def _add_cors_headers(self, response, origin: str):
-        """Add CORS headers to response"""
-        if self._is_origin_allowed(origin):
-            response.headers["Access-Control-Allow-Origin"] = origin
-            
-            if self.allow_credentials:
-                response.headers["Access-Control-Allow-Credentials"] = "true"
-            
-            if self.expose_headers:
-                response.headers["Access-Control-Expose-Headers"] = ", ".join(self.expose_headers)
+        return _encode_headers(preflight_headers)
     
     def _is_origin_allowed(self, origin: str) -> bool:
         """Check if origin is allowed"""
-        if not origin:
-            return False
-        
-        # Check exact matches
-        if origin in self.allowed_origins:
+        return self._origin_matcher.matches(origin)
+
+def _has_event_handler_assignment(text: str) -> bool:
+    """Cheap necessary condition for ``on\\w+\\s*=``: some ``=`` follows a word
+    holding "on" before its last character (``day=1`` or a path with
+    "nutrition" in it does not qualify)"""
+    eq = text.find("=")
+    while eq >= 0:
+        end = eq
+        while end and text[end - 1].isspace():
+            end -= 1
+        start = end
+        while start and (text[start - 1].isalnum() or text[start - 1] == "_"):
+            start -= 1
+        if end - start > 2 and text.find("on", start, end - 1) >= 0:
             return True
-        
-        # Check for wildcard patterns (be careful with this in production)
-        for allowed_origin in self.allowed_origins:
-            if allowed_origin == "*":
-                logger.warning("Wildcard CORS origin detected - this should not be used in production")
-                return True
-            if allowed_origin.endswith("*"):
-                pattern = allowed_origin[:-1]
-                if origin.startswith(pattern):
-                    return True
-        
-        return False
+        eq = text.find("=", eq + 1)
+    return False
+
+# Suspicious request patterns: (name, regex, prefilter). The prefilter is
+# either literals that must all be present in the lowercased text or a
+# predicate on it; the regex can only match where its prefilter passes.
+SUSPICIOUS_PATTERNS: Tuple[Tuple[str, str, Union[Tuple[str, ...], Callable[[str], bool]]], ...] = (
+    ("script_tag", r"<script", ("<script",)),
+    ("javascript_uri", r"javascript:", ("javascript:",)),
+    ("event_handler", r"on\w+\s*=", _has_event_handler_assignment),
+    ("sql_statement", r"sql\s+(?:select|insert|update|delete|drop|create|alter)", ("sql",)),
+    ("union_select", r"union\s+select", ("union", "select")),
+    ("eval_call", r"eval\s*\(", ("eval", "(")),
+    ("exec_call", r"exec\s*\(", ("exec", "(")),
+)
+
+# Request body limits per route prefix; the longest matching prefix wins
+DEFAULT_BODY_SIZE_LIMITS: Dict[str, int] = {
+    "/routes/api/v1/healthkit/sync": 50 * 1024 * 1024,  # 50MB HealthKit backfills
+    "/routes/api/v1/healthkit/sync/stream": 1024 * 1024 * 1024,  # 1GB NDJSON backfills, written as they stream
+    "/routes/chat": 64 * 1024,  # 64KB chat messages
+}
 
-class InputSanitizationMiddleware(BaseHTTPMiddleware):
+# Routes that accept gzip/zstd request bodies
+DEFAULT_DECODED_BODY_PATHS = ("/routes/api/v1/healthkit/sync",)
+
+class RequestBodyTooLarge(HTTPException):
+    """Raised from the guarded receive channel once a body crosses its limit"""
+    
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail="Request body too large")
+        self.limit = limit
+
+class RequestBodyRejected(HTTPException):
+    """Raised from the decoding receive channel for a body that cannot be decoded safely"""
+
+class InputSanitizationMiddleware(PipelineStage):
     """Middleware for basic input sanitization and validation"""
     
-    def __init__(self, app: ASGIApp):
+    def __init__(
+        self,
+        app: Optional[ASGIApp] = None,
+        max_body_size: int = 10 * 1024 * 1024,  # 10MB
+        body_size_limits: Optional[Dict[str, int]] = None,
+        decoded_body_paths: Optional[Tuple[str, ...]] = None,
+        max_decompression_ratio: float = 100.0,
+        decompression_ratio_floor: int = 1024 * 1024,  # 1MB decoded before the ratio applies
+    ):
         super().__init__(app)
-        self.max_body_size = 10 * 1024 * 1024  # 10MB
-        self.suspicious_patterns = [
-            r"<script",
-            r"javascript:",
-            r"on\w+\s*=",
-            r"sql\s+(select|insert|update|delete|drop|create|alter)",
-            r"union\s+select",
-            r"eval\s*\(",
-            r"exec\s*\(",
-        ]
+        self.max_body_size = max_body_size
+        self.decoded_body_paths = DEFAULT_DECODED_BODY_PATHS if decoded_body_paths is None else decoded_body_paths
+        self.max_decompression_ratio = max_decompression_ratio
+        self.decompression_ratio_floor = decompression_ratio_floor
+        self._decoders = supported_encodings()
+        self.body_size_limits = DEFAULT_BODY_SIZE_LIMITS if body_size_limits is None else body_size_limits
+        self._body_size_limits = sorted(
+            self.body_size_limits.items(), key=lambda item: len(item[0]), reverse=True
+        )
+        self.suspicious_patterns = [pattern for _, pattern, _ in SUSPICIOUS_PATTERNS]
+        
+        # One alternation regex with a named group per pattern, preceded by a
+        # literal prefilter so clean requests never reach the regex engine
+        self._suspicious_regex = re.compile(
+            "|".join(f"(?P<{name}>{pattern})" for name, pattern, _ in SUSPICIOUS_PATTERNS)
+        )
+        self._prefilters = tuple(
+            prefilter if callable(prefilter) else (prefilter[0], prefilter[1:])
+            for _, _, prefilter in SUSPICIOUS_PATTERNS
+        )
+        self.stats = {
+            "suspicious_requests": 0,
+            "oversized_bodies": 0,
+            "decoded_bodies": 0,
+            "rejected_encodings": 0,
+            "pattern_matches": {name: 0 for name, _, _ in SUSPICIOUS_PATTERNS}
+        }
     
-    async def dispatch(self, request: Request, call_next):
-        # Check content length
+    async def on_request(self, ctx: PipelineContext) -> Optional[Response]:
+        request = ctx.request
+        path = ctx.scope["path"]
+        limit = self.get_body_size_limit(path)
+        
         content_length = request.headers.get("content-length")
-        if content_length and int(content_length) > self.max_body_size:
-            from starlette.responses import JSONResponse
-            return JSONResponse(
-                status_code=413,
-                content={
-                    "success": False,
-                    "error": {
-                        "message": "Request body too large",
-                        "code": "PAYLOAD_TOO_LARGE"
-                    }
-                }
-            )
+        content_encoding = request.headers.get("content-encoding", "").strip().lower()
+        
+        # Compressed bodies are decoded on the routes that accept them and
+        # the limit applies to the decoded size
+        if content_encoding not in ("", "identity") and path.startswith(self.decoded_body_paths):
+            decoder_factory = self._decoders.get(content_encoding)
+            if decoder_factory is None:
+                self.stats["rejected_encodings"] += 1
+                return self._unsupported_encoding_response(content_encoding)
+            # The declared length is the wire size; a compressed body over the
+            # limit cannot decode to less, anything else is checked as it decodes
+            if content_length and int(content_length) > limit:
+                self.stats["oversized_bodies"] += 1
+                return self._payload_too_large_response(limit)
+            self.stats["decoded_bodies"] += 1
+            ctx.receive = self._decoding_receive(ctx, decoder_factory(), limit)
+        # Check content length
+        elif content_length:
+            if int(content_length) > limit:
+                self.stats["oversized_bodies"] += 1
+                return self._payload_too_large_response(limit)
+        elif request.method not in ("GET", "HEAD", "OPTIONS"):
+            # Without a declared length (chunked uploads) count the bytes as they arrive
+            ctx.receive = self._guard_body_size(ctx, limit)
         
         # Log suspicious requests
         self._log_suspicious_request(request)
         
-        response = await call_next(request)
-        return response
+        return None
+    
+    def get_body_size_limit(self, path: str) -> int:
+        """Return the body size limit for the longest matching route prefix"""
+        for prefix, limit in self._body_size_limits:
+            if path.startswith(prefix):
+                return limit
+        return self.max_body_size
+    
+    def _guard_body_size(self, ctx: PipelineContext, limit: int) -> Receive:
+        """Wrap the receive channel so the body is rejected once it crosses ``limit``"""
+        receive = ctx.receive
+        received = 0
+        
+        async def guarded_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    self.stats["oversized_bodies"] += 1
+                    logger.warning(
+                        f"Request body exceeded {limit} bytes: {ctx.request.method} {ctx.scope['path']}"
+                    )
+                    ctx.override_response(self._payload_too_large_response(limit))
+                    raise RequestBodyTooLarge(limit)
+            return message
+        
+        return guarded_receive
+    
+    def _decoding_receive(self, ctx: PipelineContext, decoder: BodyDecoder, limit: int) -> Receive:
+        """Wrap the receive channel so the app reads the decoded body
+
+        The body is decoded as it arrives, in bounded pieces. ``limit``
+        applies to the decoded size, and once more than
+        ``decompression_ratio_floor`` bytes are decoded the output may not
+        exceed ``max_decompression_ratio`` times the bytes received.
+        """
+        receive = ctx.receive
+        # The app sees a plain body of unknown length
+        ctx.scope["headers"] = [
+            (name, value)
+            for name, value in ctx.scope["headers"]
+            if name not in (b"content-encoding", b"content-length")
+        ]
+        pieces: Iterator[bytes] = iter(())
+        received = 0
+        decoded = 0
+        finished = False
+        
+        async def decoding_receive() -> Message:
+            nonlocal pieces, received, decoded, finished
+            while True:
+                try:
+                    piece = next(pieces, None)
+                except InvalidEncodedBody as e:
+                    self.stats["rejected_encodings"] += 1
+                    logger.warning(f"{e}: {ctx.request.method} {ctx.scope['path']}")
+                    ctx.override_response(self._invalid_encoding_response(str(e)))
+                    raise RequestBodyRejected(400, str(e)) from e
+                if piece is not None:
+                    decoded += len(piece)
+                    if decoded > limit:
+                        self.stats["oversized_bodies"] += 1
+                        logger.warning(
+                            f"Decoded request body exceeded {limit} bytes: {ctx.request.method} {ctx.scope['path']}"
+                        )
+                        ctx.override_response(self._payload_too_large_response(limit))
+                        raise RequestBodyTooLarge(limit)
+                    if (
+                        decoded > self.decompression_ratio_floor
+                        and decoded > received * self.max_decompression_ratio
+                    ):
+                        self.stats["rejected_encodings"] += 1
+                        logger.warning(
+                            f"Request body decompression ratio above {self.max_decompression_ratio}: "
+                            f"{ctx.request.method} {ctx.scope['path']}"
+                        )
+                        ctx.override_response(self._decompression_ratio_response())
+                        raise RequestBodyRejected(413, "Decompression ratio too high")
+                    return {"type": "http.request", "body": piece, "more_body": True}
+                if finished:
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                
+                message = await receive()
+                if message["type"] != "http.request":
+                    return message
+                body = message.get("body", b"")
+                received += len(body)
+                pieces = decoder.decode(body)
+                if not message.get("more_body", False):
+                    finished = True
+                    pieces = itertools.chain(pieces, decoder.finish())
+        
+        return decoding_receive
+    
+    def _payload_too_large_response(self, limit: int) -> JSONResponse:
+        """Create payload too large response"""
+        return JSONResponse(
+            status_code=413,
+            content={
+                "success": False,
+                "error": {
+                    "message": "Request body too large",
+                    "code": "PAYLOAD_TOO_LARGE",
+                    "limit": limit
+                }
+            }
+        )
+    
+    def _unsupported_encoding_response(self, encoding: str) -> JSONResponse:
+        """Create unsupported content encoding response"""
+        return JSONResponse(
+            status_code=415,
+            content={
+                "success": False,
+                "error": {
+                    "message": f"Unsupported Content-Encoding: {encoding}",
+                    "code": "UNSUPPORTED_CONTENT_ENCODING",
+                    "supported": sorted(self._decoders),
+                }
+            }
+        )
+    
+    def _invalid_encoding_response(self, message: str) -> JSONResponse:
+        """Create invalid encoded body response"""
+        return JSONResponse(
+            status_code=400,
+            content={
+                "success": False,
+                "error": {
+                    "message": message,
+                    "code": "INVALID_CONTENT_ENCODING"
+                }
+            }
+        )
+    
+    def _decompression_ratio_response(self) -> JSONResponse:
+        """Create decompression bomb response"""
+        return JSONResponse(
+            status_code=413,
+            content={
+                "success": False,
+                "error": {
+                    "message": "Request body decompression ratio too high",
+                    "code": "DECOMPRESSION_RATIO_EXCEEDED",
+                    "max_ratio": self.max_decompression_ratio
+                }
+            }
+        )
+    
+    def _find_suspicious_patterns(self, path: str, query_string: bytes) -> List[str]:
+        """Return the names of the suspicious patterns found in the path and query"""
+        text = path.lower()
+        
+        # Only decode the raw query when it contains escaped characters
+        if query_string:
+            query = query_string.decode("latin-1")
+            if "%" in query or "+" in query:
+                query = unquote_plus(query)
+            text = f"{text}?{query.lower()}"
+        
+        for prefilter in self._prefilters:
+            if callable(prefilter):
+                if prefilter(text):
+                    break
+                continue
+            first_literal, other_literals = prefilter
+            if first_literal in text:
+                for literal in other_literals:
+                    if literal not in text:
+                        break
+                else:
+                    break
+        else:
+            return []
+        
+        found = []
+        for match in self._suspicious_regex.finditer(text):
+            if match.lastgroup not in found:
+                found.append(match.lastgroup)
+        return found
     
     def _log_suspicious_request(self, request: Request):
         """Log potentially suspicious requests"""
-        import re
-        
-        # Check URL for suspicious patterns
-        url_str = str(request.url).lower()
-        query_params = str(request.query_params).lower()
-        
-        for pattern in self.suspicious_patterns:
-            if re.search(pattern, url_str, re.IGNORECASE) or re.search(pattern, query_params, re.IGNORECASE):
-                logger.warning(
-                    f"Suspicious request detected: {request.method} {request.url.path} "
-                    f"from {request.client.host if request.client else 'unknown'}"
-                )
-                break
+        scope = request.scope
+        found = self._find_suspicious_patterns(scope["path"], scope.get("query_string", b""))
+        if not found:
+            return
+        
+        self.stats["suspicious_requests"] += 1
+        for name in found:
+            self.stats["pattern_matches"][name] += 1
+        
+        logger.warning(
+            f"Suspicious request detected: {request.method} {request.url.path} "
+            f"from {request.client.host if request.client else 'unknown'} "
+            f"(patterns: {', '.join(found)})"
+        )
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get suspicious request statistics"""
+        return {
+            "suspicious_requests": self.stats["suspicious_requests"],
+            "oversized_bodies": self.stats["oversized_bodies"],
+            "decoded_bodies": self.stats["decoded_bodies"],
+            "rejected_encodings": self.stats["rejected_encodings"],
+            "pattern_matches": dict(self.stats["pattern_matches"])
+        }
+
+# Global instance for accessing sanitizer stats
+input_sanitizer_instance: Optional[InputSanitizationMiddleware] = None
+
+def get_input_sanitizer() -> Optional[InputSanitizationMiddleware]:
+    """Get the global input sanitizer instance"""
+    return input_sanitizer_instance
+
+def set_input_sanitizer(sanitizer: InputSanitizationMiddleware):
+    """Set the global input sanitizer instance"""
+    global input_sanitizer_instance
+    input_sanitizer_instance = sanitizer
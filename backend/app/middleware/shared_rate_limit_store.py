@@ -0,0 +1,255 @@
+"""
+Shared-memory rate limit store for NGX Pulse Backend
+Keeps rate limit counters, GCRA arrival times and IP blocks in a fixed-size
+memory-mapped hash table that every worker on the host opens, so limits and
+blocks hold across ``uvicorn --workers N`` without an external service
+"""
+
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARED_PATH = os.path.join(
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+    "ngx-pulse-rate-limits",
+)
+
+_MAGIC = b"NGXRL001"
+_HEADER = struct.Struct("<8sQQ")  # magic, slots, probe length
+_HEADER_SIZE = 64
+# key hash, window index, window seconds, current count, previous count,
+# padding, GCRA theoretical arrival time, blocked until
+_SLOT = struct.Struct("<QqIIIIdd")
+
+
+def _hash_key(key: str) -> int:
+    """Stable 64-bit key hash (``hash()`` is salted per process); 0 marks a free slot"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+
+def _is_expired(window_index: int, window_seconds: int, tat: float, blocked_until: float, current_time: float) -> bool:
+    """A slot can be reused once its counters, TAT and block no longer matter"""
+    counters_expired = window_seconds == 0 or int(current_time // window_seconds) - window_index > 1
+    return counters_expired and tat <= current_time and blocked_until <= current_time
+
+
+class SharedMemoryRateLimitStore:
+    """Rate limit store shared by all workers on a host through an mmap'd table
+
+    The table is an open-addressing hash table of fixed-size slots holding
+    sliding-window counters (see ``SlidingWindowRateLimitStore``), a GCRA
+    TAT and a blocked-until timestamp. A key lives within ``probe_length``
+    slots of its home slot; updates take a POSIX record lock on that byte
+    range, so workers only contend when their keys share a neighbourhood.
+    Expired slots are reused in place and no cleanup pass is needed. When a
+    neighbourhood is full of live keys the home slot is evicted, trading an
+    early reset of that key for bounded memory.
+    """
+
+    def __init__(self, path: Optional[str] = None, slots: Optional[int] = None, probe_length: int = 16):
+        self.path = path or os.getenv("RATE_LIMIT_SHARED_PATH") or DEFAULT_SHARED_PATH
+        self.slots = slots or int(os.getenv("RATE_LIMIT_SHARED_SLOTS") or 65536)
+        self.probe_length = probe_length
+        # Probing never wraps: the last home slot gets probe_length - 1 overflow slots
+        self.nbytes = _HEADER_SIZE + (self.slots + probe_length - 1) * _SLOT.size
+        self.evictions = 0
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # The first worker to take the header lock sizes and stamps the table
+            fcntl.lockf(fd, fcntl.LOCK_EX, _HEADER_SIZE, 0)
+            try:
+                if os.fstat(fd).st_size == 0:
+                    os.ftruncate(fd, self.nbytes)
+                    os.pwrite(fd, _HEADER.pack(_MAGIC, self.slots, probe_length), 0)
+                else:
+                    header = _HEADER.unpack(os.pread(fd, _HEADER.size, 0))
+                    if header != (_MAGIC, self.slots, probe_length):
+                        raise ValueError(
+                            f"{self.path} holds a different rate limit table ({header[1]} slots, "
+                            f"probe length {header[2]}); remove it or match RATE_LIMIT_SHARED_SLOTS"
+                        )
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, _HEADER_SIZE, 0)
+            self._mm = mmap.mmap(fd, self.nbytes)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        self._fd = fd
+        # Record locks are per process, threads of one worker are serialised here
+        self._thread_lock = threading.RLock()
+        self._held: Set[int] = set()  # home slots locked by the current transaction
+        self._in_transaction = False
+
+    def __len__(self) -> int:
+        current_time = time.time()
+        with self._thread_lock:
+            return sum(
+                1 for slot in _SLOT.iter_unpack(self._mm[_HEADER_SIZE:])
+                if slot[0] and not _is_expired(slot[1], slot[2], slot[6], slot[7], current_time)
+            )
+
+    def close(self):
+        """Unmap the table; the file stays for the other workers"""
+        self._mm.close()
+        os.close(self._fd)
+
+    # Locking
+
+    def _lock_span(self, home: int):
+        return self.probe_length * _SLOT.size, _HEADER_SIZE + home * _SLOT.size
+
+    def _acquire(self, home: int):
+        length, start = self._lock_span(home)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+        self._held.add(home)
+
+    def _release_all(self):
+        for home in self._held:
+            length, start = self._lock_span(home)
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+        self._held.clear()
+
+    @contextmanager
+    def locked(self, keys: Iterable[str]) -> Iterator[None]:
+        """Hold the slots of ``keys`` so a check and its record are atomic across workers"""
+        with self._thread_lock:
+            if self._in_transaction:
+                yield
+                return
+            self._in_transaction = True
+            try:
+                # Ascending order so two workers never wait on each other's ranges
+                for home in sorted({_hash_key(key) % self.slots for key in keys}):
+                    self._acquire(home)
+                yield
+            finally:
+                self._release_all()
+                self._in_transaction = False
+
+    @contextmanager
+    def _slot(self, key: str, current_time: float, create: bool) -> Iterator[Optional[int]]:
+        """Lock the neighbourhood of ``key`` and yield its slot offset (None if absent)"""
+        key_hash = _hash_key(key)
+        home = key_hash % self.slots
+        with self._thread_lock:
+            if self._in_transaction:
+                # Keys missing from locked() stay held until the transaction ends
+                if home not in self._held:
+                    self._acquire(home)
+                yield self._find(key_hash, home, current_time, create)
+                return
+
+            self._acquire(home)
+            try:
+                yield self._find(key_hash, home, current_time, create)
+            finally:
+                self._release_all()
+
+    def _find(self, key_hash: int, home: int, current_time: float, create: bool) -> Optional[int]:
+        free = None
+        for index in range(home, home + self.probe_length):
+            offset = _HEADER_SIZE + index * _SLOT.size
+            slot = _SLOT.unpack_from(self._mm, offset)
+            if slot[0] == key_hash:
+                return offset
+            if free is None and (slot[0] == 0 or _is_expired(slot[1], slot[2], slot[6], slot[7], current_time)):
+                free = offset
+
+        if not create:
+            return None
+        if free is None:
+            free = _HEADER_SIZE + home * _SLOT.size
+            self.evictions += 1
+            if self.evictions == 1:
+                logger.warning(
+                    f"Shared rate limit table {self.path} is full around a key, evicting live entries; "
+                    f"raise RATE_LIMIT_SHARED_SLOTS (currently {self.slots})"
+                )
+        _SLOT.pack_into(self._mm, free, key_hash, 0, 0, 0, 0, 0, 0.0, 0.0)
+        return free
+
+    # Sliding-window counters
+
+    def _rolled_counts(self, slot: tuple, window_seconds: int, current_time: float):
+        """Return (window_index, current, previous) rolled forward to the current window"""
+        window_index = int(current_time // window_seconds)
+        if slot[2] != window_seconds:
+            return window_index, 0, 0
+        if slot[1] == window_index:
+            return window_index, slot[3], slot[4]
+        return window_index, 0, slot[3] if slot[1] == window_index - 1 else 0
+
+    def add_request(self, key: str, current_time: float, window_seconds: Optional[int] = None):
+        """Count a request for the given key"""
+        if window_seconds is None:
+            raise ValueError("SharedMemoryRateLimitStore needs the rule window to record a request")
+
+        with self._slot(key, current_time, create=True) as offset:
+            slot = _SLOT.unpack_from(self._mm, offset)
+            window_index, current, previous = self._rolled_counts(slot, window_seconds, current_time)
+            _SLOT.pack_into(
+                self._mm, offset, slot[0], window_index, window_seconds, current + 1, previous, 0, slot[6], slot[7]
+            )
+
+    def get_request_count(self, key: str, window_seconds: int, current_time: float) -> int:
+        """Get the estimated number of requests within the sliding window"""
+        with self._slot(key, current_time, create=False) as offset:
+            if offset is None:
+                return 0
+            slot = _SLOT.unpack_from(self._mm, offset)
+
+        _, current, previous = self._rolled_counts(slot, window_seconds, current_time)
+        elapsed = (current_time % window_seconds) / window_seconds
+        return int(current + previous * (1.0 - elapsed))
+
+    # GCRA
+
+    def get_tat(self, key: str, current_time: float) -> float:
+        """Get the theoretical arrival time for the key (now if it has no state)"""
+        with self._slot(key, current_time, create=False) as offset:
+            if offset is None:
+                return current_time
+            tat = _SLOT.unpack_from(self._mm, offset)[6]
+        return tat or current_time
+
+    def set_tat(self, key: str, tat: float):
+        """Store the theoretical arrival time for the key"""
+        with self._slot(key, time.time(), create=True) as offset:
+            slot = list(_SLOT.unpack_from(self._mm, offset))
+            slot[6] = tat
+            _SLOT.pack_into(self._mm, offset, *slot)
+
+    # IP blocks
+
+    def block(self, ip: str, blocked_until: float):
+        """Block the IP for every worker until ``blocked_until``"""
+        with self._slot(f"blocked:{ip}", time.time(), create=True) as offset:
+            slot = list(_SLOT.unpack_from(self._mm, offset))
+            slot[7] = blocked_until
+            _SLOT.pack_into(self._mm, offset, *slot)
+
+    def get_blocked_until(self, ip: str, current_time: float) -> Optional[float]:
+        """Return when the IP's block ends, or None if it is not blocked"""
+        with self._slot(f"blocked:{ip}", current_time, create=False) as offset:
+            if offset is None:
+                return None
+            blocked_until = _SLOT.unpack_from(self._mm, offset)[7]
+        return blocked_until if blocked_until > current_time else None
+
+    def blocked_count(self) -> int:
+        """Number of IPs currently blocked on this host"""
+        current_time = time.time()
+        with self._thread_lock:
+            return sum(1 for slot in _SLOT.iter_unpack(self._mm[_HEADER_SIZE:]) if slot[7] > current_time)
@@ -3,15 +3,32 @@ import pathlib
 import json
 import logging
 import dotenv
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, APIRouter, Depends
-
+from fastapi.concurrency import run_in_threadpool
+
+from app.baselines import BiometricBaselines, set_biometric_baselines
+from app.db import (
+    NutritionRollupStore,
+    SupabaseClientRegistry,
+    TimeSeriesStore,
+    set_nutrition_rollups,
+    set_supabase_registry,
+    set_time_series_store,
+)
 from app.demo_data import is_demo_mode, load_demo_dataset
+from app.idempotency import IdempotencyStore, set_idempotency_store
+from app.ingestion import IngestionQueue, set_ingestion_queue
 from app.middleware import (
     CORSSecurityMiddleware,
     GlobalErrorHandler,
     InputSanitizationMiddleware,
     RateLimitingMiddleware,
     SecurityHeadersMiddleware,
+    SecurityPipelineMiddleware,
+    set_error_handler,
+    set_input_sanitizer,
+    set_rate_limiter,
 )
 
 dotenv.load_dotenv()
@@ -24,6 +41,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 from app.middleware.auth_mw import AuthConfig, get_authorized_user
+from app.middleware.jwks import get_jwks_manager
 
 
 def get_router_config() -> dict:
@@ -110,20 +128,94 @@ def get_firebase_config() -> dict | None:
 
 
 def _configure_middlewares(app: FastAPI) -> None:
-    """Attach shared middleware stack including security, CORS and rate limiting."""
+    """Attach shared middleware stack including security, CORS and rate limiting.
+
+    The stages run inside a single pure-ASGI pipeline, listed outermost first.
+    """
     allowed_origins = os.getenv("ALLOWED_ORIGINS")
     origins = [o.strip() for o in allowed_origins.split(",")] if allowed_origins else None
 
-    app.add_middleware(GlobalErrorHandler)
-    app.add_middleware(InputSanitizationMiddleware)
-    app.add_middleware(CORSSecurityMiddleware, allowed_origins=origins)
-    app.add_middleware(SecurityHeadersMiddleware)
-    app.add_middleware(RateLimitingMiddleware)
+    rate_limiter = RateLimitingMiddleware()
+    input_sanitizer = InputSanitizationMiddleware()
+    error_handler = GlobalErrorHandler()
+    set_rate_limiter(rate_limiter)
+    set_input_sanitizer(input_sanitizer)
+    set_error_handler(error_handler)
+
+    app.add_middleware(
+        SecurityPipelineMiddleware,
+        stages=[
+            rate_limiter,
+            SecurityHeadersMiddleware(),
+            CORSSecurityMiddleware(allowed_origins=origins),
+            input_sanitizer,
+            error_handler,
+        ],
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Set up process-wide clients: auth signing keys are prefetched so the
+    first requests never wait on them, Supabase calls share one connection pool,
+    queued HealthKit syncs are written by one pool of workers and synced
+    quantity samples are kept as local time series with running biometric
+    baselines, next to the daily nutrition totals."""
+    jwks_manager = None
+    if app.state.auth_config is not None:
+        jwks_manager = get_jwks_manager(app.state.auth_config.jwks_url)
+        await run_in_threadpool(jwks_manager.start)
+
+    supabase_registry = SupabaseClientRegistry.from_env()
+    if supabase_registry is None:
+        logger.info("Supabase is not configured; no client pool created")
+    set_supabase_registry(supabase_registry)
+    app.state.supabase = supabase_registry
+
+    ingestion_queue = IngestionQueue.from_env()
+    ingestion_queue.start()
+    set_ingestion_queue(ingestion_queue)
+    app.state.ingestion_queue = ingestion_queue
+
+    time_series_store = TimeSeriesStore.from_env()
+    time_series_store.start()
+    set_time_series_store(time_series_store)
+    app.state.time_series = time_series_store
+    biometric_baselines = BiometricBaselines.from_env()
+    set_biometric_baselines(biometric_baselines)
+    app.state.biometric_baselines = biometric_baselines
+    nutrition_rollups = NutritionRollupStore.from_env()
+    set_nutrition_rollups(nutrition_rollups)
+    app.state.nutrition_rollups = nutrition_rollups
+
+    idempotency_store = IdempotencyStore.from_env()
+    set_idempotency_store(idempotency_store)
+    app.state.idempotency = idempotency_store
+
+    yield
+
+    # Drain queued writes while the Supabase pool is still open
+    await ingestion_queue.stop()
+    set_ingestion_queue(None)
+    # After the queue, whose writes still feed the series
+    await time_series_store.stop()
+    set_time_series_store(None)
+    biometric_baselines.close()
+    set_biometric_baselines(None)
+    if supabase_registry is not None:
+        await supabase_registry.aclose()
+        set_supabase_registry(None)
+    if jwks_manager is not None:
+        jwks_manager.stop()
+    idempotency_store.close()
+    set_idempotency_store(None)
+    nutrition_rollups.close()
+    set_nutrition_rollups(None)
 
 
 def create_app() -> FastAPI:
     """Create the app. This is called by uvicorn with the factory option to construct the app object."""
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
 
     if is_demo_mode():
         load_demo_dataset()
@@ -0,0 +1,66 @@
+-- ==================================================
+-- NGX PULSE - HEALTHKIT SYNC STATE SCHEMA
+-- Marcas de agua (anchors) de sincronización por usuario y tipo de muestra
+-- ==================================================
+
+-- 1. TABLA: health_kit_sync_anchors (Último endDate almacenado por sampleType)
+-- Leída y escrita por /api/v1/healthkit/sync con el token del usuario; el
+-- upsert usa on_conflict=user_id,sample_type, por lo que la restricción
+-- única es obligatoria
+CREATE TABLE health_kit_sync_anchors (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+
+    -- Tipo de muestra HealthKit, p. ej. 'HKQuantityTypeIdentifierStepCount'
+    sample_type VARCHAR(255) NOT NULL,
+
+    -- Último endDate almacenado (ISO 8601 en UTC); solo avanza
+    anchor TIMESTAMP WITH TIME ZONE NOT NULL,
+
+    -- Metadatos
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+
+    CONSTRAINT health_kit_sync_anchors_user_sample_type_key UNIQUE (user_id, sample_type)
+);
+
+-- ==================================================
+-- ÍNDICES
+-- ==================================================
+
+-- La restricción única cubre las consultas por user_id
+
+-- ==================================================
+-- ROW LEVEL SECURITY (RLS)
+-- ==================================================
+
+ALTER TABLE health_kit_sync_anchors ENABLE ROW LEVEL SECURITY;
+
+-- Políticas RLS para health_kit_sync_anchors (el upsert necesita INSERT y UPDATE)
+CREATE POLICY "Users can view their own sync anchors" ON health_kit_sync_anchors
+    FOR SELECT USING (auth.uid() = user_id);
+
+CREATE POLICY "Users can create their own sync anchors" ON health_kit_sync_anchors
+    FOR INSERT WITH CHECK (auth.uid() = user_id);
+
+CREATE POLICY "Users can update their own sync anchors" ON health_kit_sync_anchors
+    FOR UPDATE USING (auth.uid() = user_id) WITH CHECK (auth.uid() = user_id);
+
+CREATE POLICY "Users can delete their own sync anchors" ON health_kit_sync_anchors
+    FOR DELETE USING (auth.uid() = user_id);
+
+-- ==================================================
+-- TRIGGERS
+-- ==================================================
+
+CREATE OR REPLACE FUNCTION update_health_kit_sync_anchors_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER health_kit_sync_anchors_updated_at
+    BEFORE UPDATE ON health_kit_sync_anchors
+    FOR EACH ROW EXECUTE FUNCTION update_health_kit_sync_anchors_updated_at();
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Async data-access benchmark for NGX Pulse
+Runs concurrent chat-style requests (two inserts each) against a simulated
+database and compares the old pattern, the sync client called from an
+``async def`` endpoint, with the async repositories, as latency rises
+
+Usage: python scripts/benchmarks/async_repositories.py --concurrency 100 --latencies 0,5,20,50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.db import ChatMessageRepository, SupabaseClientRegistry  # noqa: E402
+
+
+def _stored(request: httpx.Request) -> httpx.Response:
+    row = json.loads(request.content)
+    return httpx.Response(201, json=[{"id": "1", "created_at": "2025-01-01T00:00:00Z", **row}])
+
+
+def build_registry(latency: float) -> SupabaseClientRegistry:
+    """Registry whose transports answer after ``latency`` seconds"""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        time.sleep(latency)
+        return _stored(request)
+
+    async def async_handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        return _stored(request)
+
+    return SupabaseClientRegistry(
+        "https://bench.supabase.co",
+        "anon-key",
+        transport=httpx.MockTransport(handler),
+        async_transport=httpx.MockTransport(async_handler),
+    )
+
+
+async def blocking_request(registry: SupabaseClientRegistry, user_id: str):
+    """What chat_endpoint used to do: sync execute() inside async def"""
+    client = registry.postgrest()
+    for sender in ("user", "ai"):
+        client.table("chat_messages").insert(
+            {"user_id": user_id, "sender": sender, "text_content": "hola"}
+        ).execute()
+
+
+async def async_request(registry: SupabaseClientRegistry, user_id: str):
+    messages = ChatMessageRepository(registry.async_postgrest())
+    for sender in ("user", "ai"):
+        await messages.add(user_id, sender, "hola")
+
+
+async def measure(request, registry: SupabaseClientRegistry, concurrency: int, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(request(registry, f"user-{i}") for i in range(concurrency)))
+    return concurrency * rounds / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async data access under concurrency")
+    parser.add_argument("--concurrency", type=int, default=100, help="Concurrent requests")
+    parser.add_argument("--rounds", type=int, default=3, help="Batches of concurrent requests")
+    parser.add_argument("--latencies", default="0,5,20,50", help="Simulated DB latencies in ms")
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} concurrent requests x {args.rounds} rounds, 2 inserts per request")
+    print(f"{'latency (ms)':>12} {'sync req/s':>12} {'async req/s':>12} {'speedup':>8}")
+    for latency_ms in (float(value) for value in args.latencies.split(",")):
+        registry = build_registry(latency_ms / 1000)
+        # Blocking calls serialise the whole loop, so one round is enough to show it
+        sync_rps = asyncio.run(measure(blocking_request, registry, args.concurrency, 1))
+        async_rps = asyncio.run(measure(async_request, registry, args.concurrency, args.rounds))
+        print(f"{latency_ms:>12.0f} {sync_rps:>12.0f} {async_rps:>12.0f} {async_rps / sync_rps:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+HealthKit sample validation benchmark for NGX Pulse
+Turns a /sync body into health_kit_* rows the old way, Pydantic models then
+``model_dump`` plus a second dump of ``deviceInfo`` per sample, and with the
+TypedDict schemas that validate straight into rows, and reports time and peak
+memory for each
+
+Usage: python scripts/benchmarks/healthkit_validation.py --sizes 10000,100000,1000000
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from app.apis.health_data import SYNC_REQUEST_FIELDS, HealthKitSyncRequest, _sample_record  # noqa: E402
+
+
+# The models /sync validated into before the TypedDict schemas
+class LegacyDeviceInfo(BaseModel):
+    name: Optional[str] = None
+    manufacturer: Optional[str] = None
+    model: Optional[str] = None
+    hardware_version: Optional[str] = Field(None, alias="hardwareVersion")
+    software_version: Optional[str] = Field(None, alias="softwareVersion")
+    os_version: Optional[str] = Field(None, alias="osVersion")
+
+
+class LegacySample(BaseModel):
+    external_uuid: str = Field(..., alias="externalUuid")
+    sample_type: str = Field(..., alias="sampleType")
+    start_date: str = Field(..., alias="startDate")
+    end_date: str = Field(..., alias="endDate")
+    source_bundle_identifier: Optional[str] = Field(None, alias="sourceBundleIdentifier")
+    device_info: Optional[LegacyDeviceInfo] = Field(None, alias="deviceInfo")
+    metadata: Optional[Dict[str, Any]] = None
+
+
+class LegacyQuantitySample(LegacySample):
+    value: float
+    unit: str
+
+
+class LegacyCategorySample(LegacySample):
+    value: int
+
+
+class LegacyWorkoutEvent(BaseModel):
+    type: int
+    date: str
+    duration: Optional[float] = None
+
+
+class LegacyWorkout(LegacySample):
+    activity_type: str = Field(..., alias="activityType")
+    duration: float
+    total_energy_burned: Optional[float] = Field(None, alias="totalEnergyBurned")
+    total_distance: Optional[float] = Field(None, alias="totalDistance")
+    events: Optional[List[LegacyWorkoutEvent]] = None
+
+
+class LegacySyncRequest(BaseModel):
+    quantity_samples: Optional[List[LegacyQuantitySample]] = Field(None, alias="quantitySamples")
+    category_samples: Optional[List[LegacyCategorySample]] = Field(None, alias="categorySamples")
+    workouts: Optional[List[LegacyWorkout]] = None
+
+
+def legacy_rows(body: bytes, user_id: str) -> List[Dict[str, Any]]:
+    """What sync_health_kit_data used to do"""
+    request = LegacySyncRequest.model_validate(json.loads(body))
+    rows = []
+    for samples in (request.quantity_samples, request.category_samples, request.workouts):
+        for sample in samples or ():
+            record = sample.model_dump(by_alias=True)
+            record['user_id'] = user_id
+            record['device_info'] = sample.device_info.model_dump() if sample.device_info else None
+            rows.append(record)
+    return rows
+
+
+SYNC_REQUEST_ADAPTER = TypeAdapter(HealthKitSyncRequest)
+
+
+def _rows(request: HealthKitSyncRequest, user_id: str) -> List[Dict[str, Any]]:
+    return [_sample_record(sample, user_id) for field in SYNC_REQUEST_FIELDS.values() for sample in request[field] or ()]
+
+
+def typed_dict_rows(body: bytes, user_id: str) -> List[Dict[str, Any]]:
+    """/sync today: FastAPI decodes the JSON and validates it into rows"""
+    return _rows(SYNC_REQUEST_ADAPTER.validate_python(json.loads(body)), user_id)
+
+
+def typed_dict_json_rows(body: bytes, user_id: str) -> List[Dict[str, Any]]:
+    """The same schemas validating the raw bytes, without a decoded copy"""
+    return _rows(SYNC_REQUEST_ADAPTER.validate_json(body), user_id)
+
+
+def build_body(samples: int) -> bytes:
+    """80% quantity, 15% category and 5% workout samples with device info"""
+    device = {"name": "Apple Watch", "manufacturer": "Apple", "model": "Watch", "hardwareVersion": "Watch7,1"}
+    base = {"sampleType": "HKQuantityTypeIdentifierHeartRate", "startDate": "2025-01-01T00:00:00Z",
+            "endDate": "2025-01-01T00:00:05Z", "sourceBundleIdentifier": "com.apple.health", "deviceInfo": device}
+    workouts = samples // 20
+    categories = samples * 3 // 20
+    quantities = samples - workouts - categories
+    return json.dumps({
+        "quantitySamples": [
+            {**base, "externalUuid": f"q{i}", "value": 60 + i % 40, "unit": "count/min", "metadata": {"motion": 1}}
+            for i in range(quantities)
+        ],
+        "categorySamples": [{**base, "externalUuid": f"c{i}", "value": i % 3} for i in range(categories)],
+        "workouts": [
+            {**base, "externalUuid": f"w{i}", "activityType": "running", "duration": 1800,
+             "totalEnergyBurned": 300.5, "events": [{"type": 1, "date": "2025-01-01T00:10:00Z"}]}
+            for i in range(workouts)
+        ],
+    }).encode()
+
+
+def measure(convert, body: bytes):
+    """Seconds for one conversion, then its peak traced memory in MB"""
+    gc.collect()
+    start = time.perf_counter()
+    rows = convert(body, "user-1")
+    elapsed = time.perf_counter() - start
+    del rows
+    gc.collect()
+    tracemalloc.start()
+    rows = convert(body, "user-1")
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del rows
+    return elapsed, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HealthKit sample validation into rows")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Samples per sync body")
+    args = parser.parse_args()
+
+    check = build_body(40)
+    assert typed_dict_rows(check, "user-1") == legacy_rows(check, "user-1"), "rows differ from the legacy path"
+
+    paths = (("models + dump", legacy_rows), ("TypedDict", typed_dict_rows), ("TypedDict json", typed_dict_json_rows))
+    print(f"{'samples':>9} {'path':>15} {'time (s)':>9} {'peak MB':>9} {'speedup':>8}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        body = build_body(size)
+        baseline = None
+        for name, convert in paths:
+            elapsed, peak = measure(convert, body)
+            baseline = baseline or elapsed
+            print(f"{size:>9} {name:>15} {elapsed:>9.3f} {peak:>9.1f} {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
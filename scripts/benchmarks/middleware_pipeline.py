@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Middleware latency benchmark for NGX Pulse
+Compares the legacy stack (one BaseHTTPMiddleware per stage) against the
+fused pure-ASGI pipeline on a cheap endpoint like /routes/auth/status
+
+Usage: python scripts/benchmarks/middleware_pipeline.py --requests 20000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from fastapi import FastAPI  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from app.middleware import (  # noqa: E402
+    CORSSecurityMiddleware,
+    GlobalErrorHandler,
+    InputSanitizationMiddleware,
+    PipelineContext,
+    PipelineStage,
+    RateLimitingMiddleware,
+    SecurityHeadersMiddleware,
+    SecurityPipelineMiddleware,
+)
+
+PATH = "/routes/auth/status"
+
+
+class LegacyStageAdapter(BaseHTTPMiddleware):
+    """Run a pipeline stage the way the old BaseHTTPMiddleware classes did"""
+
+    def __init__(self, app, stage: PipelineStage):
+        super().__init__(app)
+        self.stage = stage
+
+    async def dispatch(self, request, call_next):
+        ctx = PipelineContext(request.scope, request.receive)
+        response = await self.stage.on_request(ctx)
+        if response is not None:
+            return response
+        try:
+            response = await call_next(request)
+        except Exception as exc:
+            response = await self.stage.on_error(ctx, exc)
+            if response is None:
+                raise
+            return response
+        message = {"type": "http.response.start", "status": response.status_code, "headers": response.raw_headers}
+        self.stage.on_response_start(ctx, message)
+        response.raw_headers = message["headers"]
+        return response
+
+
+def make_stages() -> List[PipelineStage]:
+    return [
+        RateLimitingMiddleware(),
+        SecurityHeadersMiddleware(),
+        CORSSecurityMiddleware(),
+        InputSanitizationMiddleware(),
+        GlobalErrorHandler(),
+    ]
+
+
+def make_app(mode: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get(PATH)
+    def auth_status() -> dict:
+        return {"auth_enabled": False, "header": None}
+
+    if mode == "legacy":
+        # add_middleware wraps outside-in, so register the innermost stage first
+        for stage in reversed(make_stages()):
+            app.add_middleware(LegacyStageAdapter, stage=stage)
+    elif mode == "pipeline":
+        app.add_middleware(SecurityPipelineMiddleware, stages=make_stages())
+    return app
+
+
+async def drive(app: FastAPI, requests: int) -> List[int]:
+    """Send ``requests`` GETs straight through the ASGI interface"""
+    latencies: List[int] = []
+    never = asyncio.Event()
+
+    async def send(message):
+        pass
+
+    for i in range(requests):
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Park like a real server until the response completes
+            await never.wait()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": PATH,
+            "raw_path": PATH.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [
+                (b"host", b"localhost:8000"),
+                (b"origin", b"http://localhost:5173"),
+                (b"accept", b"application/json"),
+            ],
+            # Spread requests over many clients so rate limits never trigger
+            "client": (f"10.0.{(i >> 8) & 255}.{i & 255}", 50000),
+            "server": ("localhost", 8000),
+        }
+        start = time.perf_counter_ns()
+        await app(scope, receive, send)
+        latencies.append(time.perf_counter_ns() - start)
+    return latencies
+
+
+def summarize(latencies: List[int]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "p50_us": ordered[len(ordered) // 2] / 1000,
+        "p99_us": ordered[int(len(ordered) * 0.99)] / 1000,
+        "mean_us": statistics.fmean(ordered) / 1000,
+        "req_per_s": 1e9 / statistics.fmean(ordered),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the middleware stack")
+    parser.add_argument("--requests", type=int, default=20000, help="Requests per variant")
+    parser.add_argument("--warmup", type=int, default=500, help="Warm-up requests per variant")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("bare", "legacy", "pipeline"):
+        app = make_app(mode)
+        asyncio.run(drive(app, args.warmup))
+        results[mode] = summarize(asyncio.run(drive(app, args.requests)))
+
+    print(f"{'variant':<10} {'p50 (us)':>10} {'p99 (us)':>10} {'mean (us)':>10} {'req/s':>10}")
+    for mode, stats in results.items():
+        print(
+            f"{mode:<10} {stats['p50_us']:>10.1f} {stats['p99_us']:>10.1f} "
+            f"{stats['mean_us']:>10.1f} {stats['req_per_s']:>10.0f}"
+        )
+    speedup = results["legacy"]["p50_us"] / results["pipeline"]["p50_us"]
+    print(f"\npipeline p50 speedup over legacy stack: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
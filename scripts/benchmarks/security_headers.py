@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Security headers microbenchmark for NGX Pulse
+Measures the per-response cost of decorating an http.response.start message
+with the pre-encoded header block versus the old MutableHeaders rebuild
+
+Usage: python scripts/benchmarks/security_headers.py --iterations 200000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+
+from starlette.datastructures import MutableHeaders  # noqa: E402
+
+from app.middleware import PipelineContext, SecurityHeadersMiddleware  # noqa: E402
+
+APP_HEADERS = [
+    (b"content-length", b"42"),
+    (b"content-type", b"application/json"),
+    (b"server", b"uvicorn"),
+]
+
+
+def legacy_add_security_headers(middleware: SecurityHeadersMiddleware, headers: MutableHeaders, request) -> None:
+    """The per-response header rebuild used before the headers were pre-encoded"""
+    if middleware.csp_policy:
+        headers["Content-Security-Policy"] = middleware.csp_policy
+    if middleware.enable_hsts and request.url.scheme == "https":
+        headers["Strict-Transport-Security"] = (
+            f"max-age={middleware.hsts_max_age}; includeSubDomains; preload"
+        )
+    if middleware.enable_xss_protection:
+        headers["X-XSS-Protection"] = "1; mode=block"
+    if middleware.enable_content_type_options:
+        headers["X-Content-Type-Options"] = "nosniff"
+    if middleware.enable_frame_options:
+        headers["X-Frame-Options"] = "DENY"
+    if middleware.enable_referrer_policy:
+        headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+    headers["X-Permitted-Cross-Domain-Policies"] = middleware.permitted_cross_domain_policies
+    headers["X-Robots-Tag"] = "noindex, nofollow, nosnippet, noarchive"
+    headers["Cache-Control"] = "no-store, no-cache, must-revalidate, private"
+    headers["Pragma"] = "no-cache"
+    headers["Expires"] = "0"
+    if "Server" in headers:
+        del headers["Server"]
+    if "X-Powered-By" in headers:
+        del headers["X-Powered-By"]
+    for header, value in middleware.custom_headers.items():
+        headers[header] = value
+    if request.url.path.startswith(("/api", "/routes")):
+        headers["X-API-Version"] = "1.0"
+        headers["X-Request-ID"] = getattr(request.state, "trace_id", "unknown")
+
+
+def make_context(scheme: str) -> PipelineContext:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "scheme": scheme,
+        "path": "/routes/auth/status",
+        "query_string": b"",
+        "headers": [(b"host", b"api.ngxpulse.com")],
+        "state": {"trace_id": "trace_1700000000_abcd1234"},
+    }
+    return PipelineContext(scope, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark security header injection")
+    parser.add_argument("--iterations", type=int, default=200000, help="Responses per variant")
+    args = parser.parse_args()
+
+    middleware = SecurityHeadersMiddleware()
+
+    print(f"{'variant':<22} {'ns/response':>12}")
+    for scheme in ("http", "https"):
+        ctx = make_context(scheme)
+
+        def legacy():
+            message = {"type": "http.response.start", "status": 200, "headers": list(APP_HEADERS)}
+            # A fresh Request per response, as BaseHTTPMiddleware created one
+            request = PipelineContext(ctx.scope, None).request
+            legacy_add_security_headers(middleware, MutableHeaders(scope=message), request)
+
+        def compiled():
+            message = {"type": "http.response.start", "status": 200, "headers": list(APP_HEADERS)}
+            middleware.on_response_start(ctx, message)
+
+        for name, func in (("legacy", legacy), ("pre-encoded", compiled)):
+            seconds = min(timeit.repeat(func, number=args.iterations, repeat=3))
+            print(f"{name + ' (' + scheme + ')':<22} {seconds / args.iterations * 1e9:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Nutrition rollup rebuild for NGX Pulse
+Recomputes the daily nutrition totals behind /nutrition/summary from the
+nutrition_logs history, a page of rows at a time, into the SQLite file the
+backend reads (NUTRITION_ROLLUPS_PATH)
+
+Usage: python scripts/rebuild-nutrition-rollups.py [--user USER_ID] [--page-size 5000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# Add backend to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+from app.db import NutritionLogRepository, NutritionRollupStore, SupabaseClientRegistry  # noqa: E402
+from app.db.nutrition_rollups import TOTAL_COLUMNS  # noqa: E402
+
+
+async def rebuild(user_id, page_size: int) -> int:
+    url = os.getenv('SUPABASE_URL')
+    service_role_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
+    if not url or not service_role_key:
+        print("❌ Missing Supabase credentials. Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY")
+        sys.exit(1)
+    if not os.getenv('NUTRITION_ROLLUPS_PATH'):
+        print("❌ Missing NUTRITION_ROLLUPS_PATH, the SQLite file the backend reads")
+        sys.exit(1)
+
+    # The service role key reads every user's rows past row level security
+    registry = SupabaseClientRegistry(url, service_role_key)
+    store = NutritionRollupStore.from_env()
+    repository = NutritionLogRepository(registry.async_postgrest())
+    try:
+        pages = repository.pages(
+            columns=",".join(("user_id", "date") + TOTAL_COLUMNS), page_size=page_size, user_id=user_id
+        )
+        return await store.rebuild(pages, user_id=user_id)
+    finally:
+        store.close()
+        await registry.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", help="Rebuild one user's totals only")
+    parser.add_argument("--page-size", type=int, default=5000, help="nutrition_logs rows per request and batch")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    days = asyncio.run(rebuild(args.user, max(1, args.page_size)))
+    print(f"✅ Rebuilt {days} days of nutrition totals in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+from jwt.exceptions import PyJWKClientError
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.middleware.jwks import JWKSKeyManager  # noqa: E402
+
+KEYS = {kid: rsa.generate_private_key(public_exponent=65537, key_size=2048) for kid in ("k1", "k2")}
+
+
+def _jwks(*kids: str) -> dict:
+    keys = []
+    for kid in kids:
+        jwk = RSAAlgorithm.to_jwk(KEYS[kid].public_key(), as_dict=True)
+        keys.append({**jwk, "kid": kid, "alg": "RS256", "use": "sig"})
+    return {"keys": keys}
+
+
+def _write_jwks(path: Path, *kids: str) -> str:
+    path.write_text(json.dumps(_jwks(*kids)))
+    return path.as_uri()
+
+
+def test_prefetched_keys_verify_tokens_from_a_file(tmp_path):
+    manager = JWKSKeyManager(_write_jwks(tmp_path / "jwks.json", "k1"))
+    manager.start()
+    try:
+        token = jwt.encode({"sub": "user-1"}, KEYS["k1"], algorithm="RS256", headers={"kid": "k1"})
+        key = manager.get_signing_key_from_jwt(token)
+        assert jwt.decode(token, key.key, algorithms=["RS256"])["sub"] == "user-1"
+
+        # Unknown kids are refetched at most once per min_refetch_interval
+        with pytest.raises(PyJWKClientError):
+            manager.get_signing_key("k2")
+        assert manager.get_stats()["fetches"] == 1
+    finally:
+        manager.stop()
+
+
+def test_stale_keys_are_served_while_refreshing(tmp_path):
+    path = tmp_path / "jwks.json"
+    manager = JWKSKeyManager(_write_jwks(path, "k1"), default_ttl=600, refresh_ahead=300, min_refetch_interval=0)
+    manager.refresh()
+    _write_jwks(path, "k1", "k2")
+
+    # Inside the refresh-ahead window: the current key comes back immediately
+    manager._expires_at = time.monotonic() + 60
+    assert manager.get_signing_key("k1").key_id == "k1"
+
+    deadline = time.monotonic() + 5
+    while manager._generation < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert manager.get_signing_key("k2").key_id == "k2"
+    assert manager.get_stats()["fetches"] == 2
+
+
+def test_stale_lookups_do_not_refetch_a_failing_endpoint(tmp_path):
+    path = tmp_path / "jwks.json"
+    manager = JWKSKeyManager(_write_jwks(path, "k1"), default_ttl=600, refresh_ahead=300, min_refetch_interval=30)
+    manager.refresh()
+    path.unlink()
+    manager._expires_at = time.monotonic() + 60
+    manager._last_fetch -= 60
+
+    for _ in range(50):
+        assert manager.get_signing_key("k1").key_id == "k1"
+    deadline = time.monotonic() + 5
+    while manager._generation < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for _ in range(50):
+        assert manager.get_signing_key("k1").key_id == "k1"
+
+    assert manager.get_stats()["fetches"] == 2
+    assert manager.get_stats()["fetch_errors"] == 1
+
+
+def test_concurrent_misses_share_one_fetch():
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            time.sleep(0.2)
+            body = json.dumps(_jwks("k1", "k2")).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Cache-Control", "public, max-age=19800")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        manager = JWKSKeyManager(f"http://127.0.0.1:{server.server_port}/jwks")
+        found = []
+        threads = [
+            threading.Thread(target=lambda kid=kid: found.append(manager.get_signing_key(kid).key_id))
+            for kid in ("k1", "k2") * 4
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(found) == ["k1"] * 4 + ["k2"] * 4
+        assert len(requests) == 1
+        assert manager.get_stats()["expires_in"] > 19000
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,86 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import jwt
+import pytest
+from fastapi import HTTPException
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.auth import current_user  # noqa: E402
+from app.auth import supabase as supabase_auth  # noqa: E402
+from app.middleware.auth_mw import User  # noqa: E402
+
+SECRET = "super-secret-jwt-token-with-at-least-32-characters"
+
+
+def _token(sub: str = "user-1", **claims) -> str:
+    payload = {
+        "sub": sub,
+        "aud": "authenticated",
+        "exp": int(time.time()) + 3600,
+        "email": "athlete@example.com",
+        "user_metadata": {"full_name": "Test Athlete"},
+        **claims,
+    }
+    return jwt.encode(payload, SECRET, algorithm="HS256")
+
+
+@pytest.fixture
+def local_mode(monkeypatch):
+    monkeypatch.setenv("STAGING_DEMO_MODE", "false")
+    monkeypatch.setenv("SUPABASE_AUTH_MODE", "local")
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", SECRET)
+    remote_calls = []
+
+    def get_remote_user(token):
+        remote_calls.append(token)
+        return User(sub="user-1", user_id="user-1")
+
+    monkeypatch.setattr(current_user, "_get_remote_user", get_remote_user)
+    supabase_auth.get_supabase_jwt_verifier.cache_clear()
+    yield remote_calls
+    supabase_auth.get_supabase_jwt_verifier.cache_clear()
+
+
+def _authenticate(token: str) -> User:
+    return asyncio.run(current_user.get_current_user_data(None, f"Bearer {token}"))
+
+
+def test_local_mode_verifies_without_calling_supabase(local_mode):
+    token = _token()
+    user = _authenticate(token)
+
+    assert (user.sub, user.email, user.name) == ("user-1", "athlete@example.com", "Test Athlete")
+    assert _authenticate(token) == user
+    assert local_mode == []
+
+    stats = supabase_auth.get_supabase_jwt_verifier().cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_local_mode_rejects_bad_tokens(local_mode):
+    for token in (
+        _token(aud="anon"),
+        _token(exp=int(time.time()) - 10),
+        jwt.encode({"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 60}, "x" * 32),
+    ):
+        with pytest.raises(HTTPException) as exc_info:
+            _authenticate(token)
+        assert exc_info.value.status_code == 401
+
+
+def test_sampled_revalidation_checks_supabase(local_mode, monkeypatch):
+    monkeypatch.setenv("SUPABASE_AUTH_REVALIDATE_RATE", "1")
+    supabase_auth.get_supabase_jwt_verifier.cache_clear()
+
+    assert _authenticate(_token()).sub == "user-1"
+    assert len(local_mode) == 1
+
+    # A token Supabase resolves to someone else is rejected and forgotten
+    with pytest.raises(HTTPException):
+        _authenticate(_token(sub="user-2"))
+    assert supabase_auth.get_supabase_jwt_verifier().cache.get_stats()["size"] == 1
@@ -0,0 +1,74 @@
+import sys
+import time
+from pathlib import Path
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.middleware import auth_mw  # noqa: E402
+from app.middleware.auth_mw import AuthConfig, VerifiedTokenCache  # noqa: E402
+
+CONFIG = AuthConfig(jwks_url="https://example.test/jwks", audience="ngx-pulse", header="authorization")
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def _token(sub: str = "user-1", expires_in: int = 3600) -> str:
+    claims = {"sub": sub, "aud": CONFIG.audience, "exp": int(time.time()) + expires_in}
+    return jwt.encode(claims, PRIVATE_KEY, algorithm="RS256")
+
+
+def _count_key_lookups(monkeypatch) -> list:
+    lookups = []
+
+    def get_signing_key(url, token):
+        lookups.append(url)
+        return PRIVATE_KEY.public_key(), "RS256"
+
+    monkeypatch.setattr(auth_mw, "get_signing_key", get_signing_key)
+    monkeypatch.setattr(auth_mw, "verified_token_cache", VerifiedTokenCache(maxsize=2))
+    return lookups
+
+
+def test_repeat_tokens_skip_verification(monkeypatch):
+    lookups = _count_key_lookups(monkeypatch)
+    token = _token()
+
+    first = auth_mw.authorize_token(token, CONFIG)
+    second = auth_mw.authorize_token(token, CONFIG)
+
+    assert first.sub == second.sub == "user-1"
+    assert len(lookups) == 1
+    stats = auth_mw.verified_token_cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+    # A different audience must not reuse the verified entry
+    other = CONFIG.model_copy(update={"audience": "other"})
+    assert auth_mw.authorize_token(token, other) is None
+    assert len(lookups) == 2
+
+
+def test_entries_expire_before_exp_and_are_bounded(monkeypatch):
+    lookups = _count_key_lookups(monkeypatch)
+
+    # Inside the clock-skew margin the token is verified every time
+    short_lived = _token(expires_in=10)
+    auth_mw.authorize_token(short_lived, CONFIG)
+    auth_mw.authorize_token(short_lived, CONFIG)
+    assert len(lookups) == 2
+
+    tokens = [_token(sub=f"user-{i}") for i in range(3)]
+    for token in tokens:
+        auth_mw.authorize_token(token, CONFIG)
+    assert auth_mw.verified_token_cache.get_stats()["size"] == 2
+
+    # The least recently used token was evicted
+    auth_mw.authorize_token(tokens[0], CONFIG)
+    assert len(lookups) == 6
+
+    now = time.time()
+    monkeypatch.setattr(auth_mw.time, "time", lambda: now + 3600)
+    auth_mw.authorize_token(tokens[2], CONFIG)
+    assert len(lookups) == 7
@@ -0,0 +1,199 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.apis import biometrics  # noqa: E402
+from app.auth import User, get_current_user_data  # noqa: E402
+from app.baselines import BASELINE_METRICS, BiometricBaselines, set_biometric_baselines  # noqa: E402
+from app.db import TimeSeriesStore, resample, set_time_series_store  # noqa: E402
+
+HR = "HKQuantityTypeIdentifierHeartRate"
+HRV = BASELINE_METRICS["hrv"]
+RESTING_HR = BASELINE_METRICS["resting_hr"]
+DAY = 86_400_000
+JAN_1 = 1735689600000  # 2025-01-01T00:00:00Z
+
+
+def _client(store: TimeSeriesStore) -> TestClient:
+    set_time_series_store(store)
+    set_biometric_baselines(BiometricBaselines())
+    app = FastAPI()
+    app.include_router(biometrics.router)
+    app.dependency_overrides[get_current_user_data] = lambda: User(sub="u1")
+    return TestClient(app)
+
+
+def test_resample_matches_per_bucket_numpy():
+    rng = np.random.default_rng(7)
+    timestamps = np.sort(rng.integers(0, 50_000, 4000))
+    values = rng.normal(60, 10, 4000)
+    index = (timestamps - 300) // 1000
+    expected = {
+        "mean": np.mean, "min": np.min, "max": np.max, "sum": np.sum,
+        "p50": lambda bucket: np.percentile(bucket, 50), "p95": lambda bucket: np.percentile(bucket, 95),
+    }
+
+    for aggregation, reduce in expected.items():
+        buckets = resample(timestamps, values, 1000, aggregation, origin=300)
+        assert np.allclose(buckets.values, [reduce(values[index == i]) for i in np.unique(index)])
+        assert buckets.starts.tolist() == (np.unique(index) * 1000 + 300).tolist()
+        assert buckets.counts.sum() == 4000
+
+
+def test_series_endpoint_aggregates_days_in_local_time(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    # 23:00 UTC on Jan 1 is already Jan 2 at UTC+2
+    store.append("u1", HR, [JAN_1 + 3_600_000, JAN_1 + 23 * 3_600_000, JAN_1 + DAY + 3_600_000], [50.0, 70.0, 90.0])
+    store.append("u2", HR, [JAN_1], [200.0])
+    store.flush()
+    client = _client(store)
+    try:
+        utc = client.get("/biometrics/series", params={
+            "sample_type": HR, "start": "2025-01-01T00:00:00Z", "end": "2025-01-03T00:00:00Z", "bucket": "1d",
+        })
+        local = client.get("/biometrics/series", params={
+            "sample_type": HR, "start": "2025-01-01T00:00:00Z", "end": "2025-01-03T00:00:00Z", "bucket": "1d",
+            "aggregation": "max", "utc_offset": 120,
+        })
+    finally:
+        set_time_series_store(None)
+        set_biometric_baselines(None)
+
+    assert utc.status_code == 200
+    assert utc.json()["timestamps"] == [JAN_1, JAN_1 + DAY]
+    assert utc.json()["values"] == [60.0, 90.0]
+    assert utc.json()["counts"] == [2, 1]
+    assert local.json()["timestamps"] == [JAN_1 - 7_200_000, JAN_1 + DAY - 7_200_000]
+    assert local.json()["values"] == [50.0, 90.0]
+
+
+def test_series_endpoint_validates_buckets_and_types(tmp_path):
+    client = _client(TimeSeriesStore(str(tmp_path)))
+    base = {"sample_type": HR, "start": "2025-01-01T00:00:00Z", "end": "2025-03-01T00:00:00Z"}
+    try:
+        bad_bucket = client.get("/biometrics/series", params={**base, "bucket": "1y"})
+        too_many = client.get("/biometrics/series", params={**base, "bucket": "1m"})
+        bad_type = client.get("/biometrics/series", params={**base, "sample_type": "../x"})
+        bad_aggregation = client.get("/biometrics/series", params={**base, "aggregation": "median"})
+        empty = client.get("/biometrics/series", params={**base, "bucket": "1h"})
+    finally:
+        set_time_series_store(None)
+        set_biometric_baselines(None)
+
+    assert bad_bucket.status_code == too_many.status_code == bad_type.status_code == 400
+    assert bad_aggregation.status_code == 422
+    assert empty.status_code == 200 and empty.json()["values"] == []
+
+
+def _days(values, first_day=0):
+    return [JAN_1 + (first_day + day) * DAY for day in range(len(values))], [float(value) for value in values]
+
+
+def test_baselines_match_weighted_history_in_any_arrival_order(tmp_path):
+    set_time_series_store(TimeSeriesStore(str(tmp_path)))
+    rng = np.random.default_rng(3)
+    timestamps, values = _days(rng.normal(50, 5, 40).round(1))
+    path = str(tmp_path / "baselines.sqlite3")
+    try:
+        in_order = BiometricBaselines(path)
+        shuffled = BiometricBaselines()
+        for start in range(0, 40, 8):
+            in_order.record("u1", HRV, timestamps[start:start + 8], values[start:start + 8])
+        for start in (32, 0, 16, 24, 8):
+            shuffled.record("u2", HRV, timestamps[start:start + 8], values[start:start + 8])
+        # Synced again, with one new sample: only that one is folded in
+        shuffled.record("u2", HRV, timestamps[8:16] + [timestamps[-1] + DAY], values[8:16] + [values[-1]])
+        shuffled.record("u2", HRV, [timestamps[-1] + 2 * DAY] * 2, [values[-1]] * 2)
+        first, second = in_order.snapshot("u1").metrics, shuffled.snapshot("u2").metrics
+        # Another worker, or a restart, reads the same sums
+        reopened = BiometricBaselines(path).snapshot("u1").metrics
+    finally:
+        set_time_series_store(None)
+
+    weights = np.exp((np.array(timestamps) - timestamps[-1]) / (28 * DAY))
+    mean = np.average(values, weights=weights)
+    assert first["hrv_28d"] == pytest.approx(mean)
+    assert first["hrv_28d_sd"] == pytest.approx(np.sqrt(np.average((np.array(values) - mean) ** 2, weights=weights)))
+    assert first["hrv_7d"] == pytest.approx(np.average(values, weights=weights ** 4))
+    assert first["hrv"] == values[-1]
+    assert reopened == pytest.approx(first)
+    extended = timestamps + [timestamps[-1] + DAY, timestamps[-1] + 2 * DAY]
+    weights = np.exp((np.array(extended) - extended[-1]) / (28 * DAY))
+    assert second["hrv_28d"] == pytest.approx(np.average(values + [values[-1]] * 2, weights=weights))
+    assert shuffled.get_stats()["samples_folded"] == 42
+    assert shuffled.get_stats()["samples_repeated"] == 9
+
+
+def test_baselines_forget_samples_past_the_retention(tmp_path):
+    set_time_series_store(TimeSeriesStore(str(tmp_path)))
+    baselines = BiometricBaselines(retention_days=30)
+    try:
+        baselines.record("u1", RESTING_HR, *_days([60, 62]))
+        baselines.record("u1", RESTING_HR, *_days([58], first_day=40))
+        # Older than 30 days before the newest: neither folded nor remembered
+        baselines.record("u1", RESTING_HR, *_days([90, 62]))
+        snapshot = baselines.snapshot("u1")
+        remembered = baselines._db.execute("SELECT COUNT(*) FROM biometric_baselines_samples").fetchone()[0]
+    finally:
+        set_time_series_store(None)
+
+    assert snapshot.captured_at == JAN_1 + 40 * DAY
+    assert snapshot.metrics["resting_hr"] == 58.0
+    assert baselines.get_stats()["samples_expired"] == 2
+    assert remembered == 1
+
+
+def test_readiness_follows_hrv_up_and_resting_hr_down(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    set_time_series_store(store)
+    baselines = BiometricBaselines()
+    try:
+        assert baselines.snapshot("u1") is None
+        baselines.record("u1", HRV, *_days([50, 52, 48] * 7))
+        baselines.record("u1", RESTING_HR, *_days([60, 61, 59] * 7))
+        steady = baselines.snapshot("u1").metrics["readiness"]
+        # A good week: HRV up, resting HR down
+        baselines.record("u1", HRV, *_days([62, 64, 63, 65, 61, 64, 63], first_day=21))
+        baselines.record("u1", RESTING_HR, *_days([55, 54, 55, 53, 54, 55, 54], first_day=21))
+        good = baselines.snapshot("u1")
+        # Another user with the opposite week
+        baselines.record("u2", HRV, *_days([50, 52, 48] * 7 + [38, 40, 37, 39, 36, 40, 38]))
+        bad = baselines.snapshot("u2").metrics["readiness"]
+    finally:
+        set_time_series_store(None)
+
+    assert steady == 50.0
+    assert good.metrics["readiness"] > 60 and bad < 40
+    assert good.metrics["hrv_7d"] > good.metrics["hrv_28d"]
+    assert good.metrics["resting_hr_7d"] < good.metrics["resting_hr_28d"]
+    assert good.captured_at == JAN_1 + 27 * DAY
+    assert baselines.get_stats()["users"] == 2
+
+
+def test_summary_and_status_report_the_callers_baselines(tmp_path):
+    client = _client(TimeSeriesStore(str(tmp_path)))
+    try:
+        empty = client.get("/biometrics/summary").json()
+        from app.baselines import get_biometric_baselines
+
+        get_biometric_baselines().record("u1", HRV, *_days([50, 55, 52, 58]))
+        summary = client.get("/biometrics/summary").json()
+        status = client.get("/biometrics/status").json()
+    finally:
+        set_time_series_store(None)
+        set_biometric_baselines(None)
+
+    assert empty == []
+    assert summary[0]["source"] == "healthkit"
+    assert summary[0]["captured_at"].startswith("2025-01-04T00:00:00")
+    assert summary[0]["metrics"]["hrv"] == 58.0
+    assert "readiness" in summary[0]["metrics"]
+    assert "resting_hr" not in summary[0]["metrics"]
+    assert status["sample"]["metrics"] == summary[0]["metrics"]
@@ -0,0 +1,384 @@
+import asyncio
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.apis import health_data  # noqa: E402
+from app.auth import User, get_current_user_data  # noqa: E402
+from app.db import (  # noqa: E402
+    SeenSampleIndex,
+    SupabaseClientRegistry,
+    TimeSeriesStore,
+    get_time_series_store,
+    set_seen_sample_index,
+    set_supabase_registry,
+    set_time_series_store,
+)
+
+STEPS = "HKQuantityTypeIdentifierStepCount"
+
+
+def _sample(uuid: str, end_date: str, sample_type: str = STEPS) -> dict:
+    return {
+        "externalUuid": uuid,
+        "sampleType": sample_type,
+        "startDate": end_date,
+        "endDate": end_date,
+        "value": 1,
+        "unit": "count",
+    }
+
+
+class _FakePostgrest:
+    """Stores anchors and records upserts; rejects samples listed in ``failing``"""
+
+    def __init__(self, anchors=None):
+        self.anchors = dict(anchors or {})
+        self.upserted = []
+        self.rows = []
+        self.saved_anchors = []
+        self.failing = set()
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("health_kit_sync_anchors"):
+            if request.method == "GET":
+                rows = [{"sample_type": key, "anchor": value} for key, value in self.anchors.items()]
+                return httpx.Response(200, json=rows)
+            rows = json.loads(request.content)
+            self.saved_anchors.append({row["sample_type"]: row["anchor"] for row in rows})
+            self.anchors.update(self.saved_anchors[-1])
+            return httpx.Response(201, json=rows)
+        rows = json.loads(request.content)
+        if any(row["externalUuid"] in self.failing for row in rows):
+            return httpx.Response(500, json={"message": "boom", "code": "XX000"})
+        self.upserted.extend(row["externalUuid"] for row in rows)
+        self.rows.extend(rows)
+        return httpx.Response(201, json=rows)
+
+
+def _client(postgrest: _FakePostgrest, monkeypatch) -> TestClient:
+    monkeypatch.delenv("STAGING_DEMO_MODE", raising=False)
+    set_supabase_registry(
+        SupabaseClientRegistry("https://project.supabase.co", "anon-key", async_transport=httpx.MockTransport(postgrest))
+    )
+    set_seen_sample_index(SeenSampleIndex())
+    set_time_series_store(TimeSeriesStore(tempfile.mkdtemp()))
+    app = FastAPI()
+    app.include_router(health_data.router)
+    app.dependency_overrides[get_current_user_data] = lambda: User(sub="u1")
+    return TestClient(app, headers={"Authorization": "Bearer user-token"})
+
+
+def _reset():
+    set_supabase_registry(None)
+    set_seen_sample_index(None)
+    set_time_series_store(None)
+
+
+def test_sync_endpoint_reports_chunk_errors(monkeypatch):
+    monkeypatch.setenv("HEALTHKIT_SYNC_CHUNK_SIZE", "2")
+    postgrest = _FakePostgrest()
+    postgrest.failing.add("w0")
+    client = _client(postgrest, monkeypatch)
+    payload = {
+        "quantitySamples": [_sample(f"q{i}", "2025-01-01T00:01:00Z") for i in range(5)],
+        "categorySamples": [_sample("c0", "2025-01-01T00:01:00Z")],
+        "workouts": [{**_sample("w0", "2025-01-01T00:01:00Z"), "activityType": "running", "duration": 60}],
+    }
+    try:
+        response = client.post("/api/v1/healthkit/sync", json=payload)
+    finally:
+        _reset()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["quantity_samples_imported"] == 5
+    assert body["category_samples_imported"] == 1
+    assert body["workouts_imported"] == 0
+    assert body["message"] == "HealthKit data sync completed with errors."
+    assert [(error["kind"], error["offset"], error["count"]) for error in body["errors"]] == [("workout", 0, 1)]
+    assert sorted(postgrest.upserted) == ["c0", "q0", "q1", "q2", "q3", "q4"]
+
+
+def test_sync_rows_keep_the_table_layout(monkeypatch):
+    postgrest = _FakePostgrest()
+    client = _client(postgrest, monkeypatch)
+    workout = {
+        **_sample("w0", "2025-01-01T00:01:00Z"),
+        "activityType": "running",
+        "duration": "60",
+        "deviceInfo": {"name": "Watch", "hardwareVersion": "Watch7,1"},
+        "events": [{"type": 1, "date": "2025-01-01T00:00:30Z"}],
+        "unknown": "dropped",
+    }
+    del workout["value"], workout["unit"]
+    try:
+        response = client.post("/api/v1/healthkit/sync", json={"workouts": [workout]})
+    finally:
+        _reset()
+
+    assert response.status_code == 200
+    device_info = {"name": "Watch", "manufacturer": None, "model": None}
+    assert postgrest.rows == [{
+        "externalUuid": "w0",
+        "sampleType": STEPS,
+        "startDate": "2025-01-01T00:01:00Z",
+        "endDate": "2025-01-01T00:01:00Z",
+        "sourceBundleIdentifier": None,
+        "deviceInfo": {**device_info, "hardwareVersion": "Watch7,1", "softwareVersion": None, "osVersion": None},
+        "metadata": None,
+        "activityType": "running",
+        "duration": 60.0,
+        "totalEnergyBurned": None,
+        "totalDistance": None,
+        "events": [{"type": 1, "date": "2025-01-01T00:00:30Z", "duration": None}],
+        "user_id": "u1",
+        "device_info": {**device_info, "hardware_version": "Watch7,1", "software_version": None, "os_version": None},
+    }]
+
+
+def test_stored_quantity_samples_feed_the_time_series(monkeypatch):
+    postgrest = _FakePostgrest()
+    postgrest.failing.add("q2")
+    monkeypatch.setenv("HEALTHKIT_SYNC_CHUNK_SIZE", "2")
+    client = _client(postgrest, monkeypatch)
+    samples = [_sample(f"q{i}", f"2025-01-01T00:0{i}:00Z") for i in range(4)]
+    samples[1]["startDate"] = "2025-01-01T01:00:00+01:00"
+    try:
+        client.post("/api/v1/healthkit/sync", json={
+            "quantitySamples": samples,
+            "categorySamples": [_sample("c0", "2025-01-01T00:00:00Z")],
+        })
+        series = get_time_series_store().query("u1", STEPS)
+    finally:
+        _reset()
+
+    # q2 and q3 share the failed chunk; category samples are not series
+    assert series.timestamps.tolist() == [1735689600000, 1735689600000]
+    assert series.values.tolist() == [1.0, 1.0]
+
+
+def test_sync_skips_duplicates_and_advances_anchors(monkeypatch):
+    postgrest = _FakePostgrest(anchors={STEPS: "2025-01-01T00:00:00+00:00"})
+    client = _client(postgrest, monkeypatch)
+    try:
+        first = client.post("/api/v1/healthkit/sync", json={"quantitySamples": [
+            _sample("a", "2025-01-02T08:00:00Z"),
+            _sample("a", "2025-01-02T08:00:00Z"),
+            _sample("b", "2025-01-03T10:00:00+02:00"),
+        ]}).json()
+        second = client.post("/api/v1/healthkit/sync", json={"quantitySamples": [
+            _sample("b", "2025-01-03T10:00:00+02:00"),
+            _sample("c", "2024-12-31T00:00:00Z"),
+        ]}).json()
+        anchors = client.get("/api/v1/healthkit/sync/anchors").json()
+    finally:
+        _reset()
+
+    assert first["quantity_samples_imported"] == 2
+    assert first["duplicates_skipped"] == 1
+    assert first["anchors"] == {STEPS: "2025-01-03T08:00:00+00:00"}
+    assert second["quantity_samples_imported"] == 1
+    assert second["duplicates_skipped"] == 1
+    assert second["anchors"] == {STEPS: "2025-01-03T08:00:00+00:00"}
+    assert postgrest.upserted == ["a", "b", "c"]
+    # An older sample never moves the watermark back, so nothing is saved
+    assert postgrest.saved_anchors == [{STEPS: "2025-01-03T08:00:00+00:00"}]
+    assert anchors == {"anchors": {STEPS: "2025-01-03T08:00:00+00:00"}}
+
+
+def test_failed_chunks_are_retried_and_do_not_advance_anchors(monkeypatch):
+    monkeypatch.setenv("HEALTHKIT_SYNC_CHUNK_SIZE", "1")
+    postgrest = _FakePostgrest()
+    postgrest.failing.add("late")
+    client = _client(postgrest, monkeypatch)
+    payload = {"quantitySamples": [_sample("early", "2025-01-01T00:00:00Z"), _sample("late", "2025-02-01T00:00:00Z")]}
+    try:
+        first = client.post("/api/v1/healthkit/sync", json=payload).json()
+        postgrest.failing.clear()
+        second = client.post("/api/v1/healthkit/sync", json=payload).json()
+    finally:
+        _reset()
+
+    assert first["anchors"] == {STEPS: "2025-01-01T00:00:00+00:00"}
+    assert [error["count"] for error in first["errors"]] == [1]
+    assert second["duplicates_skipped"] == 1
+    assert second["quantity_samples_imported"] == 1
+    assert second["anchors"] == {STEPS: "2025-02-01T00:00:00+00:00"}
+    assert postgrest.upserted == ["early", "late"]
+
+
+def test_stream_sync_skips_seen_samples(monkeypatch):
+    postgrest = _FakePostgrest()
+    client = _client(postgrest, monkeypatch)
+    lines = [{"kind": "quantity", **_sample(uuid, "2025-03-01T00:00:00Z")} for uuid in ("a", "b", "a")]
+    try:
+        client.post("/api/v1/healthkit/sync", json={"quantitySamples": [_sample("b", "2025-01-01T00:00:00Z")]})
+        body = client.post(
+            "/api/v1/healthkit/sync/stream",
+            content="\n".join(json.dumps(line) for line in lines),
+            headers={"Content-Type": "application/x-ndjson"},
+        ).json()
+    finally:
+        _reset()
+
+    assert body["quantity_samples_imported"] == 1
+    assert body["duplicates_skipped"] == 2
+    assert body["anchors"] == {STEPS: "2025-03-01T00:00:00+00:00"}
+    assert postgrest.upserted == ["b", "a"]
+
+
+def test_stream_sync_writes_batches_while_the_upload_arrives(monkeypatch):
+    written = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("health_kit_sync_anchors"):
+            return httpx.Response(200 if request.method == "GET" else 201, json=[])
+        rows = json.loads(request.content)
+        written.append((request.url.path.rsplit("/", 1)[-1], [row["externalUuid"] for row in rows]))
+        return httpx.Response(201, json=rows)
+
+    monkeypatch.setenv("HEALTHKIT_SYNC_CHUNK_SIZE", "2")
+    monkeypatch.delenv("STAGING_DEMO_MODE", raising=False)
+    set_seen_sample_index(SeenSampleIndex())
+    set_supabase_registry(
+        SupabaseClientRegistry("https://project.supabase.co", "anon-key", async_transport=httpx.MockTransport(handler))
+    )
+    sample = {"sampleType": "HKQuantityTypeIdentifierStepCount", "startDate": "2025-01-01T00:00:00Z",
+              "endDate": "2025-01-01T00:01:00Z"}
+    lines = [json.dumps({**sample, "kind": "quantity", "externalUuid": f"q{i}", "value": i, "unit": "count"})
+             for i in range(5)]
+    lines.insert(2, '{"kind": "quantity", "externalUuid": "bad"}')
+    lines.append(json.dumps({**sample, "kind": "workout", "externalUuid": "w0", "activityType": "running",
+                             "duration": 60}))
+    lines.append(json.dumps({**sample, "kind": "heart", "externalUuid": "x"}))
+    body = ("\n".join(lines) + "\n").encode()
+    writes_before_upload_ended = []
+
+    async def upload():
+        # Uneven chunks so lines straddle chunk boundaries
+        for start in range(0, len(body), 37):
+            yield body[start:start + 37]
+            await asyncio.sleep(0.001)
+        writes_before_upload_ended.append(len(written))
+
+    async def post(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post(
+                "/api/v1/healthkit/sync/stream",
+                content=upload(),
+                headers={"Authorization": "Bearer user-token", "Content-Type": "application/x-ndjson"},
+            )
+
+    try:
+        app = FastAPI()
+        app.include_router(health_data.router)
+        app.dependency_overrides[get_current_user_data] = lambda: User(sub="u1")
+        response = asyncio.run(post(app))
+    finally:
+        _reset()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["quantity_samples_imported"] == 5
+    assert body["workouts_imported"] == 1
+    assert body["lines_received"] == 8
+    assert body["invalid_lines"] == 2
+    assert [error["line"] for error in body["line_errors"]] == [3, 8]
+    assert "Unknown kind 'heart'" in body["line_errors"][1]["error"]
+    assert sorted(written) == [
+        ("health_kit_quantity_samples", ["q0", "q1"]),
+        ("health_kit_quantity_samples", ["q2", "q3"]),
+        ("health_kit_quantity_samples", ["q4"]),
+        ("health_kit_workouts", ["w0"]),
+    ]
+    assert writes_before_upload_ended[0] >= 2
+
+
+def test_stream_sync_rejects_overlong_lines(monkeypatch):
+    async def lines():
+        for chunk in (b'{"kind": "quantity"', b" " * 64, b"}\n"):
+            yield chunk
+
+    async def collect(max_line_bytes):
+        return [line async for line in health_data._ndjson_lines(lines(), max_line_bytes)]
+
+    assert asyncio.run(collect(1024)) == [b'{"kind": "quantity"' + b" " * 64 + b"}"]
+    try:
+        asyncio.run(collect(32))
+    except Exception as e:
+        assert getattr(e, "status_code", None) == 413
+    else:
+        raise AssertionError("expected a 413 for an overlong line")
+
+
+def test_stream_sync_counts_every_batch_when_writes_overlap(monkeypatch):
+    monkeypatch.setenv("HEALTHKIT_SYNC_CHUNK_SIZE", "1")
+    monkeypatch.setenv("HEALTHKIT_SYNC_CONCURRENCY", "4")
+    in_flight = []
+    peak = []
+
+    class SlowPostgrest(_FakePostgrest):
+        async def __call__(self, request: httpx.Request) -> httpx.Response:
+            if request.url.path.endswith("health_kit_sync_anchors"):
+                return await super().__call__(request)
+            in_flight.append(request)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(request)
+            return await super().__call__(request)
+
+    postgrest = SlowPostgrest()
+    client = _client(postgrest, monkeypatch)
+    lines = [json.dumps({"kind": "quantity", **_sample(f"q{i}", "2025-01-01T00:00:00Z")}) for i in range(8)]
+    try:
+        body = client.post(
+            "/api/v1/healthkit/sync/stream",
+            content="\n".join(lines),
+            headers={"Content-Type": "application/x-ndjson"},
+        ).json()
+    finally:
+        _reset()
+
+    assert max(peak) > 1
+    assert body["quantity_samples_imported"] == 8
+    assert sorted(postgrest.upserted) == [f"q{i}" for i in range(8)]
+
+
+def test_seen_sample_index_is_bounded():
+    index = SeenSampleIndex(max_users=2, max_per_user=3)
+    digests = [index.digest(f"uuid-{i}") for i in range(4)]
+
+    index.add("u1", digests)
+    index.add("u2", digests[:1])
+    index.add("u1", [])
+    index.add("u3", digests[:1])
+
+    assert not index.contains("u1", digests[0])
+    assert all(index.contains("u1", digest) for digest in digests[1:])
+    assert not index.contains("u2", digests[0])
+    assert index.contains("u3", digests[0])
+    assert index.get_stats()["users"] == 2
+
+
+def test_seen_sample_index_merges_digests_into_sorted_arrays():
+    index = SeenSampleIndex(max_users=1, max_per_user=3000)
+    digests = [index.digest(f"uuid-{i}") for i in range(5000)]
+
+    for start in range(0, 5000, 250):
+        index.add("u1", digests[start:start + 250] + digests[:10])
+
+    stats = index.get_stats()
+    assert stats["samples"] == 3000
+    assert stats["array_bytes"] <= 2 * 8 * 3000
+    # The first ten are re-sent with every batch, so they stay among the newest
+    assert all(index.contains("u1", digest) for digest in digests[:10] + digests[-2980:])
+    assert not any(index.contains("u1", digest) for digest in digests[10:2000])
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.apis import chat, health_data  # noqa: E402
+from app.auth import User, get_current_user_data  # noqa: E402
+from app.db import (  # noqa: E402
+    SeenSampleIndex,
+    SupabaseClientRegistry,
+    TimeSeriesStore,
+    set_seen_sample_index,
+    set_supabase_registry,
+    set_time_series_store,
+)
+from app.idempotency import IdempotencyKeyReused, IdempotencyStore, set_idempotency_store  # noqa: E402
+
+
+def test_store_runs_concurrent_duplicates_once_and_replays():
+    store = IdempotencyStore()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return JSONResponse({"n": len(calls)}, status_code=201)
+
+    async def main():
+        first = await asyncio.gather(*(store.run("k", "fp", call) for _ in range(3)))
+        later = await store.run("k", "fp", call)
+        return first, later
+
+    first, (later, replayed) = asyncio.run(main())
+
+    assert len(calls) == 1
+    assert [was_replayed for _, was_replayed in first].count(False) == 1
+    assert {(response.status_code, bytes(response.body)) for response, _ in first} == {(201, b'{"n":1}')}
+    assert replayed and later.body == b'{"n":1}'
+    assert store.get_stats()["waited"] == 2
+
+
+def test_store_rejects_key_reused_for_another_request_and_reruns_failures():
+    store = IdempotencyStore()
+    statuses = [500, 200]
+
+    async def call():
+        return JSONResponse({}, status_code=statuses.pop(0))
+
+    async def main():
+        failed, _ = await store.run("k", "fp", call)
+        succeeded, replayed = await store.run("k", "fp", call)
+        with pytest.raises(IdempotencyKeyReused):
+            await store.run("k", "other", call)
+        return failed, succeeded, replayed
+
+    failed, succeeded, replayed = asyncio.run(main())
+
+    assert (failed.status_code, succeeded.status_code, replayed) == (500, 200, False)
+
+
+def test_store_bounds_keys_and_persists_to_sqlite(tmp_path):
+    path = str(tmp_path / "idempotency.sqlite3")
+
+    async def call():
+        return JSONResponse({"ok": True}, headers={"Location": "/jobs/1"})
+
+    async def fill(store):
+        for key in ("a", "b", "c"):
+            await store.run(key, "fp", call)
+
+    store = IdempotencyStore(max_keys=2, path=path)
+    asyncio.run(fill(store))
+    assert store.get_stats()["keys"] == 2
+    store.close()
+
+    reopened = IdempotencyStore(max_keys=2, path=path)
+    response, replayed = asyncio.run(reopened.run("c", "fp", call))
+    _, evicted_replayed = asyncio.run(reopened.run("a", "fp", call))
+    reopened.close()
+
+    assert replayed and response.headers["location"] == "/jobs/1"
+    assert not evicted_replayed
+
+
+def test_chat_retry_with_same_key_replays_without_new_messages(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    inserted = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        row = json.loads(request.content)
+        inserted.append(row)
+        return httpx.Response(201, json=[{"id": f"m{len(inserted)}", "created_at": "2025-01-01T00:00:00Z", **row}])
+
+    set_supabase_registry(
+        SupabaseClientRegistry("https://project.supabase.co", "anon-key", async_transport=httpx.MockTransport(handler))
+    )
+    set_idempotency_store(IdempotencyStore())
+    try:
+        app = FastAPI()
+        app.include_router(chat.router)
+        client = TestClient(app)
+        payload = {"user_id": "u1", "message": "hola"}
+        first = client.post("/chat/", json=payload, headers={"Idempotency-Key": "retry-1"})
+        retry = client.post("/chat/", json=payload, headers={"Idempotency-Key": "retry-1"})
+        reused = client.post("/chat/", json={**payload, "message": "adiós"}, headers={"Idempotency-Key": "retry-1"})
+        other_user = client.post("/chat/", json={**payload, "user_id": "u2"}, headers={"Idempotency-Key": "retry-1"})
+    finally:
+        set_supabase_registry(None)
+        set_idempotency_store(None)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert reused.status_code == 422
+    assert other_user.status_code == 200
+    assert len(inserted) == 4
+
+
+def test_concurrent_sync_retries_write_once(monkeypatch):
+    monkeypatch.delenv("STAGING_DEMO_MODE", raising=False)
+    upserts = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("health_kit_sync_anchors"):
+            return httpx.Response(200 if request.method == "GET" else 201, json=[])
+        rows = json.loads(request.content)
+        upserts.append(rows)
+        await asyncio.sleep(0.02)
+        return httpx.Response(201, json=rows)
+
+    set_supabase_registry(
+        SupabaseClientRegistry("https://project.supabase.co", "anon-key", async_transport=httpx.MockTransport(handler))
+    )
+    set_seen_sample_index(SeenSampleIndex())
+    set_time_series_store(TimeSeriesStore(tempfile.mkdtemp()))
+    set_idempotency_store(IdempotencyStore())
+    app = FastAPI()
+    app.include_router(health_data.router)
+    app.dependency_overrides[get_current_user_data] = lambda: User(sub="u1")
+    payload = {
+        "quantitySamples": [
+            {"externalUuid": f"q{i}", "sampleType": "HKQuantityTypeIdentifierStepCount",
+             "startDate": "2025-01-01T00:00:00Z", "endDate": "2025-01-01T00:00:00Z", "value": 1, "unit": "count"}
+            for i in range(3)
+        ]
+    }
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        headers = {"Authorization": "Bearer user-token", "Idempotency-Key": "sync-1"}
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", headers=headers) as client:
+            return await asyncio.gather(*(client.post("/api/v1/healthkit/sync", json=payload) for _ in range(3)))
+
+    try:
+        responses = asyncio.run(main())
+    finally:
+        set_supabase_registry(None)
+        set_seen_sample_index(None)
+        set_time_series_store(None)
+        set_idempotency_store(None)
+
+    assert len(upserts) == 1
+    assert all(response.status_code == 200 for response in responses)
+    assert all(response.json() == responses[0].json() for response in responses)
+    assert responses[0].json()["quantity_samples_imported"] == 3
+    assert sum(response.headers.get("Idempotent-Replayed") == "true" for response in responses) == 2
+
+
+def test_sync_retry_after_failed_chunks_runs_again(monkeypatch):
+    monkeypatch.delenv("STAGING_DEMO_MODE", raising=False)
+    attempts = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("health_kit_sync_anchors"):
+            return httpx.Response(200 if request.method == "GET" else 201, json=[])
+        rows = json.loads(request.content)
+        attempts.append(rows)
+        if len(attempts) == 1:
+            return httpx.Response(500, json={"message": "boom", "code": "XX000"})
+        return httpx.Response(201, json=rows)
+
+    set_supabase_registry(
+        SupabaseClientRegistry("https://project.supabase.co", "anon-key", async_transport=httpx.MockTransport(handler))
+    )
+    set_seen_sample_index(SeenSampleIndex())
+    set_time_series_store(TimeSeriesStore(tempfile.mkdtemp()))
+    set_idempotency_store(IdempotencyStore())
+    app = FastAPI()
+    app.include_router(health_data.router)
+    app.dependency_overrides[get_current_user_data] = lambda: User(sub="u1")
+    payload = {
+        "quantitySamples": [
+            {"externalUuid": "q0", "sampleType": "HKQuantityTypeIdentifierStepCount",
+             "startDate": "2025-01-01T00:00:00Z", "endDate": "2025-01-01T00:00:00Z", "value": 1, "unit": "count"}
+        ]
+    }
+    headers = {"Authorization": "Bearer user-token", "Idempotency-Key": "sync-1"}
+    try:
+        client = TestClient(app)
+        failed = client.post("/api/v1/healthkit/sync", json=payload, headers=headers)
+        retried = client.post("/api/v1/healthkit/sync", json=payload, headers=headers)
+        replayed = client.post("/api/v1/healthkit/sync", json=payload, headers=headers)
+    finally:
+        set_supabase_registry(None)
+        set_seen_sample_index(None)
+        set_time_series_store(None)
+        set_idempotency_store(None)
+
+    assert failed.status_code == 200 and failed.json()["errors"]
+    assert "Idempotent-Replayed" not in retried.headers
+    assert retried.json()["errors"] == [] and retried.json()["quantity_samples_imported"] == 1
+    assert replayed.headers["Idempotent-Replayed"] == "true"
+    assert len(attempts) == 2
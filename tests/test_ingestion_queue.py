@@ -0,0 +1,195 @@
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.apis import health_data  # noqa: E402
+from app.auth import User, get_current_user_data  # noqa: E402
+from app.db import (  # noqa: E402
+    SeenSampleIndex,
+    SupabaseClientRegistry,
+    TimeSeriesStore,
+    set_seen_sample_index,
+    set_supabase_registry,
+    set_time_series_store,
+)
+from app.ingestion import (  # noqa: E402
+    IngestionJob,
+    IngestionJobTooLarge,
+    IngestionQueue,
+    IngestionQueueFull,
+    set_ingestion_queue,
+)
+
+STEPS = "HKQuantityTypeIdentifierStepCount"
+
+
+def _sample(uuid: str, end_date: str = "2025-01-01T00:00:00Z") -> dict:
+    return {"externalUuid": uuid, "sampleType": STEPS, "startDate": end_date, "endDate": end_date,
+            "value": 1, "unit": "count"}
+
+
+def _app(monkeypatch, handler, queue: IngestionQueue, user: str = "u1") -> FastAPI:
+    monkeypatch.delenv("STAGING_DEMO_MODE", raising=False)
+    set_supabase_registry(
+        SupabaseClientRegistry("https://project.supabase.co", "anon-key", async_transport=httpx.MockTransport(handler))
+    )
+    set_seen_sample_index(SeenSampleIndex())
+    set_time_series_store(TimeSeriesStore(tempfile.mkdtemp()))
+    set_ingestion_queue(queue)
+    app = FastAPI()
+    app.include_router(health_data.router)
+    app.dependency_overrides[get_current_user_data] = lambda: User(sub=user)
+    return app
+
+
+def _reset():
+    set_supabase_registry(None)
+    set_seen_sample_index(None)
+    set_time_series_store(None)
+    set_ingestion_queue(None)
+
+
+def test_async_sync_returns_202_and_reports_job_progress(monkeypatch):
+    monkeypatch.setenv("HEALTHKIT_SYNC_CHUNK_SIZE", "2")
+    written = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("health_kit_sync_anchors"):
+            return httpx.Response(200 if request.method == "GET" else 201, json=[])
+        rows = json.loads(request.content)
+        await asyncio.sleep(0.01)
+        if rows[0]["externalUuid"] == "w0":
+            return httpx.Response(500, json={"message": "boom", "code": "XX000"})
+        written.extend(row["externalUuid"] for row in rows)
+        return httpx.Response(201, json=rows)
+
+    app = _app(monkeypatch, handler, IngestionQueue(workers=2))
+    payload = {
+        "quantitySamples": [_sample(f"q{i}") for i in range(5)] + [_sample("q0")],
+        "workouts": [{**_sample("w0", "2025-02-01T00:00:00Z"), "activityType": "running", "duration": 60}],
+    }
+    try:
+        with TestClient(app, headers={"Authorization": "Bearer user-token"}) as client:
+            accepted = client.post("/api/v1/healthkit/sync", params={"mode": "async"}, json=payload)
+            status_url = accepted.json()["status_url"]
+            for _ in range(200):
+                job = client.get(status_url).json()
+                if job["status"].startswith("completed"):
+                    break
+                time.sleep(0.01)
+            other_user = client.get(status_url.replace(accepted.json()["job_id"], "missing"))
+    finally:
+        _reset()
+
+    assert accepted.status_code == 202
+    assert accepted.headers["Location"] == status_url
+    assert accepted.json()["duplicates_skipped"] == 1
+    assert status_url == f"/api/v1/healthkit/sync/jobs/{accepted.json()['job_id']}"
+    assert job["status"] == "completed_with_errors"
+    assert job["progress"] == 1.0
+    assert job["chunks_total"] == 4
+    assert job["tables"]["quantity"] == {"received": 5, "imported": 5}
+    assert job["tables"]["workout"] == {"received": 1, "imported": 0}
+    assert [(error["kind"], error["count"]) for error in job["errors"]] == [("workout", 1)]
+    assert job["anchors"] == {STEPS: "2025-01-01T00:00:00+00:00"}
+    assert sorted(written) == ["q0", "q1", "q2", "q3", "q4"]
+    assert other_user.status_code == 404
+
+
+def test_full_queue_rejects_with_configured_status(monkeypatch):
+    monkeypatch.setenv("HEALTHKIT_SYNC_MODE", "async")
+    monkeypatch.setenv("HEALTHKIT_SYNC_CHUNK_SIZE", "1")
+    monkeypatch.setenv("HEALTHKIT_QUEUE_FULL_STATUS", "429")
+    release = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("health_kit_sync_anchors"):
+            return httpx.Response(200 if request.method == "GET" else 201, json=[])
+        # Hold the sample writes so the queue stays full
+        await release.wait()
+        return httpx.Response(201, json=[])
+
+    app = _app(monkeypatch, handler, IngestionQueue(workers=1, max_queued_chunks=2))
+    try:
+        with TestClient(app) as client:
+            first = client.post("/api/v1/healthkit/sync", json={"quantitySamples": [_sample("a"), _sample("b")]})
+            second = client.post("/api/v1/healthkit/sync", json={"quantitySamples": [_sample("c"), _sample("d")]})
+            forced_sync_mode = client.post(
+                "/api/v1/healthkit/sync", params={"mode": "sync"}, json={"quantitySamples": []}
+            )
+            client.portal.call(release.set)
+    finally:
+        _reset()
+
+    assert first.status_code == 202
+    assert second.status_code == 429
+    assert second.headers["Retry-After"] == "5"
+    assert forced_sync_mode.status_code == 200
+
+
+def test_sync_larger_than_the_queue_is_rejected_without_retry(monkeypatch):
+    monkeypatch.setenv("HEALTHKIT_SYNC_MODE", "async")
+    monkeypatch.setenv("HEALTHKIT_SYNC_CHUNK_SIZE", "1")
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200 if request.method == "GET" else 201, json=[])
+
+    queue = IngestionQueue(workers=1, max_queued_chunks=2)
+    app = _app(monkeypatch, handler, queue)
+    try:
+        with TestClient(app) as client:
+            response = client.post(
+                "/api/v1/healthkit/sync", json={"quantitySamples": [_sample(uuid) for uuid in "abc"]}
+            )
+    finally:
+        _reset()
+
+    assert response.status_code == 413
+    assert "Retry-After" not in response.headers
+    assert "at most 2" in response.json()["detail"]
+    assert queue.get_stats()["jobs_rejected"] == 1
+    with pytest.raises(IngestionJobTooLarge):
+        queue.submit(IngestionJob("u1", {}), [("quantity", 0, 1, None)] * 3)
+
+
+def test_queue_rejects_whole_jobs_and_drains_on_stop():
+    async def scenario():
+        queue = IngestionQueue(workers=1, max_queued_chunks=3)
+        written = []
+
+        async def write(value):
+            await asyncio.sleep(0)
+            written.append(value)
+            return 1
+
+        job = queue.submit(IngestionJob("u1", {"quantity": 3}), [
+            ("quantity", offset, 1, lambda offset=offset: write(offset)) for offset in range(3)
+        ])
+        try:
+            queue.submit(IngestionJob("u1", {"quantity": 1}), [("quantity", 0, 1, lambda: write(99))])
+        except IngestionQueueFull:
+            rejected = True
+        else:
+            rejected = False
+        await queue.stop()
+        return queue, job, written, rejected
+
+    queue, job, written, rejected = asyncio.run(scenario())
+
+    assert rejected
+    assert written == [0, 1, 2]
+    assert job.status == "completed"
+    assert job.imported == {"quantity": 3}
+    assert queue.get_stats()["jobs_rejected"] == 1
+    assert queue.get_stats()["workers"] == 0
@@ -0,0 +1,337 @@
+import gzip
+import os
+import re
+import sys
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.middleware.error_handler import GlobalErrorHandler  # noqa: E402
+from app.middleware.pipeline import PipelineContext, SecurityPipelineMiddleware  # noqa: E402
+from app.middleware.rate_limiter import RateLimitingMiddleware  # noqa: E402
+from app.middleware import security_headers  # noqa: E402
+from app.middleware.body_decoding import zstd  # noqa: E402
+from app.middleware.security_headers import (  # noqa: E402
+    CORSSecurityMiddleware,
+    InputSanitizationMiddleware,
+    OriginMatcher,
+    SecurityHeadersMiddleware,
+)
+
+ORIGIN = "http://localhost:5173"
+
+
+def _build_app(sanitizer: InputSanitizationMiddleware | None = None) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/routes/ping")
+    def ping() -> dict:
+        return {"ok": True}
+
+    @app.get("/routes/boom")
+    def boom() -> dict:
+        raise RuntimeError("boom")
+
+    app.add_middleware(
+        SecurityPipelineMiddleware,
+        stages=[
+            RateLimitingMiddleware(),
+            SecurityHeadersMiddleware(),
+            CORSSecurityMiddleware(),
+            sanitizer or InputSanitizationMiddleware(),
+            GlobalErrorHandler(),
+        ],
+    )
+    return app
+
+
+def test_pipeline_applies_every_stage():
+    client = TestClient(_build_app())
+    response = client.get("/routes/ping", headers={"Origin": ORIGIN, "X-Trace-ID": "trace-1"})
+
+    assert response.status_code == 200
+    assert response.headers["X-Trace-ID"] == "trace-1"
+    assert response.headers["X-Request-ID"] == "trace-1"
+    assert response.headers["X-Frame-Options"] == "DENY"
+    assert response.headers["Access-Control-Allow-Origin"] == ORIGIN
+    assert "X-RateLimit-Remaining" in response.headers
+
+
+def test_preflight_short_circuits_inner_stages():
+    client = TestClient(_build_app())
+    response = client.options(
+        "/routes/ping",
+        headers={"Origin": ORIGIN, "Access-Control-Request-Method": "GET"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["Access-Control-Allow-Methods"].startswith("GET")
+    # Outer stages still decorate the preflight response, inner ones never ran
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    assert "X-Trace-ID" not in response.headers
+
+
+def test_unexpected_errors_become_json_responses():
+    client = TestClient(_build_app(), raise_server_exceptions=False)
+    response = client.get("/routes/boom", headers={"Origin": ORIGIN})
+
+    assert response.status_code == 500
+    assert response.json()["error"]["code"] == "INTERNAL_SERVER_ERROR"
+    assert response.headers["Access-Control-Allow-Origin"] == ORIGIN
+
+
+def test_stage_can_run_standalone():
+    app = FastAPI()
+
+    @app.get("/routes/ping")
+    def ping() -> dict:
+        return {"ok": True}
+
+    app.add_middleware(SecurityHeadersMiddleware)
+    response = TestClient(app).get("/routes/ping")
+
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+
+def test_security_headers_replace_app_values():
+    middleware = SecurityHeadersMiddleware(custom_headers={"Cache-Control": "max-age=60"})
+    message = {
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"server", b"uvicorn"), (b"cache-control", b"public"), (b"content-type", b"text/plain")],
+    }
+    scope = {"type": "http", "scheme": "https", "path": "/routes/ping", "headers": [], "state": {"trace_id": "t-1"}}
+    middleware.on_response_start(PipelineContext(scope, None), message)
+    headers = dict(message["headers"])
+
+    assert b"server" not in headers
+    assert [name for name, _ in message["headers"]].count(b"cache-control") == 1
+    assert headers[b"cache-control"] == b"max-age=60"
+    assert headers[b"content-type"] == b"text/plain"
+    assert headers[b"strict-transport-security"].startswith(b"max-age=31536000")
+    assert headers[b"x-request-id"] == b"t-1"
+
+
+def test_origin_matcher_supports_exact_and_prefix_entries():
+    matcher = OriginMatcher(["https://app.ngxpulse.com", "https://preview-*"])
+
+    assert matcher.matches("https://app.ngxpulse.com")
+    assert matcher.matches("https://preview-123.vercel.app")
+    assert not matcher.matches("https://preview")
+    assert not matcher.matches("https://evil.example")
+    assert not matcher.matches(None)
+
+
+def test_preflight_responses_are_cached_per_origin_method_and_headers():
+    cors = CORSSecurityMiddleware(preflight_cache_size=2)
+
+    def preflight(origin, requested_headers="Content-Type, Authorization"):
+        scope = {
+            "type": "http",
+            "method": "OPTIONS",
+            "path": "/routes/ping",
+            "headers": [
+                (b"origin", origin.encode()),
+                (b"access-control-request-method", b"POST"),
+                (b"access-control-request-headers", requested_headers.encode()),
+            ],
+        }
+        ctx = PipelineContext(scope, None)
+        return cors._handle_preflight(ctx.request, origin)
+
+    first = preflight(ORIGIN)
+    assert preflight(ORIGIN, "content-type,authorization") is first
+    headers = dict(first.raw_headers)
+    assert headers[b"access-control-allow-headers"] == b"content-type, authorization"
+
+    denied = dict(preflight("https://evil.example").raw_headers)
+    assert b"access-control-allow-origin" not in denied
+
+    preflight("http://localhost:3000")
+    assert len(cors._preflight_cache) == 2
+
+
+def test_suspicious_patterns_are_counted_once_per_request():
+    middleware = InputSanitizationMiddleware()
+
+    assert middleware._find_suspicious_patterns("/routes/auth/status", b"") == []
+    assert middleware._find_suspicious_patterns("/routes/nutrition/summary", b"day=2024-01-01") == []
+
+    client = TestClient(_build_app(middleware))
+    client.get("/routes/ping", params={"q": "<script>eval(1)</script>", "r": "<script>"})
+
+    stats = middleware.get_stats()
+    assert stats["suspicious_requests"] == 1
+    assert stats["pattern_matches"]["script_tag"] == 1
+    assert stats["pattern_matches"]["eval_call"] == 1
+    assert stats["pattern_matches"]["union_select"] == 0
+
+
+def test_system_stats_export_sanitizer_and_rate_limiter_counts():
+    from app.apis import system
+
+    middleware = InputSanitizationMiddleware()
+    security_headers.set_input_sanitizer(middleware)
+    try:
+        TestClient(_build_app(middleware)).get("/routes/ping", params={"q": "<script>"})
+        app = FastAPI()
+        app.include_router(system.router)
+        stats = TestClient(app).get("/system/stats").json()
+    finally:
+        security_headers.set_input_sanitizer(None)
+
+    assert stats["input_sanitizer"]["pattern_matches"]["script_tag"] == 1
+    assert "rate_limiter" in stats
+
+
+def test_clean_query_strings_skip_the_pattern_regex():
+    middleware = InputSanitizationMiddleware()
+
+    class NoRegex:
+        def finditer(self, text):
+            raise AssertionError(f"regex ran for {text!r}")
+
+    middleware._suspicious_regex = NoRegex()
+    assert middleware._find_suspicious_patterns("/routes/nutrition/summary", b"day=1") == []
+    assert middleware._find_suspicious_patterns("/routes/auth/session", b"x=1&redirect=/home") == []
+    assert middleware._find_suspicious_patterns("/routes/ping", b"option=") == []
+
+
+def test_event_handler_prefilter_passes_whenever_the_regex_matches():
+    middleware = InputSanitizationMiddleware()
+    samples = ["onload=", "x onerror = 1", "a=1&onclick=2", "once=1", "on=1", "button =", "icon_x=", "ON1=", "=&x ?on /&"]
+
+    for text in samples:
+        matches = re.search(r"on\w+\s*=", text.lower()) is not None
+        assert security_headers._has_event_handler_assignment(text.lower()) == matches, text
+    assert middleware._find_suspicious_patterns("/routes/ping", b"q=%3Cimg+onerror%3Dx%3E") == ["event_handler"]
+
+
+def test_chunked_bodies_are_cut_off_at_the_route_limit():
+    sanitizer = InputSanitizationMiddleware(body_size_limits={"/routes/upload": 1024})
+    app = _build_app(sanitizer)
+    received = []
+
+    @app.post("/routes/upload")
+    async def upload(request: Request) -> dict:
+        async for chunk in request.stream():
+            received.append(len(chunk))
+        return {"bytes": sum(received)}
+
+    def chunks(count):
+        for _ in range(count):
+            yield b"x" * 512
+
+    client = TestClient(app)
+    assert client.post("/routes/upload", content=chunks(2)).json() == {"bytes": 1024}
+
+    received.clear()
+    response = client.post("/routes/upload", content=chunks(100))
+    assert response.status_code == 413
+    assert response.json()["error"]["code"] == "PAYLOAD_TOO_LARGE"
+    assert sum(received) <= 1024
+    assert sanitizer.get_stats()["oversized_bodies"] == 1
+
+
+def test_declared_length_uses_the_route_limit():
+    sanitizer = InputSanitizationMiddleware(body_size_limits={"/routes/upload": 16})
+    app = _build_app(sanitizer)
+
+    @app.post("/routes/upload")
+    async def upload(request: Request) -> dict:
+        return {"bytes": len(await request.body())}
+
+    response = TestClient(app).post("/routes/upload", content=b"x" * 17)
+    assert response.status_code == 413
+    assert response.json()["error"]["limit"] == 16
+
+
+def _decoding_app(sanitizer):
+    app = _build_app(sanitizer)
+    received = []
+
+    @app.post("/routes/upload")
+    async def upload(request: Request) -> dict:
+        body = b""
+        async for chunk in request.stream():
+            received.append(len(chunk))
+            body += chunk
+        return {"bytes": len(body), "lines": body.count(b"\n"), "encoding": request.headers.get("content-encoding")}
+
+    return app, received
+
+
+def test_gzip_and_zstd_bodies_are_decoded_as_they_stream():
+    sanitizer = InputSanitizationMiddleware(decoded_body_paths=("/routes/upload",))
+    app, received = _decoding_app(sanitizer)
+    body = b'{"sampleType": "HKQuantityTypeIdentifierHeartRate", "unit": "count/min"}\n' * 10_000
+    client = TestClient(app)
+
+    # Two concatenated gzip members
+    half = len(body) // 2
+    gzipped = gzip.compress(body[:half]) + gzip.compress(body[half:])
+    response = client.post("/routes/upload", content=gzipped, headers={"Content-Encoding": "gzip"})
+    assert response.json() == {"bytes": len(body), "lines": 10_000, "encoding": None}
+    assert max(received) <= 64 * 1024
+
+    # Two zstd frames
+    received.clear()
+    response = client.post(
+        "/routes/upload", content=zstd.compress(body[:half]) + zstd.compress(body[half:]),
+        headers={"Content-Encoding": "zstd"},
+    )
+    assert response.json() == {"bytes": len(body), "lines": 10_000, "encoding": None}
+    assert max(received) <= 64 * 1024
+    assert sanitizer.get_stats()["decoded_bodies"] == 2
+
+    truncated = client.post(
+        "/routes/upload", content=zstd.compress(body)[:-10], headers={"Content-Encoding": "zstd"}
+    )
+    assert truncated.status_code == 400
+
+
+def test_decoded_size_limit_and_ratio_stop_decompression_bombs():
+    sanitizer = InputSanitizationMiddleware(
+        body_size_limits={"/routes/upload": 4 * 1024 * 1024},
+        decoded_body_paths=("/routes/upload",),
+        decompression_ratio_floor=64 * 1024,
+    )
+    app, received = _decoding_app(sanitizer)
+    client = TestClient(app)
+    bomb = zstd.compress(b"\0" * (512 * 1024 * 1024), level=19)
+
+    response = client.post("/routes/upload", content=bomb, headers={"Content-Encoding": "zstd"})
+    assert response.status_code == 413
+    assert response.json()["error"]["code"] == "DECOMPRESSION_RATIO_EXCEEDED"
+    assert sum(received) < 16 * 1024 * 1024
+
+    # Compressible within the ratio but over the decoded limit
+    received.clear()
+    body = os.urandom(3 * 1024 * 1024).hex().encode()
+    response = client.post("/routes/upload", content=gzip.compress(body), headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 413
+    assert response.json()["error"]["code"] == "PAYLOAD_TOO_LARGE"
+    assert sum(received) <= 4 * 1024 * 1024
+
+
+def test_unsupported_and_invalid_encodings_are_rejected():
+    sanitizer = InputSanitizationMiddleware(decoded_body_paths=("/routes/upload",))
+    app, _ = _decoding_app(sanitizer)
+    client = TestClient(app)
+
+    response = client.post("/routes/upload", content=b"x", headers={"Content-Encoding": "br"})
+    assert response.status_code == 415
+    assert "gzip" in response.json()["error"]["supported"]
+
+    response = client.post("/routes/upload", content=b"not gzip", headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 400
+    assert response.json()["error"]["code"] == "INVALID_CONTENT_ENCODING"
+
+    response = client.post(
+        "/routes/upload", content=gzip.compress(b"x" * 1000)[:-12], headers={"Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 400
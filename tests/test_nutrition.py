@@ -0,0 +1,231 @@
+import asyncio
+import json
+import random
+import sqlite3
+import sys
+import tempfile
+from collections import defaultdict
+from datetime import date
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.apis import nutrition  # noqa: E402
+from app.auth import User, get_current_user_data  # noqa: E402
+from app.db import (  # noqa: E402
+    NutritionLogRepository,
+    NutritionRollupStore,
+    SupabaseClientRegistry,
+    daily_totals,
+    set_nutrition_rollups,
+    set_supabase_registry,
+)
+from app.idempotency import IdempotencyStore, set_idempotency_store  # noqa: E402
+
+
+def _history(count: int, seed: int = 5) -> list:
+    rng = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "user_id": rng.choice(["u1", "u2", "u3"]),
+            "date": f"2025-01-{rng.randint(1, 28):02d}",
+            "total_calories": rng.randint(200, 900),
+            "total_protein": rng.randint(5, 40) + 0.5,
+            "total_carbs": rng.randint(10, 90),
+            "total_fat": rng.choice([None, rng.randint(2, 35)]),
+        }
+        for i in range(count)
+    ]
+
+
+def _registry(history: list, inserted: list) -> SupabaseClientRegistry:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            row = json.loads(request.content)
+            inserted.append(row)
+            return httpx.Response(201, json=[{"id": len(inserted), **row}])
+        params = request.url.params
+        rows = [row for row in history + inserted if params.get("user_id") in (None, f"eq.{row['user_id']}")]
+        offset = int(params.get("offset", 0))
+        return httpx.Response(200, json=rows[offset:offset + int(params["limit"])])
+
+    return SupabaseClientRegistry("https://project.supabase.co", "anon-key", async_transport=httpx.MockTransport(handler))
+
+
+def _expected(rows: list) -> dict:
+    totals = defaultdict(lambda: [0, 0.0, 0.0, 0.0, 0])
+    for row in rows:
+        day = totals[row["user_id"], row["date"]]
+        day[0] += row["total_calories"]
+        day[1] += row["total_protein"]
+        day[2] += row["total_carbs"]
+        day[3] += row["total_fat"] or 0
+        day[4] += 1
+    return {key: tuple(value) for key, value in totals.items()}
+
+
+def test_daily_totals_sums_each_user_day_once():
+    rows = _history(2000)
+
+    totals = daily_totals(rows)
+
+    assert {(user_id, day): tuple(rest) for user_id, day, *rest in totals} == pytest.approx(_expected(rows))
+    assert len(totals) == len(_expected(rows))
+    assert daily_totals([{**rows[0], "date": rows[0]["date"] + "T08:00:00+00:00"}])[0][1] == rows[0]["date"]
+    assert daily_totals([]) == []
+
+
+def test_rebuild_pages_history_and_replaces_drifted_totals(tmp_path):
+    history = _history(2500)
+    registry = _registry(history, [])
+    store = NutritionRollupStore(str(tmp_path / "rollups.sqlite3"))
+    store.add("u1", date(2025, 1, 1), 99_999, 0, 0, 0)  # Drifted
+    store.add("u9", date(2025, 1, 1), 500, 10, 20, 5)  # Not in the history
+
+    repository = NutritionLogRepository(registry.async_postgrest())
+    days = asyncio.run(store.rebuild(repository.pages(page_size=300)))
+    full = {("u1", t.day.isoformat()): t for t in store.range("u1", date(2025, 1, 1), date(2025, 1, 31))}
+    store.add("u2", date(2025, 1, 3), 1, 0, 0, 0)
+    asyncio.run(store.rebuild(repository.pages(page_size=300, user_id="u2"), user_id="u2"))
+
+    expected = _expected(history)
+    assert days == len(expected)
+    assert {key: tuple(t[1:]) for key, t in full.items()} == pytest.approx(
+        {key: value for key, value in expected.items() if key[0] == "u1"}
+    )
+    assert store.range("u9", date(2025, 1, 1), date(2025, 1, 1)) == []
+    u2 = store.range("u2", date(2025, 1, 1), date(2025, 1, 31))
+    assert [tuple(t[1:]) for t in u2] == pytest.approx(
+        [value for key, value in sorted(expected.items()) if key[0] == "u2"]
+    )
+    assert store.get_stats()["rebuilds"] == 2
+    # A second store on the same file (another worker) sees the totals
+    assert len(NutritionRollupStore(store.path).range("u1", date(2025, 1, 1), date(2025, 1, 31))) == len(full)
+
+
+def _meal_client(history: list, inserted: list, store: NutritionRollupStore) -> TestClient:
+    set_supabase_registry(_registry(history, inserted))
+    set_nutrition_rollups(store)
+    set_idempotency_store(IdempotencyStore())
+    app = FastAPI()
+    app.include_router(nutrition.router)
+    app.dependency_overrides[get_current_user_data] = lambda: User(sub="u1")
+    return TestClient(app)
+
+
+def test_meal_writes_update_the_day_and_retries_count_once():
+    inserted = []
+    client = _meal_client([], inserted, NutritionRollupStore())
+    breakfast = {"day": "2025-01-02", "type": "breakfast", "name": "Oatmeal", "calories": 350,
+                 "protein": 12, "carbs": 65, "fat": 8, "time": "07:30"}
+    try:
+        first = client.post("/nutrition/meals", json=breakfast, headers={"Idempotency-Key": "meal-1"})
+        retry = client.post("/nutrition/meals", json=breakfast, headers={"Idempotency-Key": "meal-1"})
+        dinner = client.post("/nutrition/meals", json={**breakfast, "type": "dinner", "name": "Salmon",
+                                                       "calories": 580, "protein": 40, "carbs": 25, "fat": 35})
+        client.post("/nutrition/meals", json={**breakfast, "day": "2024-12-20"})
+        invalid = client.post("/nutrition/meals", json={**breakfast, "calories": -1})
+        summary = client.get("/nutrition/summary", params={"days": 3, "end": "2025-01-03"})
+    finally:
+        set_supabase_registry(None)
+        set_nutrition_rollups(None)
+        set_idempotency_store(None)
+
+    assert first.json()["total_calories"] == retry.json()["total_calories"] == 350
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert dinner.json()["total_calories"] == 930
+    assert invalid.status_code == 422
+    assert len(inserted) == 3
+    assert inserted[0]["meals"] == [{"type": "breakfast", "name": "Oatmeal", "calories": 350, "time": "07:30"}]
+    assert inserted[0]["total_protein"] == 12
+    assert summary.json() == [{
+        "day": "2025-01-02", "total_calories": 930, "total_protein": 52.0, "total_carbs": 90.0,
+        "total_fat": 43.0, "source": "rollup",
+    }]
+
+
+def test_rebuild_leaves_users_with_entries_added_alongside_not_current(tmp_path):
+    store = NutritionRollupStore(str(tmp_path / "rollups.sqlite3"))
+    rows = [row for row in _history(200) if row["user_id"] == "u1"]
+
+    async def pages(add_during: bool):
+        yield rows[:50]
+        if add_during:
+            store.add("u1", date(2025, 1, 1), 100, 1, 1, 1)
+        yield rows[50:]
+
+    assert not store.is_current("u1")
+    asyncio.run(store.rebuild(pages(add_during=True), user_id="u1"))
+    raced = store.is_current("u1")
+    asyncio.run(store.rebuild(pages(add_during=False), user_id="u1"))
+    rebuilt = store.is_current("u1")
+    store.add("u1", date(2025, 1, 2), 100, 1, 1, 1)
+    store.invalidate("u1")
+
+    assert (raced, rebuilt) == (False, True)
+    assert not store.is_current("u1")
+    assert not store.is_current("u2")
+    asyncio.run(store.rebuild(pages(add_during=False)))
+    assert store.is_current("u1") and not store.is_current("u2")
+
+
+def test_rollups_path_must_outlive_the_process(monkeypatch):
+    monkeypatch.delenv("NUTRITION_ROLLUPS_PATH", raising=False)
+    assert NutritionRollupStore.from_env().path is None
+    monkeypatch.setenv("NUTRITION_ROLLUPS_PATH", str(Path(tempfile.gettempdir()) / "ngx-pulse-nutrition.sqlite3"))
+    with pytest.raises(ValueError):
+        NutritionRollupStore.from_env()
+
+
+def test_summary_rebuilds_users_missing_from_the_rollups_once():
+    history = _history(600)
+    store = NutritionRollupStore()
+    client = _meal_client(history, [], store)
+    try:
+        first = client.get("/nutrition/summary", params={"days": 31, "end": "2025-01-31"})
+        second = client.get("/nutrition/summary", params={"days": 31, "end": "2025-01-31"})
+    finally:
+        set_supabase_registry(None)
+        set_nutrition_rollups(None)
+        set_idempotency_store(None)
+
+    expected = [value for key, value in sorted(_expected(history).items()) if key[0] == "u1"]
+    assert [
+        (day["total_calories"], day["total_protein"], day["total_carbs"], day["total_fat"]) for day in first.json()
+    ] == pytest.approx([value[:4] for value in expected])
+    assert second.json() == first.json()
+    assert store.get_stats()["rebuilds"] == 1
+
+
+def test_meal_whose_rollup_fails_is_recounted_from_the_logs(monkeypatch):
+    inserted = []
+    store = NutritionRollupStore()
+    client = _meal_client([], inserted, store)
+    meal = {"day": "2025-01-02", "type": "lunch", "name": "Rice", "calories": 400, "protein": 10, "carbs": 80}
+    try:
+        client.post("/nutrition/meals", json=meal)
+
+        def add(*args):
+            raise sqlite3.OperationalError("database is locked")
+
+        monkeypatch.setattr(store, "add", add)
+        failed = client.post("/nutrition/meals", json={**meal, "calories": 200})
+        monkeypatch.undo()
+        summary = client.get("/nutrition/summary", params={"days": 1, "end": "2025-01-02"})
+    finally:
+        set_supabase_registry(None)
+        set_nutrition_rollups(None)
+        set_idempotency_store(None)
+
+    assert len(inserted) == 2
+    assert failed.status_code == 200
+    assert failed.json()["total_calories"] == summary.json()[0]["total_calories"] == 600
+    assert store.get_stats()["invalidations"] == 1
+    assert store.get_stats()["rebuilds"] == 2
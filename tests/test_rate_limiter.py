@@ -0,0 +1,171 @@
+import asyncio
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.middleware import rate_limiter  # noqa: E402
+from app.middleware.pipeline import PipelineContext  # noqa: E402
+from app.middleware.rate_limiter import (  # noqa: E402
+    RateLimitingMiddleware,
+    RateLimitRule,
+    RateLimitStore,
+    RuleIndex,
+    SharedMemoryRateLimitStore,
+    SlidingWindowRateLimitStore,
+    create_rate_limit_store,
+)
+
+
+def test_exact_store_cleanup_respects_each_key_window():
+    store = RateLimitStore()
+    store.add_request("ip:1:api_global", 1000.0, 3600)
+    store.add_request("ip:1:burst_protection", 1000.0, 60)
+
+    # A cleanup triggered by the 60s rule must not drop the hourly history
+    store._last_cleanup = 0
+    assert store.get_request_count("ip:1:burst_protection", 60, 1200.0) == 0
+    assert store.get_request_count("ip:1:api_global", 3600, 1200.0) == 1
+    assert len(store) == 1
+
+
+def test_sliding_window_weights_the_previous_window():
+    store = SlidingWindowRateLimitStore()
+    for second in range(10):
+        store.add_request("key", 60.0 + second, 60)
+
+    assert store.get_request_count("key", 60, 70.0) == 10
+    # A quarter into the next window, 75% of the previous count still applies
+    assert store.get_request_count("key", 60, 135.0) == 7
+    # Two windows later nothing overlaps any more
+    assert store.get_request_count("key", 60, 250.0) == 0
+
+
+def test_sliding_window_memory_is_constant_per_key():
+    store = SlidingWindowRateLimitStore()
+    for i in range(1000):
+        store.add_request("key", 100.0 + i * 0.01, 3600)
+
+    assert len(store) == 1
+    assert store._store["key"][2] == 1000
+
+
+def test_create_rate_limit_store(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_STORE", "sliding_window")
+    assert isinstance(create_rate_limit_store(), SlidingWindowRateLimitStore)
+    assert isinstance(create_rate_limit_store("exact"), RateLimitStore)
+    with pytest.raises(ValueError):
+        create_rate_limit_store("redis")
+
+
+def _auth_request(ip: str = "10.0.0.1"):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/routes/auth/status",
+        "headers": [],
+        "client": (ip, 50000),
+    }
+    return PipelineContext(scope, None)
+
+
+def test_gcra_rule_allows_burst_then_sustained_rate(monkeypatch):
+    limiter = RateLimitingMiddleware(store=RateLimitStore())
+    limiter.rules = [
+        RateLimitRule(name="auth", limit=10, window_seconds=300, paths=["/routes/auth"], burst_limit=3, algorithm="gcra")
+    ]
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "time", lambda: clock[0])
+
+    remaining = []
+    for _ in range(3):
+        ctx = _auth_request()
+        assert asyncio.run(limiter.on_request(ctx)) is None
+        remaining.append(ctx.data["rate_limit_decision"].remaining)
+    assert remaining == [2, 1, 0]
+
+    rejected = asyncio.run(limiter.on_request(_auth_request()))
+    assert rejected.status_code == 429
+    assert rejected.headers["Retry-After"] == "30"
+    assert rejected.headers["X-RateLimit-Limit"] == "3"
+
+    # One request is earned back every window / limit seconds
+    clock[0] += 30
+    ctx = _auth_request()
+    assert asyncio.run(limiter.on_request(ctx)) is None
+
+    message = {"type": "http.response.start", "status": 200, "headers": []}
+    limiter.on_response_start(ctx, message)
+    headers = dict(message["headers"])
+    assert headers[b"x-ratelimit-remaining"] == b"0"
+    assert headers[b"x-ratelimit-reset"] == str(int(clock[0] + 90)).encode()
+
+
+def test_rule_index_matches_method_and_path_prefixes():
+    rules = RateLimitingMiddleware().rules
+    index = RuleIndex(rules, cache_size=8)
+
+    for method in ("GET", "POST", "OPTIONS"):
+        for path in ("/routes/auth/status", "/routes/api/v1/healthkit/sync", "/api/chat", "/docs", "/", "/routes"):
+            expected = [
+                rule.name for rule in rules
+                if method in rule.methods and (not rule.paths or any(path.startswith(p) for p in rule.paths))
+            ]
+            assert [rule.name for rule in index.match(method, path)] == expected
+
+    assert len(index._cache) == 8
+
+
+def _hammer_shared_store(path, barrier, results, attempts):
+    limiter = RateLimitingMiddleware(store=SharedMemoryRateLimitStore(path, slots=1024))
+    limiter.rules = [RateLimitRule(name="login", limit=25, window_seconds=3600, paths=["/routes/auth"])]
+
+    async def run():
+        return sum([await limiter.on_request(_auth_request()) is None for _ in range(attempts)])
+
+    barrier.wait()
+    results.put(asyncio.run(run()))
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_shared_memory_store_enforces_limits_across_workers(tmp_path):
+    context = multiprocessing.get_context("fork")
+    path = str(tmp_path / "rate-limits")
+    barrier = context.Barrier(4)
+    results = context.Queue()
+    workers = [
+        context.Process(target=_hammer_shared_store, args=(path, barrier, results, 20))
+        for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    allowed = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join(timeout=30)
+
+    # 80 attempts across 4 workers, but only the configured 25 get through
+    assert sum(allowed) == 25
+
+
+def test_shared_memory_store_shares_blocks_and_gcra_state(tmp_path):
+    path = str(tmp_path / "rate-limits")
+    first = SharedMemoryRateLimitStore(path, slots=64)
+    second = SharedMemoryRateLimitStore(path, slots=64)
+
+    first.block("10.0.0.9", 2000.0)
+    assert second.get_blocked_until("10.0.0.9", 1000.0) == 2000.0
+    assert second.get_blocked_until("10.0.0.9", 2000.0) is None
+    first.block("10.0.0.10", time.time() + 60)
+    assert second.blocked_count() == 1
+
+    second.set_tat("ip:10.0.0.9:auth", 1234.5)
+    assert first.get_tat("ip:10.0.0.9:auth", 1000.0) == 1234.5
+    assert first.get_tat("ip:10.0.0.10:auth", 1000.0) == 1000.0
+
+    with pytest.raises(ValueError):
+        SharedMemoryRateLimitStore(path, slots=128)
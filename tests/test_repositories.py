@@ -0,0 +1,89 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.apis import chat  # noqa: E402
+from app.db import HealthKitRepository, SupabaseClientRegistry, set_supabase_registry  # noqa: E402
+
+
+def _registry(requests: list) -> SupabaseClientRegistry:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        await asyncio.sleep(0)
+        rows = json.loads(request.content) if request.content else []
+        rows = rows if isinstance(rows, list) else [rows]
+        stored = [{"id": f"row-{i}", "created_at": "2025-01-01T00:00:00Z", **row} for i, row in enumerate(rows)]
+        return httpx.Response(201, json=stored)
+
+    return SupabaseClientRegistry("https://project.supabase.co", "anon-key", async_transport=httpx.MockTransport(handler))
+
+
+def test_chat_endpoint_stores_both_messages_through_the_async_pool(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    requests = []
+    registry = _registry(requests)
+    set_supabase_registry(registry)
+    try:
+        app = FastAPI()
+        app.include_router(chat.router)
+        response = TestClient(app).post("/chat/", json={"user_id": "u1", "message": "hola"})
+    finally:
+        set_supabase_registry(None)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["user_message"]["text_content"] == "hola"
+    assert body["ai_message"]["sender"] == "ai"
+    assert [request.url.path for request in requests] == ["/rest/v1/chat_messages"] * 2
+    assert registry.get_stats()["async"]["requests"] == 2
+
+
+def test_health_kit_repository_upserts_by_external_uuid():
+    requests = []
+    repository = HealthKitRepository(_registry(requests).async_postgrest("user-token"))
+
+    written = asyncio.run(repository.upsert("workout", [{"external_uuid": "a"}, {"external_uuid": "b"}]))
+
+    assert written == 2
+    assert asyncio.run(repository.upsert("quantity", [])) == 0
+    assert len(requests) == 1
+    assert requests[0].url.path == "/rest/v1/health_kit_workouts"
+    assert requests[0].url.params["on_conflict"] == "external_uuid"
+    assert requests[0].headers["authorization"] == "Bearer user-token"
+
+
+def test_health_kit_chunked_upsert_bounds_concurrency_and_reports_failed_chunks():
+    in_flight = []
+    peak = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        in_flight.append(request)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.remove(request)
+        rows = json.loads(request.content)
+        if rows[0]["external_uuid"] == "s4":
+            return httpx.Response(500, json={"message": "statement timeout", "code": "57014"})
+        return httpx.Response(201, json=rows)
+
+    registry = SupabaseClientRegistry(
+        "https://project.supabase.co", "anon-key", async_transport=httpx.MockTransport(handler)
+    )
+    repository = HealthKitRepository(registry.async_postgrest("user-token"))
+    records = [{"external_uuid": f"s{i}"} for i in range(10)]
+
+    result = asyncio.run(repository.upsert_chunked("quantity", records, chunk_size=2, semaphore=asyncio.Semaphore(2)))
+
+    assert result.written == 8
+    assert [(failure.offset, failure.count) for failure in result.failures] == [(4, 2)]
+    assert "statement timeout" in result.failures[0].error
+    assert max(peak) == 2
+    assert registry.get_stats()["async"]["requests"] == 5
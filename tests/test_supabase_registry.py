@@ -0,0 +1,79 @@
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.db import SupabaseClientRegistry  # noqa: E402
+
+
+@pytest.fixture
+def rest_server():
+    seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            seen.append((self.path, self.headers["Authorization"], self.client_address[1]))
+            body = json.dumps([{"id": "m1"}]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_views_share_pooled_connections(rest_server):
+    url, seen = rest_server
+    registry = SupabaseClientRegistry(url, "anon-key", max_connections=4, http2=False)
+    try:
+        anon = registry.postgrest()
+        user = registry.postgrest("user-token")
+        assert anon.table("ai_coach_messages").select("*").execute().data == [{"id": "m1"}]
+        user.table("ai_coach_messages").select("*").eq("user_id", "u1").execute()
+
+        assert seen[0][1] == "Bearer anon-key"
+        assert seen[1][1] == "Bearer user-token"
+        assert seen[1][0].startswith("/rest/v1/ai_coach_messages")
+        # Both views went over the same keep-alive connection
+        assert seen[0][2] == seen[1][2]
+
+        stats = registry.get_stats()
+        assert stats["max_connections"] == 4
+        pool = stats["sync"]
+        assert (pool["requests"], pool["errors"], pool["in_flight"]) == (2, 0, 0)
+        assert (pool["connections"], pool["idle_connections"]) == (1, 1)
+    finally:
+        registry.close()
+
+
+def test_from_env_reads_pool_settings(monkeypatch):
+    monkeypatch.delenv("SUPABASE_URL", raising=False)
+    assert SupabaseClientRegistry.from_env() is None
+
+    monkeypatch.setenv("SUPABASE_URL", "https://project.supabase.co")
+    monkeypatch.setenv("SUPABASE_ANON_KEY", "anon-key")
+    monkeypatch.setenv("SUPABASE_POOL_MAX_CONNECTIONS", "8")
+    monkeypatch.setenv("SUPABASE_HTTP2", "false")
+    registry = SupabaseClientRegistry.from_env()
+    try:
+        assert registry.limits.max_connections == 8
+        assert registry.http2 is False
+        assert registry.client().options.httpx_client is registry.http_client
+    finally:
+        registry.close()
@@ -0,0 +1,102 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# Ensure backend modules are importable
+sys.path.append(str(Path(__file__).resolve().parents[1] / "backend"))
+
+from app.db import TimeSeriesStore  # noqa: E402
+
+HR = "HKQuantityTypeIdentifierHeartRate"
+
+
+def test_query_sees_tail_and_segments_in_time_order(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    store.append("u1", HR, [30, 10], [3.0, 1.0])
+    store.flush()
+    store.append("u1", HR, [20, 40], [2.0, 4.0])
+    store.append("u2", HR, [15], [9.0])
+
+    series = store.query("u1", HR)
+    window = store.query("u1", HR, start=10, end=30)
+
+    assert series.timestamps.tolist() == [10, 20, 30, 40]
+    assert series.values.tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert window.timestamps.tolist() == [10, 20]
+    assert len(store.query("u2", HR)) == 1
+    assert len(store.query("u3", HR)) == 0
+
+
+def test_flushed_ranges_are_slices_of_the_mapped_segment(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    timestamps = np.arange(0, 1000, 10)
+    store.append("u1", HR, timestamps.tolist(), (timestamps / 10).tolist())
+    store.flush()
+
+    window = store.query("u1", HR, start=100, end=200)
+
+    assert isinstance(window.timestamps, np.memmap)
+    assert window.timestamps.dtype == np.int64 and window.values.dtype == np.float64
+    assert window.values.tolist() == [float(value) for value in range(10, 20)]
+    # A second store on the same path (another worker) reads the same files
+    assert len(TimeSeriesStore(str(tmp_path)).query("u1", HR)) == 100
+
+
+def test_full_tail_flushes_and_segments_are_compacted(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), max_tail=2, compact_segments=3)
+    for timestamp in (5, 1, 3, 1, 4, 2):
+        # Each pair fills the tail; (1, 1.0) is sent twice
+        store.append("u1", HR, [timestamp], [float(timestamp)])
+
+    series = store.query("u1", HR)
+
+    assert store.get_stats()["compactions"] == 1
+    assert len(series.chunks) == 1
+    assert series.timestamps.tolist() == [1, 2, 3, 4, 5]
+    assert len(list(next(tmp_path.iterdir()).joinpath(HR).glob("*.ts.npy"))) == 1
+
+
+def test_rejects_sample_types_that_are_not_identifiers(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    with pytest.raises(ValueError):
+        store.append("u1", "../escape", [1], [1.0])
+    with pytest.raises(ValueError):
+        store.query("u1", "../escape")
+
+
+def test_appends_leave_full_tails_to_the_flusher_thread(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), max_tail=2, flush_interval=60)
+    writers = []
+    write_segment = store._write_segment
+
+    def record_writer(*args):
+        writers.append(threading.get_ident())
+        write_segment(*args)
+
+    store._write_segment = record_writer
+
+    async def scenario():
+        store.start()
+        store.append("u1", HR, [2, 1], [2.0, 1.0])
+        written_inline = list(writers)
+        # Visible while it waits for the flusher
+        queued = store.query("u1", HR).timestamps.tolist()
+        for _ in range(200):
+            if writers:
+                break
+            await asyncio.sleep(0.01)
+        store.append("u1", HR, [3], [3.0])
+        await store.stop()
+        return written_inline, queued
+
+    written_inline, queued = asyncio.run(scenario())
+
+    assert written_inline == []
+    assert queued == [1, 2]
+    assert writers and threading.get_ident() not in writers
+    assert store.query("u1", HR).timestamps.tolist() == [1, 2, 3]
+    assert store.get_stats()["segments_written"] == 2